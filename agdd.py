@@ -0,0 +1,180 @@
+"""
+One command line for the generation scripts, e.g.
+
+    python agdd.py dual --step 30 --workers 0
+    python agdd.py composite --fusion-mode diff --tile-size 640 --full
+    python agdd.py labels-only --name ag_dual_obb
+    python agdd.py convert-json json/ --obb labels_obb/ --rect labels_rect/
+    python agdd.py validate data
+
+The settings are the ones of the __main__ blocks of generate_dual_dataset.py and generate_composite_dataset.py.
+Every command imports the modules it needs when it runs, so validate and labels-only never load OpenCV.
+"""
+import os
+import sys
+import argparse
+
+from utils.instrument import set_verbosity, tracing, profile
+from utils.utility import SettingsError
+
+
+def box_filter_of(args):
+    from utils.geometry import make_box_filter
+    return make_box_filter(args.min_box_area, args.min_box_visibility, args.box_iou_threshold)
+
+
+def encoder_of(args):
+    from utils.encoding import ImageEncoder
+    return ImageEncoder(args.format, args.png_compression, args.png_strategy)
+
+
+def pipeline_of(args):
+    if args.io_threads is None:
+        return None
+    from utils.pipeline import Pipeline
+    return Pipeline(args.io_threads, args.io_depth, args.io_memory_mb)
+
+
+def budget_of(args):
+    if args.min_variants is None:
+        return None
+    from utils.budget import VariantBudget
+    return VariantBudget(args.min_variants, args.seed)
+
+
+def fusion_mode_of(text):
+    """"avg" or a B,G,R list of utils.fusion.CHANNEL_SOURCES such as "avg,backward,forward"."""
+    return tuple(text.split(",")) if "," in text else text
+
+
+def exit_status(errors):
+    """1 when some files failed, or when the generator found no data folder (errors None), 0 otherwise."""
+    return 1 if errors is None or errors else 0
+
+
+def run_dual(args):
+    from generate_dual_dataset import generate_dual
+    errors = generate_dual(args.data, args.output_dir, args.name or f"ag_dual_{args.type}", args.type, args.step,
+                           args.workers, not args.full, args.use_temp, encoder_of(args), args.packed_shard,
+                           box_filter_of(args), args.tile_size, args.tile_overlap, args.empty_tile_ratio, args.seed,
+                           args.memory_mb, not args.folder_passes, pipeline_of(args), budget_of(args))
+    return exit_status(errors)
+
+
+def run_composite(args):
+    from generate_composite_dataset import generate_composite
+    errors = generate_composite(args.data, args.output_dir, args.name or f"ag_composite_{args.type}", args.type,
+                                args.step, args.workers, not args.full, args.use_temp, encoder_of(args),
+                                fusion_mode_of(args.fusion_mode), box_filter_of(args), args.tile_size,
+                                args.tile_overlap, args.empty_tile_ratio, args.seed, args.memory_mb,
+                                pipeline_of(args), budget_of(args))
+    return exit_status(errors)
+
+
+def run_labels_only(args):
+    from utils.labels import creat_labels_x
+    errors = creat_labels_x(args.step, args.data, args.output_dir, args.name or f"ag_dual_{args.type}", args.type,
+                            args.workers, "labels" if args.type == "obb" else "labels_rect", box_filter_of(args),
+                            budget_of(args))
+    return exit_status(errors)
+
+
+def run_convert_json(args):
+    from utils.labelme import convert_json_folder
+    errors = convert_json_folder(args.src, args.obb, args.rect, args.json, args.workers, args.force,
+                                 compact=args.compact)
+    return exit_status(errors)
+
+
+def run_validate(args):
+    from validate_dataset import validate_dataset
+    return validate_dataset(args.dataset, args.workers, args.index)
+
+
+def build_parser():
+    from utils.encoding import PNG_STRATEGIES
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--workers", type=int, default=0, help="worker processes, 0 for one per cpu core")
+    common.add_argument("--verbosity", type=int, default=1,
+                        help="0 errors only, 1 progress and summaries, 2 every file")
+    common.add_argument("--trace", help="write a JSON-lines trace of the tasks and stage times to this file")
+    common.add_argument("--profile", help="run under cProfile and save the stats to this file")
+
+    labels = argparse.ArgumentParser(add_help=False)
+    labels.add_argument("--data", default=os.path.join(os.getcwd(), "data"), help="source dataset, data/ by default")
+    labels.add_argument("--output-dir", default=os.getcwd())
+    labels.add_argument("--name", help="name of the generated dataset, ag_<command>_<type> by default")
+    labels.add_argument("--type", choices=["obb", "rect"], default="obb")
+    labels.add_argument("--step", type=int, default=90, help="rotation step, 90 for x8, 30 for x24, 15 for x48")
+    labels.add_argument("--min-box-area", type=float, help="drop OBB boxes whose visible part is under this fraction")
+    labels.add_argument("--min-box-visibility", type=float, help="drop OBB boxes less than this fraction inside")
+    labels.add_argument("--box-iou-threshold", type=float, help="drop OBB boxes of a file and class with this IoU")
+    labels.add_argument("--min-variants", type=int,
+                        help="class-aware budget, all variants for the rarest class and this many for common ones "
+                             "(not with --tile-size or --packed-shard)")
+    labels.add_argument("--seed", type=int, default=0, help="picks the empty tiles kept and the variants of the budget")
+
+    images = argparse.ArgumentParser(add_help=False)
+    images.add_argument("--full", action="store_true", help="rebuild everything instead of what changed")
+    images.add_argument("--use-temp", action="store_true", help="write the intermediate base dataset to temp/")
+    images.add_argument("--format", default="png", choices=["png", "webp", "bmp", "tiff", "npy"])
+    images.add_argument("--png-compression", type=int, help="zlib level 0-9")
+    images.add_argument("--png-strategy", choices=list(PNG_STRATEGIES), help="zlib strategy")
+    images.add_argument("--tile-size", type=int,
+                        help="cut the samples into overlapping tiles of this many pixels, with --full")
+    images.add_argument("--tile-overlap", type=float, default=0.2)
+    images.add_argument("--empty-tile-ratio", type=float, default=1.0, help="fraction of the empty tiles kept")
+    images.add_argument("--memory-mb", type=float,
+                        help="working set of all the workers together in tiled mode, an error if one sample needs more")
+    images.add_argument("--io-threads", type=int,
+                        help="run the images on this many threads with read-ahead and write-behind, 0 for one per core")
+    images.add_argument("--io-depth", type=int, default=8, help="files queued between the read, compute and write")
+    images.add_argument("--io-memory-mb", type=float, help="stop reading ahead while the queues hold this many MB")
+
+    parser = argparse.ArgumentParser(prog="agdd", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    dual = commands.add_parser("dual", parents=[common, labels, images], help="generate the dual-modal dataset")
+    dual.add_argument("--folder-passes", action="store_true",
+                      help="process images/, image/ and labels/ one after the other instead of sample by sample")
+    dual.add_argument("--packed-shard", action="store_true", help="write train/val shards for np.memmap, with --full")
+    dual.set_defaults(run=run_dual)
+
+    composite = commands.add_parser("composite", parents=[common, labels, images],
+                                    help="generate the RGB channel fusion dataset")
+    composite.add_argument("--fusion-mode", default="avg", help='"avg", "diff", "absdiff" or B,G,R channel sources')
+    composite.set_defaults(run=run_composite)
+
+    labels_only = commands.add_parser("labels-only", parents=[common, labels],
+                                      help="regenerate the labels of a generated dataset without touching an image")
+    labels_only.set_defaults(run=run_labels_only)
+
+    convert_json = commands.add_parser("convert-json", parents=[common], help="convert a folder of LabelMe json")
+    convert_json.add_argument("src", help="folder of LabelMe json")
+    convert_json.add_argument("--obb", help="output folder of the OBB txt")
+    convert_json.add_argument("--rect", help="output folder of the rect txt")
+    convert_json.add_argument("--json", help="output folder of the normalized json, src to rewrite them in place")
+    convert_json.add_argument("--force", action="store_true", help="convert the shapes that are rotations already")
+    convert_json.add_argument("--compact", action="store_true", help="write single-line json")
+    convert_json.set_defaults(run=run_convert_json)
+
+    validate = commands.add_parser("validate", parents=[common], help="check a dataset and write its index")
+    validate.add_argument("dataset", nargs="?", default=os.path.join(os.getcwd(), "data"))
+    validate.add_argument("--index", help="index file, <dataset>/.index.json by default")
+    validate.set_defaults(run=run_validate)
+    return parser
+
+
+if __name__ == "__main__":
+    parser = build_parser()
+    args = parser.parse_args()
+    set_verbosity(args.verbosity)
+    try:
+        with tracing(args.trace), profile(args.profile):
+            status = args.run(args)
+    except SettingsError as e:
+        # the settings the generators reject, e.g. a sample that does not fit in --memory-mb
+        parser.error(str(e))
+    sys.exit(status or 0)
@@ -0,0 +1,33 @@
+import os
+import cv2
+
+from utils.encoding import ImageEncoder, benchmark_encoders
+from utils.fusion import fuse_image
+
+
+if __name__ == "__main__":
+    num_images = 16
+    encoders = [
+        ImageEncoder("png"),
+        ImageEncoder("png", 0),
+        ImageEncoder("png", 3),
+        ImageEncoder("png", 6),
+        ImageEncoder("png", 9),
+        ImageEncoder("png", 1, "huffman_only"),
+        ImageEncoder("png", 1, "filtered"),
+        ImageEncoder("webp"),
+        ImageEncoder("bmp"),
+        ImageEncoder("tiff"),
+        ImageEncoder("npy"),
+    ]
+
+    image_folder = os.path.join(os.getcwd(), "data", "images", "train")
+    image2_folder = os.path.join(os.getcwd(), "data", "image", "train")
+    filenames = sorted(os.listdir(image_folder))[:num_images]
+    # encode what the generators write, the fused composite images
+    images = [fuse_image(cv2.imread(os.path.join(image_folder, f), cv2.IMREAD_GRAYSCALE),
+                         cv2.imread(os.path.join(image2_folder, f), cv2.IMREAD_GRAYSCALE)) for f in filenames]
+
+    print(f"{'encoder':<56}{'ms/image':>10}{'KB/image':>10}")
+    for result in benchmark_encoders(images, encoders):
+        print(f"{result['encoder']:<56}{result['ms_per_image']:>10.2f}{result['bytes_per_image'] / 1024:>10.1f}")
@@ -0,0 +1,68 @@
+import os
+import time
+import shutil
+import tempfile
+
+from utils.benchmark import make_fixture, benchmark_stages, benchmark_end_to_end, count_split_files, save_results
+from utils.fusion import fuse_image
+from utils.rotation import creat_single_x, creat_dual_x
+from generate_composite_dataset import create_composite_base
+
+
+if __name__ == "__main__":
+    num_images = 32  # synthetic pairs, a quarter of them in val
+    img_size = (640, 640)  # width, height
+    boxes_per_image = 8
+    rotate_angle_step = 90  # x8, 30 for x24, 15 for x48
+    workers = 1  # worker processes of the end to end runs, 0 for one per cpu core
+    repeat = 3  # every stage is timed repeat times and the best time is kept
+    use_data = False  # benchmark data/ instead of a synthetic fixture
+    output_path = os.path.join(os.getcwd(), "benchmarks", time.strftime("%Y%m%d_%H%M%S") + ".json")
+
+    angle_list = list(range(0, 360, rotate_angle_step))
+    work_dir = tempfile.mkdtemp(prefix="agdd_benchmark_")
+    try:
+        if use_data:
+            data_folder_path = os.path.join(os.getcwd(), "data")
+        else:
+            data_folder_path = os.path.join(work_dir, "data")
+            make_fixture(data_folder_path, num_images, img_size, boxes_per_image)
+
+        num_pairs = count_split_files(data_folder_path)
+        num_boxes = 0
+        for split in ["train", "val"]:
+            label_folder = os.path.join(data_folder_path, "labels", split)
+            for filename in os.listdir(label_folder):
+                with open(os.path.join(label_folder, filename), 'r') as f:
+                    num_boxes += sum(1 for line in f if line.strip())
+        num_variants = len(angle_list) * 2
+
+        stages = benchmark_stages(data_folder_path, angle_list, repeat=repeat)
+        end_to_end = [
+            benchmark_end_to_end("create_composite_base",
+                                 lambda out: create_composite_base(data_folder_path, out, "base"),
+                                 work_dir, num_pairs, 0, repeat),
+            benchmark_end_to_end("creat_single_x", lambda out: creat_single_x(rotate_angle_step, data_folder_path, out,
+                                                                              "composite", workers=workers,
+                                                                              fusion=fuse_image),
+                                 work_dir, num_pairs * num_variants, num_boxes * num_variants, repeat),
+            benchmark_end_to_end("creat_dual_x", lambda out: creat_dual_x(rotate_angle_step, data_folder_path, out,
+                                                                          "dual", workers=workers),
+                                 work_dir, 2 * num_pairs * num_variants, num_boxes * num_variants, repeat),
+        ]
+        report = save_results({
+            "config": {"num_images": num_pairs, "img_size": img_size, "boxes": num_boxes, "angle_list": angle_list,
+                       "workers": workers, "repeat": repeat, "data": "data/" if use_data else "synthetic"},
+            "stages": stages,
+            "end_to_end": end_to_end,
+        }, output_path)
+    finally:
+        shutil.rmtree(work_dir)
+
+    print(f"\n{'stage':<32}{'seconds':>10}{'images/s':>12}{'labels/s':>12}")
+    for result in report["stages"] + report["end_to_end"]:
+        images_per_s = f"{result['images_per_s']:.1f}" if "images_per_s" in result else "-"
+        labels_per_s = f"{result['labels_per_s']:.0f}" if "labels_per_s" in result else "-"
+        print(f"{result['stage']:<32}{result['seconds']:>10.3f}{images_per_s:>12}{labels_per_s:>12}")
+    print(f"peak RSS (MB): {report['peak_rss_mb']}")
+    print(f"results written to {output_path}")
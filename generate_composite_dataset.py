@@ -1,14 +1,31 @@
 from utils.utility import *
+from utils.encoding import ImageEncoder
+from utils.geometry import make_box_filter
+from utils.pipeline import Pipeline
+from utils.budget import VariantBudget
+from utils.instrument import set_verbosity, tracing, profile, reported
 from utils.rotation import creat_single_x
-from utils.fusion import combine_image
+from utils.tiling import creat_tiled_x
+from utils.fusion import ImageFusion, combine_folder
+from utils.manifest import Manifest
+from utils.index import DatasetIndex
 
 
-def create_composite_base(_data_folder_path, _output_dir, dataset_name, label_type="obb"):
+@reported
+def create_composite_base(_data_folder_path, _output_dir, dataset_name, label_type="obb", incremental=False,
+                          fusion_mode="avg", pipeline=None):
     dataset_path = os.path.join(_output_dir, dataset_name)
-    makedir(dataset_path, True)
+    makedir(dataset_path, not incremental)
+    manifest = None
+    if incremental:
+        manifest = Manifest(dataset_path, {"fusion": repr(ImageFusion(fusion_mode))},
+                            DatasetIndex.load(_data_folder_path))
 
     src_labels_folder = os.path.join(_data_folder_path, "labels" if label_type == "obb" else "labels_rect")
-    copy_folder(src_labels_folder, os.path.join(dataset_path, "labels"), 1)
+    if incremental:
+        sync_folder(src_labels_folder, os.path.join(dataset_path, "labels"), 1)
+    else:
+        copy_folder(src_labels_folder, os.path.join(dataset_path, "labels"), 1, pipeline)
 
     output_images_path = os.path.join(dataset_path, "images")
 
@@ -19,30 +36,99 @@ def create_composite_base(_data_folder_path, _output_dir, dataset_name, label_ty
         img1_folder = os.path.join(_data_folder_path, "images", sub_folder)
         img2_folder = os.path.join(_data_folder_path, "image", sub_folder)
 
+        stale = []
         for filename in os.listdir(img1_folder):
             img1_path = os.path.join(img1_folder, filename)
             img2_path = os.path.join(img2_folder, filename)
-            combine_image(img1_path, img2_path, os.path.join(dst_dir, filename))
+            dst_path = os.path.join(dst_dir, filename)
+            if manifest is None or manifest.is_stale(dst_path, [img1_path, img2_path], [dst_path]):
+                stale.append(filename)
+        combine_folder(img1_folder, img2_folder, dst_dir, stale, fusion_mode, pipeline)
+        if manifest is not None:
+            for filename in stale:
+                paths = [os.path.join(img1_folder, filename), os.path.join(img2_folder, filename)]
+                manifest.record(os.path.join(dst_dir, filename), paths, [os.path.join(dst_dir, filename)])
 
+    if manifest is not None:
+        manifest.finish()
     gen_yaml(dataset_path, dataset_name)
 
 
+def generate_composite(data_folder_path, output_dir, gen_name, gen_type="obb", rotate_angle_step=90, workers=0,
+                       incremental=True, use_temp=False, encoder=None, fusion_mode="avg", box_filter=None,
+                       tile_size=None, tile_overlap=0.2, empty_tile_ratio=1.0, seed=0, memory_mb=None, pipeline=None,
+                       budget=None):
+    """
+    The composite dataset the settings of __main__ describe, also run by the "composite" command of agdd.py.
+    Returns the errors like generate_dual.
+    """
+    label_folder = "labels" if gen_type == "obb" else "labels_rect"
+    errors = None
+    if not os.path.exists(data_folder_path):
+        print(f"Error: The data folder does not exist at {data_folder_path}")
+    elif not any(os.scandir(data_folder_path)):  # check empty
+        print(f"Error: The data folder at {data_folder_path} is empty.")
+    elif tile_size is not None:
+        reject_options("tile_size", {"incremental": incremental, "use_temp": use_temp,
+                                  "pipeline (io_threads)": pipeline is not None,
+                                  "budget (min_variants)": budget is not None})
+        errors = creat_tiled_x(rotate_angle_step, data_folder_path, output_dir, gen_name, ImageFusion(fusion_mode),
+                               tile_size, tile_overlap, workers, memory_mb, gen_type, label_folder, encoder,
+                               box_filter, empty_tile_ratio, seed)
+    elif use_temp:
+        temp_dir = os.path.join(output_dir, "temp")
+        makedir(temp_dir, not incremental)
+        temp_name = f"{gen_name}_base"
+        create_composite_base(data_folder_path, temp_dir, temp_name, gen_type, incremental, fusion_mode, pipeline)
+        errors = creat_single_x(rotate_angle_step, os.path.join(temp_dir, temp_name), output_dir, gen_name,
+                                gen_type, workers, incremental, encoder=encoder, box_filter=box_filter,
+                                pipeline=pipeline, budget=budget)
+    else:
+        errors = creat_single_x(rotate_angle_step, data_folder_path, output_dir, gen_name, gen_type, workers,
+                                incremental, fusion=ImageFusion(fusion_mode), label_folder=label_folder,
+                                encoder=encoder, box_filter=box_filter, pipeline=pipeline, budget=budget)
+    return errors
+
+
 if __name__ == "__main__":
+    # the settings are described in README.md, "Generation options"
     gen_name = "ag_composite_obb"
     gen_type = "obb"  # "obb" or "rect"
-    rotate_angle_step = 90  # x8
+    rotate_angle_step = 90
+    workers = 0
+    incremental = True  # only rebuild what changed since the last run
+    use_temp = False
+    image_format = "png"
+    png_compression = None
+    png_strategy = None
+    fusion_mode = "avg"
+    min_box_area = None
+    min_box_visibility = None
+    box_iou_threshold = None
+    tile_size = None
+    tile_overlap = 0.2
+    empty_tile_ratio = 1.0
+    min_variants = None
+    seed = 0
+    memory_mb = None
+    io_threads = None
+    io_depth = 8
+    io_memory_mb = None
+    verbosity = 1
+    trace_path = None
+    profile_path = None
+
+    encoder = ImageEncoder(image_format, png_compression, png_strategy)
+    box_filter = make_box_filter(min_box_area, min_box_visibility, box_iou_threshold)
+    pipeline = Pipeline(io_threads, io_depth, io_memory_mb) if io_threads is not None else None
+    budget = VariantBudget(min_variants, seed) if min_variants is not None else None
+    set_verbosity(verbosity)
 
     base_path = os.getcwd()
     data_folder_path = os.path.join(base_path, "data")
     output_dir = base_path
 
-    if not os.path.exists(data_folder_path):
-        print(f"Error: The data folder does not exist at {data_folder_path}")
-    elif not any(os.scandir(data_folder_path)):  # check empty
-        print(f"Error: The data folder at {data_folder_path} is empty.")
-    else:
-        temp_dir = os.path.join(base_path, "temp")
-        makedir(temp_dir, True)
-        temp_name = f"{gen_name}_base"
-        create_composite_base(data_folder_path, temp_dir, temp_name, gen_type)
-        creat_single_x(rotate_angle_step, os.path.join(temp_dir, temp_name), output_dir, gen_name, gen_type)
+    with tracing(trace_path), profile(profile_path):
+        generate_composite(data_folder_path, output_dir, gen_name, gen_type, rotate_angle_step, workers, incremental,
+                           use_temp, encoder, fusion_mode, box_filter, tile_size, tile_overlap, empty_tile_ratio, seed,
+                           memory_mb, pipeline, budget)
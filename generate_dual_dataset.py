@@ -1,34 +1,114 @@
 from utils.utility import *
+from utils.encoding import ImageEncoder
+from utils.geometry import make_box_filter
+from utils.pipeline import Pipeline
+from utils.budget import VariantBudget
+from utils.instrument import set_verbosity, tracing, profile, reported
 from utils.rotation import creat_dual_x
+from utils.shard import creat_dual_shard
+from utils.tiling import creat_tiled_x
 
 
-def create_dual_base(_data_folder_path, _output_dir, dataset_name, label_type="obb"):
+@reported
+def create_dual_base(_data_folder_path, _output_dir, dataset_name, label_type="obb", incremental=False,
+                     pipeline=None):
     include_folders = ["image", "images", ("labels" if label_type == "obb" else "labels_rect")]
     dataset_path = os.path.join(_output_dir, dataset_name)
-    makedir(dataset_path, True)
+    makedir(dataset_path, not incremental)
     for folder_name in include_folders:
         src_path = os.path.join(_data_folder_path, folder_name)
         dst_path = os.path.join(dataset_path, folder_name.split('_')[0])
-        copy_folder(src_path, dst_path, 1)
+        if incremental:
+            sync_folder(src_path, dst_path, 1)
+        else:
+            copy_folder(src_path, dst_path, 1, pipeline)
     gen_yaml(dataset_path, dataset_name)
 
 
+def generate_dual(data_folder_path, output_dir, gen_name, gen_type="obb", rotate_angle_step=90, workers=0,
+                  incremental=True, use_temp=False, encoder=None, packed_shard=False, box_filter=None, tile_size=None,
+                  tile_overlap=0.2, empty_tile_ratio=1.0, seed=0, memory_mb=None, paired=True, pipeline=None,
+                  budget=None):
+    """
+    The dual dataset the settings of __main__ describe, also run by the "dual" command of agdd.py.
+    Returns the list of (task, error message) of the files that failed, None when there is no data folder.
+    """
+    label_folder = "labels" if gen_type == "obb" else "labels_rect"
+    errors = None
+    if not os.path.exists(data_folder_path):
+        print(f"Error: The data folder does not exist at {data_folder_path}")
+    elif not any(os.scandir(data_folder_path)):  # check empty
+        print(f"Error: The data folder at {data_folder_path} is empty.")
+    elif packed_shard:
+        reject_options("packed_shard", {"incremental": incremental, "use_temp": use_temp, "paired = False": not paired,
+                                     "pipeline (io_threads)": pipeline is not None,
+                                     "budget (min_variants)": budget is not None})
+        # a sample that cannot be packed stops the shard with an exception
+        creat_dual_shard(rotate_angle_step, data_folder_path, output_dir, gen_name, gen_type,
+                         label_folder=label_folder, box_filter=box_filter)
+        errors = []
+    elif tile_size is not None:
+        reject_options("tile_size", {"incremental": incremental, "use_temp": use_temp, "paired = False": not paired,
+                                  "pipeline (io_threads)": pipeline is not None,
+                                  "budget (min_variants)": budget is not None})
+        errors = creat_tiled_x(rotate_angle_step, data_folder_path, output_dir, gen_name, None, tile_size,
+                               tile_overlap, workers, memory_mb, gen_type, label_folder, encoder, box_filter,
+                               empty_tile_ratio, seed)
+    elif use_temp:
+        temp_dir = os.path.join(output_dir, "temp")
+        makedir(temp_dir, not incremental)
+        temp_name = f"{gen_name}_base"
+        create_dual_base(data_folder_path, temp_dir, temp_name, gen_type, incremental, pipeline)
+        errors = creat_dual_x(rotate_angle_step, os.path.join(temp_dir, temp_name), output_dir, gen_name, gen_type,
+                              workers, incremental, encoder=encoder, box_filter=box_filter, paired=paired,
+                              pipeline=pipeline, budget=budget)
+    else:
+        errors = creat_dual_x(rotate_angle_step, data_folder_path, output_dir, gen_name, gen_type, workers,
+                              incremental, label_folder=label_folder, encoder=encoder, box_filter=box_filter,
+                              paired=paired, pipeline=pipeline, budget=budget)
+    return errors
+
+
 if __name__ == "__main__":
+    # the settings are described in README.md, "Generation options"
     gen_name = "ag_dual_obb"
     gen_type = "obb"  # "obb" or "rect"
-    rotate_angle_step = 90  # x8
+    rotate_angle_step = 90
+    workers = 0
+    incremental = True  # only rebuild what changed since the last run
+    paired = True
+    use_temp = False
+    image_format = "png"
+    png_compression = None
+    png_strategy = None
+    packed_shard = False
+    min_box_area = None
+    min_box_visibility = None
+    box_iou_threshold = None
+    tile_size = None
+    tile_overlap = 0.2
+    empty_tile_ratio = 1.0
+    min_variants = None
+    seed = 0
+    memory_mb = None
+    io_threads = None
+    io_depth = 8
+    io_memory_mb = None
+    verbosity = 1
+    trace_path = None
+    profile_path = None
+
+    encoder = ImageEncoder(image_format, png_compression, png_strategy)
+    box_filter = make_box_filter(min_box_area, min_box_visibility, box_iou_threshold)
+    pipeline = Pipeline(io_threads, io_depth, io_memory_mb) if io_threads is not None else None
+    budget = VariantBudget(min_variants, seed) if min_variants is not None else None
+    set_verbosity(verbosity)
 
     base_path = os.getcwd()
     data_folder_path = os.path.join(base_path, "data")
     output_dir = base_path
 
-    if not os.path.exists(data_folder_path):
-        print(f"Error: The data folder does not exist at {data_folder_path}")
-    elif not any(os.scandir(data_folder_path)):  # check empty
-        print(f"Error: The data folder at {data_folder_path} is empty.")
-    else:
-        temp_dir = os.path.join(base_path, "temp")
-        makedir(temp_dir, True)
-        temp_name = f"{gen_name}_base"
-        create_dual_base(data_folder_path, temp_dir, temp_name, gen_type)
-        creat_dual_x(rotate_angle_step, os.path.join(temp_dir, temp_name), output_dir, gen_name, gen_type)
+    with tracing(trace_path), profile(profile_path):
+        generate_dual(data_folder_path, output_dir, gen_name, gen_type, rotate_angle_step, workers, incremental,
+                      use_temp, encoder, packed_shard, box_filter, tile_size, tile_overlap, empty_tile_ratio, seed,
+                      memory_mb, paired, pipeline, budget)
@@ -0,0 +1,223 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import cv2
+import numpy as np
+
+from utils.converter import adjust_rectangle_coordinates
+from utils.encoding import ImageEncoder
+from utils.fusion import fuse_image, combine_image
+from utils.rotation import d4_transform
+from utils.labels import load_label, write_label, rotate_obb_boxes, variant_names, label_image_sizes, missing_mask, \
+    outside_canvas_mask
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def make_fixture(data_folder_path, num_images=16, img_size=(640, 640), boxes_per_image=8, edge_ratio=0.1,
+                 val_ratio=0.25, seed=0):
+    """
+    Synthesize a dataset shaped like data/: forward (images/) and backward (image/) png pairs with
+    4-corner OBB labels (labels/) and xywh labels (labels_rect/), split into train and val.
+    Some boxes cross the image border, so the clipping path is exercised as well.
+    """
+    rng = np.random.default_rng(seed)
+    width, height = img_size
+    num_val = int(round(num_images * val_ratio))
+    for i in range(num_images):
+        split = "val" if i < num_val else "train"
+        stem = f"{10000000000 + i * 10}"  # the last digit is replaced by the variant code
+        for folder in ["images", "image", "labels", "labels_rect"]:
+            os.makedirs(os.path.join(data_folder_path, folder, split), exist_ok=True)
+
+        # smooth gray background with noise, stored as 3 channels like the raw data
+        base = cv2.GaussianBlur(rng.integers(0, 256, (height // 8, width // 8), dtype=np.uint8), (5, 5), 0)
+        for folder in ["images", "image"]:
+            img = cv2.resize(base, (width, height)) + rng.integers(0, 16, (height, width), dtype=np.uint8)
+            cv2.imwrite(os.path.join(data_folder_path, folder, split, stem + ".png"), cv2.merge((img, img, img)))
+
+        # rotated boxes inside the image, and axis aligned ones cut by the border with probability edge_ratio
+        size = rng.uniform(0.02, 0.2, (boxes_per_image, 2))
+        radius = np.hypot(size[:, :1], size[:, 1:]) / 2
+        center = radius + rng.uniform(0.0, 1.0, (boxes_per_image, 2)) * (1 - 2 * radius)
+        theta = rng.uniform(0, np.pi, boxes_per_image)
+        on_edge = rng.uniform(size=boxes_per_image) < edge_ratio
+        for k in np.flatnonzero(on_edge):
+            # the long side crosses one border, which is what adjust_rectangle_coordinates can clip
+            axis, side = rng.integers(0, 2, 2)
+            size[k] = sorted(size[k]) if axis else sorted(size[k], reverse=True)
+            center[k, axis] = side + (1 - 2 * side) * rng.uniform(0.1, 0.4) * size[k, axis]
+            center[k, 1 - axis] = rng.uniform(0.2, 0.8)
+            theta[k] = 0
+        corners = np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) / 2
+        c, s = np.cos(theta)[:, None], np.sin(theta)[:, None]
+        x = center[:, :1] + corners[:, 0] * size[:, :1] * c - corners[:, 1] * size[:, 1:] * s
+        y = center[:, 1:] + corners[:, 0] * size[:, :1] * s + corners[:, 1] * size[:, 1:] * c
+        classes = rng.integers(0, 4, boxes_per_image)
+        with open(os.path.join(data_folder_path, "labels", split, stem + ".txt"), 'w') as f:
+            for k in range(boxes_per_image):
+                points = " ".join(f"{x[k, j]:.7f} {y[k, j]:.7f}" for j in range(4))
+                f.write(f"{classes[k]} {points}\n")
+        with open(os.path.join(data_folder_path, "labels_rect", split, stem + ".txt"), 'w') as f:
+            for k in range(boxes_per_image):
+                cx, cy = np.clip(center[k], 0, 1)
+                w, h = size[k]
+                f.write(f"{classes[k]} {cx:.7f} {cy:.7f} {w:.7f} {h:.7f}\n")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and of its finished worker processes, None on windows."""
+    if resource is None:
+        return None
+    unit = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is in bytes on macOS, in KB on linux
+    peak = {}
+    for name, who in [("self", resource.RUSAGE_SELF), ("children", resource.RUSAGE_CHILDREN)]:
+        peak[name] = resource.getrusage(who).ru_maxrss * unit / (1 << 20)
+    return peak
+
+
+def time_call(func, repeat=3):
+    """Best wall time of func() in seconds over repeat runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def stage_result(stage, seconds, images=0, labels=0):
+    result = {"stage": stage, "seconds": seconds}
+    if images:
+        result["images"] = images
+        result["images_per_s"] = images / seconds
+    if labels:
+        result["labels"] = labels
+        result["labels_per_s"] = labels / seconds
+    return result
+
+
+def benchmark_stages(data_folder_path, angle_list, split="train", encoder=None, repeat=3):
+    """
+    Time each stage of the generators in isolation on one split, every stage starts from the output of the
+    previous one kept in memory. images counts the image files read or written by the stage,
+    labels the boxes it handled.
+    """
+    if encoder is None:
+        encoder = ImageEncoder()
+    img1_folder = os.path.join(data_folder_path, "images", split)
+    img2_folder = os.path.join(data_folder_path, "image", split)
+    label_folder = os.path.join(data_folder_path, "labels", split)
+    filenames = sorted(os.listdir(img1_folder))
+    label_paths = [os.path.join(label_folder, os.path.splitext(f)[0] + ".txt") for f in filenames]
+    num_variants = len(filenames) * len(angle_list) * 2
+    results = []
+
+    def decode():
+        return [(cv2.imread(os.path.join(img1_folder, f), cv2.IMREAD_GRAYSCALE),
+                 cv2.imread(os.path.join(img2_folder, f), cv2.IMREAD_GRAYSCALE)) for f in filenames]
+
+    pairs = decode()
+    results.append(stage_result("decode", time_call(decode, repeat), images=2 * len(pairs)))
+
+    fused = [fuse_image(img1, img2) for img1, img2 in pairs]
+    seconds = time_call(lambda: [fuse_image(img1, img2) for img1, img2 in pairs], repeat)
+    results.append(stage_result("fuse", seconds, images=len(pairs)))
+
+    def transform():
+        for img in fused:
+            for _ in d4_transform(img, angle_list):
+                pass
+
+    results.append(stage_result("transform", time_call(transform, repeat), images=num_variants))
+
+    seconds = 0.0
+    for img in fused:  # the variants of one image at a time, encoded apart from the transform
+        variants = [variant.copy() for _, _, variant in d4_transform(img, angle_list)]
+        seconds += time_call(lambda: [encoder.encode(variant) for variant in variants], repeat)
+    results.append(stage_result("encode", seconds, images=num_variants))
+
+    class_list, values, counts = load_label(label_paths, 8)
+    boxes = values.reshape(-1, 4, 2)
+    img_sizes = label_image_sizes(label_paths, img1_folder, counts) if any(a % 90 for a in angle_list) else None
+    seconds = time_call(lambda: load_label(label_paths, 8), repeat)
+    results.append(stage_result("label_read", seconds, labels=len(boxes)))
+
+    def label_rotate():
+        return [rotate_obb_boxes(boxes, a, f, img_sizes) for a in angle_list for f in [False, True]]
+
+    rotated = label_rotate()
+    results.append(stage_result("label_rotate", time_call(label_rotate, repeat), labels=len(boxes) * len(rotated)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        names = [variant_names(os.path.basename(p), angle_list) for p in label_paths]
+
+        def label_write():
+            for v, (rotated_boxes, keep) in enumerate(rotated):
+                output_paths = [os.path.join(tmp, variants_of_file[v]) for variants_of_file in names]
+                write_label(output_paths, class_list, rotated_boxes.reshape(-1, 8), counts, keep)
+
+        results.append(stage_result("label_write", time_call(label_write, repeat), labels=len(boxes) * len(rotated)))
+
+        crossing = boxes[outside_canvas_mask(boxes, 1.0, 1.0) & ~missing_mask(boxes, 1.0, 1.0)].tolist()
+
+        def clip():
+            for box in crossing:
+                try:
+                    adjust_rectangle_coordinates([list(point) for point in box], 1.0, 1.0)
+                except ValueError:
+                    pass
+
+        results.append(stage_result("adjust_rectangle_coordinates", time_call(clip, repeat), labels=len(crossing)))
+
+        def combine():
+            for f in filenames:
+                combine_image(os.path.join(img1_folder, f), os.path.join(img2_folder, f), os.path.join(tmp, f))
+
+        results.append(stage_result("combine_image", time_call(combine, repeat), images=len(filenames)))
+    return results
+
+
+def count_split_files(data_folder_path, folder="images"):
+    return sum(len(os.listdir(os.path.join(data_folder_path, folder, split))) for split in ["train", "val"])
+
+
+def benchmark_end_to_end(name, func, work_dir, images, labels, repeat=1):
+    """Time func(output_dir) end to end, the output folder is emptied before every run."""
+    output_dir = os.path.join(work_dir, name)
+
+    def run():
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir)
+        func(output_dir)
+
+    return stage_result(name, time_call(run, repeat), images=images, labels=labels)
+
+
+def save_results(results, output_path):
+    """Write the results with the environment they were measured in, so two runs can be compared."""
+    peak_rss = peak_rss_mb()  # before platform.platform(), which forks a child process
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "opencv": cv2.__version__,
+        "cpu_count": os.cpu_count(),
+        "peak_rss_mb": peak_rss,
+    }
+    report.update(results)
+    output_folder = os.path.dirname(output_path)
+    if output_folder and not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    with open(output_path, 'w', encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,68 @@
+import os
+import math
+import hashlib
+from collections import Counter
+
+
+def label_classes(label_path):
+    """The class of every line of a YOLO label file, as written (a string)."""
+    with open(label_path, 'r') as f:
+        return [line.split()[0] for line in f if line.strip()]
+
+
+def class_histogram(sample_classes):
+    """Boxes per class over all the samples, sample_classes maps a sample to the classes of its boxes."""
+    histogram = Counter()
+    for classes in sample_classes.values():
+        histogram.update(classes)
+    return histogram
+
+
+class VariantBudget:
+    """
+    Class-aware number of flip/rotation variants per sample, instead of every variant of every sample.
+    A sample is worth the rarity of its rarest class, the box count of the rarest class of the split divided by
+    the box count of its class. It gets that fraction of the variants of angle_list, rounded up and at least
+    min_variants: the samples holding the rarest class get all of them, the ones with only the common classes
+    (and the ones without labels) get about min_variants.
+    seed picks which variants a sample gets, the same sample, classes and seed always give the same ones.
+    """
+
+    def __init__(self, min_variants=1, seed=0):
+        assert min_variants >= 1
+        self.min_variants = min_variants
+        self.seed = seed
+
+    def __repr__(self):
+        return f"VariantBudget({self.min_variants!r}, {self.seed!r})"
+
+    def num_variants(self, classes, histogram, total):
+        if not classes or not histogram:
+            return min(self.min_variants, total)
+        rarity = min(histogram.values()) / min(histogram[c] for c in classes)
+        return min(max(math.ceil(total * rarity), self.min_variants), total)
+
+    def choose(self, name, n, angle_list):
+        """n of the (angle, flip) variants of angle_list, ranked by a hash of the seed and the sample name."""
+        variants = [(a, f) for a in angle_list for f in [False, True]]
+
+        def rank(variant):
+            return hashlib.sha1(f"{self.seed}:{name}:{variant[0]}:{int(variant[1])}".encode()).digest()
+
+        chosen = set(sorted(variants, key=rank)[:n])
+        # in the order d4_transform makes them
+        return [v for v in variants if v in chosen]
+
+    def plan(self, label_folder_path, names, angle_list):
+        """
+        {sample name: [(angle, flip), ...]} for the names (file names without suffix) of a split,
+        from the label files of label_folder_path. A sample without a label file has no class.
+        """
+        sample_classes = {}
+        for name in names:
+            label_path = os.path.join(label_folder_path, name + ".txt")
+            sample_classes[name] = label_classes(label_path) if os.path.exists(label_path) else []
+        histogram = class_histogram(sample_classes)
+        total = 2 * len(angle_list)
+        return {name: self.choose(name, self.num_variants(classes, histogram, total), angle_list)
+                for name, classes in sample_classes.items()}
@@ -1,22 +1,21 @@
 import os
-import cv2
-import json
 import math
 import numpy as np
-from scipy.optimize import linprog
 
+from utils.instrument import log, count, reported
+from utils.utility import CLASS_NAMES
+from utils.parallel import run_tasks
+from utils.jsonio import load_json, loads, dumps, write_if_changed
 
-def x_json_to_yolo_obb(json_file_path, output_file_path):
-    class_mapping = {
-        "contusion": 0,
-        "scratches": 1,
-        "crack": 2,
-        "spot": 3,
-    }
+CLASS_MAPPING = {name: i for i, name in enumerate(CLASS_NAMES)}
 
-    with open(json_file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-        image_width, image_height = float(data["imageWidth"]), float(data["imageHeight"])
+
+def x_json_to_yolo_obb(json_file_path, output_file_path, class_mapping=None):
+    if class_mapping is None:
+        class_mapping = CLASS_MAPPING
+
+    data = load_json(json_file_path)
+    image_width, image_height = float(data["imageWidth"]), float(data["imageHeight"])
 
     with open(output_file_path, "w", encoding="utf-8") as f:
         for shape in data["shapes"]:
@@ -31,96 +30,120 @@ def x_json_to_yolo_obb(json_file_path, output_file_path):
             f.write(f"{class_idx} {' '.join(formatted_coords)}\n")
 
 
-def x_json_to_yolo_rect(json_file_path, output_file_path):
-    class_mapping = {
-        "contusion": 0,
-        "scratches": 1,
-        "crack": 2,
-        "spot": 3,
-    }
+def x_json_to_yolo_rect(json_file_path, output_file_path, class_mapping=None):
+    if class_mapping is None:
+        class_mapping = CLASS_MAPPING
 
-    with open(json_file_path, 'r', encoding="utf-8") as f:
-        data = json.load(f)
-        image_width, image_height = float(data["imageWidth"]), float(data["imageHeight"])
-        image_size = np.array([[image_width, image_height]])
+    data = load_json(json_file_path)
+    image_width, image_height = float(data["imageWidth"]), float(data["imageHeight"])
 
     with open(output_file_path, "w", encoding="utf-8") as f:
         for shape in data["shapes"]:
             class_label = shape["label"]
             class_idx = class_mapping[class_label]
-            points = np.array(shape["points"])
-            norm_points = points / image_size
-            x1, y1 = np.min(norm_points, axis=0)
-            x2, y2 = np.max(norm_points, axis=0)
+            xs = [point[0] / image_width for point in shape["points"]]
+            ys = [point[1] / image_height for point in shape["points"]]
+            x1, y1 = min(xs), min(ys)
+            x2, y2 = max(xs), max(ys)
             x, y, w, h = (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1
             formatted_coords = ["{:.7f}".format(coord) for coord in [x, y, w, h]]
             f.write(f"{class_idx} {' '.join(formatted_coords)}\n")
 
 
-def adjust_rectangle_coordinates(point_list, width: float, height: float):
-    def cal_k(a1, a2, a3, a4, a5, a6):
-        """
-        min k
-        s.t.  k >= 0
-              0 <= a[0] + k * vector_ab[0] <= width
-              0 <= a[1] + k * vector_ab[1] <= height
-
-        let a1, a2, a3, a4, a5, a6 = a[0], a[1], vector_ab[0], vector_ab[1], width, height
-        -a3 * k <= a1
-         a3 * k <= a5 - a1
-        -a4 * k <= a2
-         a4 * k <= a6 - a2
-        """
-        _c = [1]
-        _A = [[-a3], [a3], [-a4], [a4]]
-        _b = [a1, a5 - a1, a2, a6 - a2]
-        _bounds = [(0, None)]
-        result = linprog(_c, A_ub=_A, b_ub=_b, bounds=_bounds, method='highs')
-        return result.x[0]
-
-    def is_inside_canvas(point):
-        return 0 <= point[0] <= width and 0 <= point[1] <= height
-
-    def distance(p1, p2):
-        return math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
-
-    def translate_point(point, vector, _k):
-        point[0] += vector[0] * _k
-        point[1] += vector[1] * _k
+CLIP_TOLERANCE = 8.0e-5  # snap to the canvas edge to fix accuracy error
+FEASIBILITY_TOLERANCE = 1.0e-7  # same as the default primal feasibility tolerance of HiGHS
+
+
+def cal_k(a, vector_ab, width, height):
+    """
+    Closed-form solution of, for every row,
+    min k
+    s.t.  k >= 0
+          0 <= a[0] + k * vector_ab[0] <= width
+          0 <= a[1] + k * vector_ab[1] <= height
+
+    each constraint bounds k to an interval, k is the lower end of their intersection.
+    a and vector_ab are (N, 2) arrays, returns k and a mask of the rows that are feasible.
+    """
+    lo = np.zeros(len(a))
+    hi = np.full(len(a), np.inf)
+    feasible = np.ones(len(a), dtype=bool)
+    for axis, limit in [(0, width), (1, height)]:
+        p, v = a[:, axis], vector_ab[:, axis]
+        moving = v != 0
+        with np.errstate(divide="ignore", invalid="ignore"):
+            k1, k2 = (0 - p) / v, (limit - p) / v
+        lo = np.where(moving, np.maximum(lo, np.minimum(k1, k2)), lo)
+        hi = np.where(moving, np.minimum(hi, np.maximum(k1, k2)), hi)
+        feasible &= moving | ((0 <= p) & (p <= limit))
+    feasible &= lo <= hi + FEASIBILITY_TOLERANCE
+    return lo, feasible
+
+
+def clip_boxes(boxes, width: float, height: float, max_iter=8):
+    """
+    Vectorized adjust_rectangle_coordinates for an (N, 4, 2) array of rectangles, updated in place.
+    Corners are processed in the same order as for a single box, but for all boxes at once.
+    Returns the boxes and a mask of the ones that ended inside the canvas,
+    a box is given up when the canvas cannot be reached or after max_iter passes.
+    """
+    def is_inside_canvas(points):
+        return (0 <= points[..., 0]) & (points[..., 0] <= width) & (0 <= points[..., 1]) & (points[..., 1] <= height)
+
+    def translate_point(points, vector, _k):
+        points += vector * _k[:, None]
         # fix accuracy error
-        tolerance = 8.0e-5
-        if math.fabs(point[0]) < tolerance:
-            point[0] = 0.0
-        elif math.fabs(point[0] - width) < tolerance:
-            point[0] = float(width)
-        if math.fabs(point[1]) < tolerance:
-            point[1] = 0.0
-        elif math.fabs(point[1] - height) < tolerance:
-            point[1] = float(height)
-
-    while not all(is_inside_canvas(p) for p in point_list):
+        for axis, limit in [(0, width), (1, height)]:
+            values = points[:, axis]
+            near_zero = np.fabs(values) < CLIP_TOLERANCE
+            near_limit = ~near_zero & (np.fabs(values - limit) < CLIP_TOLERANCE)
+            values[near_zero] = 0.0
+            values[near_limit] = float(limit)
+
+    active = np.ones(len(boxes), dtype=bool)
+    for _ in range(max_iter):
+        active &= ~is_inside_canvas(boxes).all(axis=1)
+        if not active.any():
+            break
         for i in range(4):
-            if is_inside_canvas(point_list[i]):
+            rows = np.flatnonzero(active & ~is_inside_canvas(boxes[:, i]))
+            if len(rows) == 0:
                 continue
 
-            a = point_list[i]
+            a = boxes[rows, i]
             pre_idx = i - 1
             next_idx = (i + 1) % 4
+            pre, nxt = boxes[rows, pre_idx], boxes[rows, next_idx]
 
             # b and c are two points adjacent to a
             # make sure ab is the long side of the rectangle
-            if distance(a, point_list[pre_idx]) > distance(a, point_list[next_idx]):
-                b, c = point_list[pre_idx], point_list[next_idx]
-            else:
-                c, b = point_list[pre_idx], point_list[next_idx]
+            pre_is_long = (np.sqrt(((a - pre) ** 2).sum(axis=1)) > np.sqrt(((a - nxt) ** 2).sum(axis=1)))[:, None]
+            b = np.where(pre_is_long, pre, nxt)
+            c_idx = np.where(pre_is_long[:, 0], next_idx, pre_idx % 4)
+            c = boxes[rows, c_idx]
 
             # move a and c in the direction of vector ab
             # that is, add k * vector_ab to the coordinates
             # which makes point a moved exactly to the boundary
-            vector_ab = [b[0] - a[0], b[1] - a[1]]
-            k = cal_k(a[0], a[1], vector_ab[0], vector_ab[1], width, height)
+            vector_ab = b - a
+            k, feasible = cal_k(a, vector_ab, width, height)
+            active[rows[~feasible]] = False
+            rows, vector_ab, k, a, c = rows[feasible], vector_ab[feasible], k[feasible], a[feasible], c[feasible]
             translate_point(a, vector_ab, k)
             translate_point(c, vector_ab, k)
+            boxes[rows, i] = a
+            boxes[rows, c_idx[feasible]] = c
+
+    return boxes, is_inside_canvas(boxes).all(axis=1)
+
+
+def adjust_rectangle_coordinates(point_list, width: float, height: float):
+    """Clip one rectangle (4 points) to the canvas in place, raises ValueError when that is impossible."""
+    boxes, inside = clip_boxes(np.array([point_list], dtype=np.float64), width, height)
+    if not inside[0]:
+        raise ValueError(f"rectangle {point_list} cannot be clipped to the {width}x{height} canvas")
+    for point, new_point in zip(point_list, boxes[0].tolist()):
+        point[0], point[1] = new_point
 
 
 def calculate_rotation_theta(_points):
@@ -143,12 +166,18 @@ def calculate_rotation_theta(_points):
     return rotation_angle_degrees / 360 * (2 * math.pi)
 
 
-def modify_json_file(json_file_path, target_shape="rotation", force_write=False):
+def modify_json_file(json_file_path, target_shape="rotation", force_write=False, compact=False):
+    """
+    Convert the shapes of a LabelMe json to target_shape in place.
+    The file is only rewritten when its bytes change, compact writes it on one line.
+    """
     assert target_shape in ["rotation", "rectangle"]
+    import cv2  # only here, so the label code importing clip_boxes runs without OpenCV
 
-    with open(json_file_path, 'r') as file:
-        data = json.load(file)
-        print(f"load {json_file_path}")
+    with open(json_file_path, 'rb') as file:
+        raw = file.read()
+    data = loads(raw)
+    log(f"load {json_file_path}", 2)
     shapes = data["shapes"]
     img_w, img_h = float(data["imageWidth"]), float(data["imageHeight"])
 
@@ -176,15 +205,16 @@ def modify_json_file(json_file_path, target_shape="rotation", force_write=False)
             shape["points"] = rect_points
         shape["shape_type"] = target_shape
 
-    if modified_flag:
-        with open(json_file_path, 'w') as file:
-            json.dump(data, file, indent=2)
-            print(f"write {json_file_path}")
+    if modified_flag and write_if_changed(json_file_path, dumps(data, compact), raw):
+        log(f"write {json_file_path}", 2)
+        count("json_files_modified")
     else:
-        print(f"no change to {json_file_path}")
+        log(f"no change to {json_file_path}", 2)
+        count("json_files_unchanged")
 
 
-def modify_json_folder(json_folder, target_shape="rotation", force_write=False):
-    for filename in os.listdir(json_folder):
-        if filename.endswith('.json'):
-            modify_json_file(os.path.join(json_folder, filename), target_shape, force_write)
+@reported
+def modify_json_folder(json_folder, target_shape="rotation", force_write=False, workers=1, compact=False):
+    tasks = [(os.path.join(json_folder, filename), target_shape, force_write, compact)
+             for filename in sorted(os.listdir(json_folder)) if filename.endswith('.json')]
+    return run_tasks(modify_json_file, tasks, workers, json_folder)
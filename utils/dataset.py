@@ -0,0 +1,124 @@
+import os
+import cv2
+import numpy as np
+from collections import OrderedDict
+
+from utils.rotation import rotate_image
+from utils.labels import load_label, write_label, rotate_obb_boxes, rotate_rect_boxes, label_groups, variant_names
+
+
+class AugmentedDataset:
+    """
+    The flip/rotation augmented version of one split of a dataset, computed on demand instead of written to disk.
+    Index i is the variant i % (2 * len(angle_list)) of the source file i // (2 * len(angle_list)),
+    variants are in the same order and have the same names as the files of creat_single_x / creat_dual_x.
+    Decoded source images are kept in a small LRU cache, so reading the variants of a source in a row decodes it once.
+
+    A sample is a dict with
+        name: file name without suffix, e.g. "1335312323_1090"
+        images: list of BGR images, one per image folder
+        classes: (N,) int array
+        labels: (N, 4, 2) normalized OBB corners, or (N, 4) normalized xywh for label_type "rect"
+    box_filter, a geometry.BoxFilter, filters the OBB boxes like it does in creat_single_x.
+    """
+
+    def __init__(self, dataset_path, split="train", angle_list=None, label_type="obb",
+                 image_folders=("images", "image"), label_folder="labels", cache_size=4, box_filter=None):
+        if angle_list is None:
+            angle_list = [0, 90, 180, 270]
+        self.dataset_path = dataset_path
+        self.split = split
+        self.angle_list = list(angle_list)
+        self.label_type = label_type
+        self.image_folders = [f for f in image_folders if os.path.isdir(os.path.join(dataset_path, f, split))]
+        self.label_folder = label_folder
+        self.cache_size = cache_size
+        self.box_filter = box_filter
+        self.cache = OrderedDict()
+
+        if not self.image_folders:
+            raise FileNotFoundError(f"none of the image folders {list(image_folders)} of split {split} "
+                                    f"exists in {dataset_path}")
+        image_dir = os.path.join(dataset_path, self.image_folders[0], split)
+        self.filenames = sorted(f for f in os.listdir(image_dir) if f.endswith("png"))
+        self.variants = [(a, f) for a in self.angle_list for f in [False, True]]
+
+    def __len__(self):
+        return len(self.filenames) * len(self.variants)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def locate(self, index):
+        """index -> (source file name, angle, flip)"""
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"index {index} out of range for {len(self)} samples")
+        angle, flip = self.variants[index % len(self.variants)]
+        return self.filenames[index // len(self.variants)], angle, flip
+
+    def load_source(self, filename):
+        if filename in self.cache:
+            self.cache.move_to_end(filename)
+            return self.cache[filename]
+
+        images = []
+        for folder in self.image_folders:
+            image_path = os.path.join(self.dataset_path, folder, self.split, filename)
+            images.append(cv2.imread(image_path))
+            if images[-1] is None:
+                raise FileNotFoundError(f"cannot read {image_path}")
+        label_path = os.path.join(self.dataset_path, self.label_folder, self.split, filename[:-4] + ".txt")
+        num_values = 8 if self.label_type == "obb" else 4
+        if os.path.exists(label_path):
+            class_list, values, _ = load_label([label_path], num_values)
+        else:
+            class_list, values = [], np.zeros((0, num_values))
+        if self.box_filter is not None and self.label_type == "obb":
+            unique = ~self.box_filter.duplicate_mask(values.reshape(-1, 4, 2), label_groups(class_list, [len(values)]))
+            class_list, values = [c for c, u in zip(class_list, unique) if u], values[unique]
+
+        self.cache[filename] = (images, class_list, values)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return self.cache[filename]
+
+    def __getitem__(self, index):
+        filename, angle, flip = self.locate(index)
+        images, class_list, values = self.load_source(filename)
+        img_height, img_width = images[0].shape[:2]
+        img_sizes = np.tile([float(img_width), float(img_height)], (len(values), 1))
+
+        if self.label_type == "obb":
+            rotated, keep = rotate_obb_boxes(values.reshape(-1, 4, 2), angle, flip, img_sizes, self.box_filter)
+            labels = rotated[keep]
+            class_list = [c for c, k in zip(class_list, keep) if k]
+        else:
+            labels = rotate_rect_boxes(values, angle, flip, img_sizes)
+
+        # angle 0 without flip returns the cached image itself
+        new_images = [rotate_image(img, angle, flip) for img in images]
+        new_images = [img.copy() if img is src else img for img, src in zip(new_images, images)]
+        return {
+            "name": variant_names(filename, [angle], "", [(angle, flip)])[0],
+            "images": new_images,
+            "classes": np.array(class_list, dtype=np.int64),
+            "labels": labels,
+        }
+
+    def export(self, output_dataset_path):
+        """Write the split as real files, laid out like the output of creat_single_x / creat_dual_x."""
+        dst_folders = [os.path.join(output_dataset_path, folder, self.split) for folder in self.image_folders]
+        dst_label_folder = os.path.join(output_dataset_path, "labels", self.split)
+        for folder in dst_folders + [dst_label_folder]:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+
+        for sample in self:
+            for folder, img in zip(dst_folders, sample["images"]):
+                cv2.imwrite(os.path.join(folder, sample["name"] + ".png"), img)
+            labels = sample["labels"].reshape(len(sample["classes"]), -1)
+            write_label([os.path.join(dst_label_folder, sample["name"] + ".txt")],
+                        sample["classes"].tolist(), labels, [len(labels)])
@@ -0,0 +1,91 @@
+import io
+import time
+import numpy as np
+
+# the zlib strategies, the values of cv2.IMWRITE_PNG_STRATEGY_*
+# cv2 is imported where images are encoded, so the command line can list these without loading OpenCV
+PNG_STRATEGIES = {
+    "default": 0,
+    "filtered": 1,
+    "huffman_only": 2,
+    "rle": 3,
+    "fixed": 4,
+}
+IMAGE_FORMATS = ["png", "webp", "bmp", "tiff", "npy"]
+
+
+class ImageEncoder:
+    """
+    Output format of the generated images.
+        png: png_compression is the zlib level 0-9, png_strategy a key of PNG_STRATEGIES,
+             leaving both None writes the same files as plain cv2.imwrite
+        webp: lossless webp
+        bmp, tiff: uncompressed
+        npy: the raw array saved with np.save, the fastest to write and read back
+    """
+
+    def __init__(self, fmt="png", png_compression=None, png_strategy=None):
+        import cv2
+        assert fmt in IMAGE_FORMATS
+        self.fmt = fmt
+        self.png_compression = png_compression
+        self.png_strategy = png_strategy
+        self.suffix = "." + fmt
+        self.params = []
+        if fmt == "png":
+            if png_compression is not None:
+                self.params += [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+            if png_strategy is not None:
+                self.params += [cv2.IMWRITE_PNG_STRATEGY, PNG_STRATEGIES[png_strategy]]
+        elif fmt == "webp":
+            self.params = [cv2.IMWRITE_WEBP_QUALITY, 101]  # above 100 is lossless
+        elif fmt == "tiff":
+            self.params = [cv2.IMWRITE_TIFF_COMPRESSION, 1]  # COMPRESSION_NONE
+
+    def __repr__(self):
+        if self.fmt != "png" or (self.png_compression is None and self.png_strategy is None):
+            return f"ImageEncoder({self.fmt!r})"
+        return f"ImageEncoder({self.fmt!r}, {self.png_compression!r}, {self.png_strategy!r})"
+
+    def describe(self):
+        return {"format": self.fmt, "params": self.params}
+
+    def encode(self, img):
+        """The bytes write() would store."""
+        if self.fmt == "npy":
+            f = io.BytesIO()
+            np.save(f, img)
+            return f.getbuffer()
+        import cv2
+        ok, buffer = cv2.imencode(self.suffix, img, self.params)
+        if not ok:
+            raise OSError(f"cannot encode image as {self.fmt}")
+        return buffer
+
+    def write(self, output_path, img):
+        import cv2
+        if self.fmt == "npy":
+            np.save(output_path, img)
+        elif not cv2.imwrite(output_path, img, self.params):
+            raise OSError(f"cannot write {output_path}")
+
+
+def benchmark_encoders(images, encoders, repeat=3):
+    """
+    Encode every image with every encoder, returns one dict per encoder with the mean encode time
+    per image in ms and the mean size per image in bytes.
+    """
+    results = []
+    for encoder in encoders:
+        best = float("inf")
+        size = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            size = sum(len(encoder.encode(img)) for img in images)
+            best = min(best, time.perf_counter() - start)
+        results.append({
+            "encoder": repr(encoder),
+            "ms_per_image": best / len(images) * 1000,
+            "bytes_per_image": size / len(images),
+        })
+    return results
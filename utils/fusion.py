@@ -2,16 +2,149 @@ import os
 import cv2
 import numpy as np
 
+from utils.instrument import count, stage
+from utils.pipeline import decode_image
 
-def combine_image(img_path1, img_path2, output_path):
-    img1 = cv2.imread(img_path1, cv2.IMREAD_GRAYSCALE)
-    img2 = cv2.imread(img_path2, cv2.IMREAD_GRAYSCALE)
+# channel sources of the fused image, computed from the forward (img1) and backward (img2) grayscale images
+CHANNEL_SOURCES = ["forward", "backward", "avg", "diff", "rdiff", "absdiff", "zero"]
+# (B, G, R) channel maps
+FUSION_MODES = {
+    "avg": ("avg", "backward", "forward"),  # combine_image
+    "diff": ("diff", "forward", "backward"),  # combine_image_diff on grayscale input
+    "absdiff": ("absdiff", "forward", "backward"),
+}
 
-    avg_value = (img1.astype(int) + img2.astype(int)) // 2
-    avg_value = avg_value.astype('uint8')
 
-    bgr_img = cv2.merge((avg_value, img2, img1))
-    cv2.imwrite(output_path, bgr_img)
+def channel_plane(source, img1, img2):
+    """One channel as a contiguous uint8 array, img1 and img2 may be stacks (..., H, W) of a whole split."""
+    if source == "forward":
+        return img1
+    elif source == "backward":
+        return img2
+    elif source == "avg":
+        # floor((a + b) / 2) without widening: (a & b) + ((a ^ b) >> 1)
+        plane = np.bitwise_and(img1, img2)
+        half = np.bitwise_xor(img1, img2)
+        half >>= 1
+        plane += half
+        return plane
+    elif source == "diff":  # saturated img1 - img2, as cv2.subtract
+        return img1 - np.minimum(img1, img2)
+    elif source == "rdiff":
+        return img2 - np.minimum(img1, img2)
+    elif source == "absdiff":
+        return np.maximum(img1, img2) - np.minimum(img1, img2)
+    elif source == "zero":
+        return np.zeros_like(img1)
+    raise ValueError(f"unknown channel source {source}, expected one of {CHANNEL_SOURCES}")
+
+
+def fuse(img1, img2, mode="avg", out=None):
+    """
+    Fuse decoded grayscale forward/backward images into one BGR image.
+    mode is a key of FUSION_MODES or a custom (B, G, R) tuple of CHANNEL_SOURCES.
+    img1 and img2 can also be (N, H, W) stacks, then the result is (N, H, W, 3).
+    The channels are merged straight into out when it is given (preallocated, same size, uint8).
+    """
+    channel_map = FUSION_MODES[mode] if isinstance(mode, str) else tuple(mode)
+    assert len(channel_map) == 3
+    img1, img2 = np.asarray(img1, dtype=np.uint8), np.asarray(img2, dtype=np.uint8)
+    if out is None:
+        out = np.empty(img1.shape + (3,), dtype=np.uint8)
+    planes = [channel_plane(source, img1, img2) for source in channel_map]
+    if img1.ndim == 2:
+        cv2.merge(planes, dst=out)
+    else:
+        for i in range(len(img1)):
+            cv2.merge([plane[i] for plane in planes], dst=out[i])
+    return out
+
+
+class ImageFusion:
+    """A fusion mode as a picklable callable, fusion(img1, img2) -> BGR image."""
+
+    def __init__(self, mode="avg"):
+        if isinstance(mode, str):
+            assert mode in FUSION_MODES
+        else:
+            mode = tuple(mode)
+            assert len(mode) == 3 and all(source in CHANNEL_SOURCES for source in mode)
+        self.mode = mode
+
+    def __repr__(self):
+        return f"ImageFusion({self.mode!r})"
+
+    def __call__(self, img1, img2, out=None):
+        return fuse(img1, img2, self.mode, out)
+
+
+def fuse_image(img1, img2):
+    """RGB channel fusion of two decoded grayscale images, the image combine_image writes."""
+    return fuse(img1, img2, "avg")
+
+
+def combine_image(img_path1, img_path2, output_path, mode="avg"):
+    with stage("decode"):
+        img1 = cv2.imread(img_path1, cv2.IMREAD_GRAYSCALE)
+        img2 = cv2.imread(img_path2, cv2.IMREAD_GRAYSCALE)
+    with stage("fuse"):
+        fused = fuse(img1, img2, mode)
+    with stage("encode"):
+        cv2.imwrite(output_path, fused)
+    count("images_fused")
+
+
+def combine_outputs(task, data):
+    """combine_image in a utils.pipeline.Pipeline, data holds the bytes of the two images."""
+    img_path1, img_path2, output_path, mode = task
+    with stage("decode"):
+        img1 = decode_image(data[0], img_path1, cv2.IMREAD_GRAYSCALE)
+        img2 = decode_image(data[1], img_path2, cv2.IMREAD_GRAYSCALE)
+    if img1.shape != img2.shape:
+        raise ValueError(f"cannot fuse {os.path.basename(img_path1)}: size mismatch")
+    with stage("fuse"):
+        fused = fuse(img1, img2, mode)
+    with stage("encode"):
+        ok, buffer = cv2.imencode(".png", fused)
+    if not ok:
+        raise OSError(f"cannot encode {output_path}")
+    count("images_fused")
+    return [(output_path, buffer)]
+
+
+def combine_folder(img1_folder, img2_folder, output_folder, filenames=None, mode="avg", pipeline=None):
+    """
+    combine_image for a whole split, the pairs are fused and written one at a time into one preallocated buffer
+    per image size, so the memory used does not grow with the split.
+    filenames defaults to every png of img1_folder.
+    With pipeline, a utils.pipeline.Pipeline, the pairs are fused on its threads instead,
+    reading the next pairs and writing the last ones meanwhile.
+    """
+    if filenames is None:
+        filenames = sorted(f for f in os.listdir(img1_folder) if f.endswith("png"))
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+    if pipeline is not None:
+        tasks = [(os.path.join(img1_folder, f), os.path.join(img2_folder, f), os.path.join(output_folder, f), mode)
+                 for f in filenames]
+        errors = pipeline.run(tasks, lambda task: task[:2], combine_outputs, output_folder)
+        if errors:
+            raise ValueError(f"cannot fuse {len(errors)} pairs of {img1_folder}")
+        return
+    buffers = {}
+    for filename in filenames:
+        with stage("decode"):
+            img1 = cv2.imread(os.path.join(img1_folder, filename), cv2.IMREAD_GRAYSCALE)
+            img2 = cv2.imread(os.path.join(img2_folder, filename), cv2.IMREAD_GRAYSCALE)
+        if img1 is None or img2 is None or img1.shape != img2.shape:
+            raise ValueError(f"cannot fuse {filename}: missing image or size mismatch")
+        if img1.shape not in buffers:
+            buffers[img1.shape] = np.empty(img1.shape + (3,), dtype=np.uint8)
+        with stage("fuse"):
+            fused = fuse(img1, img2, mode, buffers[img1.shape])
+        with stage("encode"):
+            cv2.imwrite(os.path.join(output_folder, filename), fused)
+        count("images_fused")
 
 
 def combine_image_diff(img_path1, img_path2, output_path):
@@ -20,13 +153,10 @@ def combine_image_diff(img_path1, img_path2, output_path):
     img3 = cv2.subtract(img1, img2)
     # img3 = cv2.absdiff(img1, img2)
 
+    # the difference is taken on the color images, so its gray channel is not the "diff" fusion mode
     gray1 = cv2.cvtColor(img1, cv2.COLOR_BGR2GRAY)
     gray2 = cv2.cvtColor(img2, cv2.COLOR_BGR2GRAY)
     gray3 = cv2.cvtColor(img3, cv2.COLOR_BGR2GRAY)
 
-    merged_image = np.zeros_like(img1)
-    merged_image[:, :, 0] = gray3  # B
-    merged_image[:, :, 1] = gray1  # G
-    merged_image[:, :, 2] = gray2  # R
-
+    merged_image = cv2.merge((gray3, gray1, gray2))  # B, G, R
     cv2.imwrite(output_path, merged_image)
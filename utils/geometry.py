@@ -0,0 +1,171 @@
+import numpy as np
+
+
+def polygon_area(points, num_points=None):
+    """
+    Shoelace area of (N, K, 2) polygons. With num_points only the first num_points[i] vertices of row i are used,
+    the others must repeat the first vertex (as clip_polygons returns them).
+    """
+    x, y = points[..., 0], points[..., 1]
+    area = 0.5 * np.abs((x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y).sum(axis=-1))
+    if num_points is not None:
+        area[num_points < 3] = 0.0
+    return area
+
+
+def clip_polygons(subject, clip):
+    """
+    Sutherland-Hodgman clipping of (N, K, 2) polygons by (N, M, 2) convex polygons, for all rows at once.
+    Both must have the same orientation. Returns (N, K + M, 2) vertices, padded with the first vertex, and
+    the number of vertices of each result.
+    """
+    n, k = subject.shape[:2]
+    size = k + clip.shape[1]
+    points = np.empty((n, size, 2))
+    points[:, :k] = subject
+    points[:, k:] = subject[:, :1]
+    count = np.full(n, k)
+    rows = np.arange(n)[:, None]
+    orientation = np.sign(polygon_signed_area(clip))[:, None]
+
+    for e in range(clip.shape[1]):
+        p, q = clip[:, e][:, None], clip[:, (e + 1) % clip.shape[1]][:, None]
+        # side of every vertex relative to the edge p -> q, > 0 is inside for the orientation of clip
+        cur = points
+        nxt = np.roll(points, -1, axis=1)
+        index = np.arange(size)[None]
+        nxt = np.where((index == count[:, None] - 1)[..., None], points[:, :1], nxt)
+        side_cur = orientation * cross(q - p, cur - p)
+        side_nxt = orientation * cross(q - p, nxt - p)
+        valid = index < count[:, None]
+        in_cur, in_nxt = side_cur >= 0, side_nxt >= 0
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t = side_cur / (side_cur - side_nxt)
+            crossing = cur + t[..., None] * (nxt - cur)
+
+        # for every edge cur -> nxt: keep cur if inside, then the crossing point if the edge crosses
+        out = np.stack([cur, crossing], axis=2).reshape(n, 2 * size, 2)
+        keep = np.stack([valid & in_cur, valid & (in_cur != in_nxt)], axis=2).reshape(n, 2 * size)
+        order = np.argsort(~keep, axis=1, kind="stable")[:, :size]
+        count = np.minimum(keep.sum(axis=1), size)
+        points = out[rows, order]
+        points = np.where(np.arange(size)[None, :, None] < count[:, None, None], points, points[:, :1])
+    return points, count
+
+
+def cross(u, v):
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
+def polygon_signed_area(points):
+    x, y = points[..., 0], points[..., 1]
+    return 0.5 * (x * np.roll(y, -1, axis=-1) - np.roll(x, -1, axis=-1) * y).sum(axis=-1)
+
+
+def intersection_polygons(boxes1, boxes2):
+    """Intersection of pairs of (N, 4, 2) convex quadrilaterals of any orientation, as clip_polygons returns it."""
+    signs = np.sign(polygon_signed_area(boxes1)) != np.sign(polygon_signed_area(boxes2))
+    boxes2 = np.where(signs[:, None, None], boxes2[:, ::-1], boxes2)
+    return clip_polygons(boxes1, boxes2)
+
+
+def intersection_area(boxes1, boxes2):
+    """Area of the intersection of pairs of (N, 4, 2) convex quadrilaterals."""
+    return polygon_area(*intersection_polygons(boxes1, boxes2))
+
+
+def rotated_iou(boxes1, boxes2):
+    """IoU of pairs of (N, 4, 2) rotated boxes."""
+    inter = intersection_area(boxes1, boxes2)
+    union = polygon_area(boxes1) + polygon_area(boxes2) - inter
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, inter / union, 0.0)
+
+
+def canvas_boxes(n, width=1.0, height=1.0):
+    """n copies of the [0, width] x [0, height] canvas as (n, 4, 2) boxes."""
+    return np.tile(np.array([[0.0, 0.0], [width, 0.0], [width, height], [0.0, height]]), (n, 1, 1))
+
+
+def visible_area(boxes, width=1.0, height=1.0):
+    """Area of the part of (N, 4, 2) boxes inside the [0, width] x [0, height] canvas."""
+    return intersection_area(boxes, canvas_boxes(len(boxes), width, height))
+
+
+class BoxFilter:
+    """
+    Drops normalized OBB boxes before they are clipped, on the whole array of boxes at once:
+        min_area: the part inside the image is smaller than this fraction of the image
+        min_visibility: less than this fraction of the box is inside the image
+        iou_threshold: the rotated IoU with an earlier kept box of the same group, e.g. the same file and class,
+                       is at least this, so of duplicates and near duplicates only the first box is kept
+    None disables a test.
+    The IoU of normalized boxes does not change with the flips and rotations, so duplicate_mask runs once per
+    source, keep_mask once per variant.
+    """
+
+    def __init__(self, min_area=None, min_visibility=None, iou_threshold=None):
+        self.min_area = min_area
+        self.min_visibility = min_visibility
+        self.iou_threshold = iou_threshold
+
+    def __repr__(self):
+        return f"BoxFilter({self.min_area!r}, {self.min_visibility!r}, {self.iou_threshold!r})"
+
+    def keep_mask(self, boxes, keep=None):
+        """Mask of the (N, 4, 2) boxes large and visible enough, keep is the mask of the boxes still in the running."""
+        keep = np.ones(len(boxes), dtype=bool) if keep is None else keep.copy()
+        if self.min_area is None and self.min_visibility is None:
+            return keep
+        # only boxes with a corner outside the image lose area
+        x, y = boxes[..., 0], boxes[..., 1]
+        rows = np.flatnonzero(keep & ~((0 <= x) & (x <= 1) & (0 <= y) & (y <= 1)).all(axis=1))
+        area = np.zeros(len(boxes))
+        area[keep] = polygon_area(boxes[keep])
+        visible = area.copy()
+        visible[rows] = visible_area(boxes[rows])
+        if self.min_area is not None:
+            keep &= visible >= self.min_area
+        if self.min_visibility is not None:
+            with np.errstate(divide="ignore", invalid="ignore"):
+                keep &= np.where(area > 0, visible / area, 0.0) >= self.min_visibility
+        return keep
+
+    def duplicate_mask(self, boxes, groups=None, keep=None):
+        """
+        Mask of the (N, 4, 2) boxes that duplicate an earlier kept box, greedily in array order.
+        groups, an (N,) int array, limits the search to boxes with the same value.
+        """
+        duplicate = np.zeros(len(boxes), dtype=bool)
+        if self.iou_threshold is None:
+            return duplicate
+        candidates = np.arange(len(boxes)) if keep is None else np.flatnonzero(keep)
+        if groups is None:
+            groups = np.zeros(len(boxes), dtype=np.int64)
+        # every pair i < j of candidates in the same group
+        pairs = [rows[np.stack(np.triu_indices(len(rows), 1))] for rows in group_rows(candidates, groups[candidates])]
+        i, j = np.concatenate(pairs, axis=1) if pairs else np.zeros((2, 0), dtype=np.int64)
+        # the axis aligned bounds must overlap before the polygons are intersected
+        low, high = boxes.min(axis=1), boxes.max(axis=1)
+        overlap = (np.maximum(low[i], low[j]) < np.minimum(high[i], high[j])).all(axis=1)
+        i, j = i[overlap], j[overlap]
+        similar = rotated_iou(boxes[i], boxes[j]) >= self.iou_threshold
+        for a, b in sorted(zip(i[similar].tolist(), j[similar].tolist())):
+            if not duplicate[a]:
+                duplicate[b] = True
+        return duplicate
+
+
+def make_box_filter(min_area=None, min_visibility=None, iou_threshold=None):
+    """A BoxFilter of the settings, None when they are all None."""
+    if (min_area, min_visibility, iou_threshold) == (None, None, None):
+        return None
+    return BoxFilter(min_area, min_visibility, iou_threshold)
+
+
+def group_rows(rows, groups):
+    """Split rows by their group value, keeping their order inside each group."""
+    order = np.argsort(groups, kind="stable")
+    splits = np.flatnonzero(np.diff(groups[order])) + 1
+    return [rows[part] for part in np.split(order, splits) if len(part) > 1]
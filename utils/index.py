@@ -0,0 +1,241 @@
+import os
+import numpy as np
+
+from utils.utility import CLASS_NAMES, png_size
+from utils.manifest import file_hash
+from utils.geometry import polygon_area
+from utils.parallel import run_tasks, resolve_workers
+from utils.jsonio import load_json, dumps, write_if_changed
+from utils.instrument import log, count, stage, reported
+
+INDEX_NAME = ".index.json"
+IMAGE_FOLDERS = ["images", "image"]
+LABEL_FOLDERS = ["labels", "labels_rect"]
+# upper edges of the box size bins, a box size being the square root of its area as a fraction of the image
+BOX_SIZE_BINS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0]
+# labels are written with 7 decimals, coordinates this far outside [0, 1] are rounding
+TOLERANCE = 1e-6
+
+
+def file_signature(file_path, known=None):
+    """[size, mtime, sha1] of a file, the hash of known, an older signature, is reused if size and mtime match."""
+    st = os.stat(file_path)
+    if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+        count("files_unchanged")
+        return known
+    count("files_hashed")
+    return [st.st_size, st.st_mtime_ns, file_hash(file_path)]
+
+
+def read_label_file(label_path, num_classes):
+    """(classes, box sizes, problems) of a YOLO OBB (9 values a line) or xywh (5 values a line) label file."""
+    classes, sizes, problems = [], [], []
+    with open(label_path, 'r', encoding="utf-8") as f:
+        lines = [line.split() for line in f if line.strip()]
+    for n, parts in enumerate(lines, 1):
+        if len(parts) not in (5, 9):
+            problems.append(f"line {n}: {len(parts)} values, expected 5 (xywh) or 9 (OBB)")
+            continue
+        try:
+            c, values = int(parts[0]), np.array(parts[1:], dtype=np.float64)
+        except ValueError:
+            problems.append(f"line {n}: not a class index and numbers")
+            continue
+        if not 0 <= c < num_classes:
+            problems.append(f"line {n}: class {c} is not in 0..{num_classes - 1}")
+        if len(values) == 8:
+            low, high = values.min(), values.max()
+            area = polygon_area(values.reshape(1, 4, 2))[0]
+        else:
+            x, y, w, h = values
+            low, high = min(x - w / 2, y - h / 2), max(x + w / 2, y + h / 2)
+            area = w * h
+        if low < -TOLERANCE or high > 1 + TOLERANCE:
+            problems.append(f"line {n}: coordinates outside [0, 1]")
+        classes.append(c)
+        sizes.append(np.sqrt(max(area, 0.0)))
+    return classes, sizes, problems
+
+
+def image_name(folder_path, stem):
+    """The file of stem in an image folder, png or any other format the encoders write, None if there is none."""
+    for suffix in (".png", ".webp", ".bmp", ".tiff", ".npy"):
+        if os.path.exists(os.path.join(folder_path, stem + suffix)):
+            return stem + suffix
+    return None
+
+
+def index_batch(stems, dataset_path, split, image_folders, label_folders, known_files, num_classes):
+    """
+    Index the samples of one split named stems: the signature of every file, the image sizes read from the png
+    headers (images are never decoded) and the label statistics, with the problems found.
+    """
+    samples, files, problems = {}, {}, []
+    classes_total = np.zeros(num_classes, dtype=np.int64)
+    box_sizes = np.zeros(len(BOX_SIZE_BINS), dtype=np.int64)
+
+    for stem in stems:
+        entry = {"sizes": {}, "boxes": {}, "classes": {}}
+        names = {folder: image_name(os.path.join(dataset_path, folder, split), stem) for folder in image_folders}
+        images = sum(name is not None for name in names.values())
+        for folder, name in names.items():
+            if name is None:
+                if images:
+                    problems.append([f"{folder}/{split}/{stem}.png", "missing, other image folders have this sample"])
+                continue
+            rel = f"{folder}/{split}/{name}"
+            path = os.path.join(dataset_path, rel)
+            with stage("index_hash"):
+                files[rel] = file_signature(path, known_files.get(rel))
+            if name.endswith(".png"):
+                with stage("index_header"):
+                    try:
+                        entry["sizes"][folder] = list(png_size(path))
+                    except ValueError as e:
+                        problems.append([rel, str(e)])
+        count("images", images)
+        if len({tuple(size) for size in entry["sizes"].values()}) > 1:
+            sizes = ", ".join(f"{folder} {w}x{h}" for folder, (w, h) in entry["sizes"].items())
+            problems.append([f"{split}/{stem}", f"image sizes differ: {sizes}"])
+
+        for folder in label_folders:
+            rel = f"{folder}/{split}/{stem}.txt"
+            path = os.path.join(dataset_path, rel)
+            if not os.path.exists(path):
+                count("images_unlabeled")
+                continue
+            if image_folders and images == 0:
+                problems.append([rel, "label without image"])
+            with stage("index_hash"):
+                files[rel] = file_signature(path, known_files.get(rel))
+            with stage("index_labels"):
+                classes, sizes, label_problems = read_label_file(path, num_classes)
+            problems += [[rel, problem] for problem in label_problems]
+            histogram = np.bincount([c for c in classes if 0 <= c < num_classes], minlength=num_classes)
+            entry["boxes"][folder] = len(classes)
+            entry["classes"][folder] = histogram.tolist()
+            if folder == label_folders[0]:
+                classes_total += histogram
+                bins = np.minimum(np.searchsorted(BOX_SIZE_BINS, sizes), len(BOX_SIZE_BINS) - 1)
+                box_sizes += np.bincount(bins, minlength=len(BOX_SIZE_BINS))
+            count("boxes", len(classes))
+        samples[f"{split}/{stem}"] = entry
+    count("samples", len(stems))
+    return {"samples": samples, "files": files, "problems": problems,
+            "classes": classes_total.tolist(), "box_sizes": box_sizes.tolist()}
+
+
+def list_samples(dataset_path, split, image_folders, label_folders):
+    """Sorted stems of every file of a split, in any of the folders."""
+    stems = set()
+    for folder in image_folders + label_folders:
+        folder_path = os.path.join(dataset_path, folder, split)
+        if os.path.isdir(folder_path):
+            stems.update(os.path.splitext(name)[0] for name in os.listdir(folder_path))
+    return sorted(stems)
+
+
+@reported
+def build_index(dataset_path, workers=1, class_names=None, index_path=None):
+    """
+    Validate a dataset root laid out like data/ (images/, image/, labels/, labels_rect/ with train/ and val/)
+    or like a generated dataset, in parallel, and write the index to index_path, <dataset_path>/.index.json
+    by default. Files whose size and mtime did not change since the last index are not hashed again.
+
+    The index holds
+        files: relative path -> [size, mtime, sha1] of every image and label file
+        samples: "<split>/<stem>" -> image (width, height) per image folder, box count and class histogram
+                 per label folder
+        summary: samples, class histogram and box size histogram (BOX_SIZE_BINS) of the first label folder
+        problems: [path, message] for missing pair members, labels without image, image size mismatches
+                  between the modalities and malformed label lines
+    Returns the index.
+    """
+    if class_names is None:
+        class_names = CLASS_NAMES
+    if index_path is None:
+        index_path = os.path.join(dataset_path, INDEX_NAME)
+    image_folders = [f for f in IMAGE_FOLDERS if os.path.isdir(os.path.join(dataset_path, f))]
+    label_folders = [f for f in LABEL_FOLDERS if os.path.isdir(os.path.join(dataset_path, f))]
+    old = DatasetIndex.load(dataset_path, index_path)
+    known_files = old.files if old is not None else {}
+
+    # the old signatures by sample, so every batch only carries those of its own files
+    known_by_sample = {}
+    for rel, signature in known_files.items():
+        folder, split, name = rel.split("/", 2)
+        known_by_sample.setdefault(f"{split}/{os.path.splitext(name)[0]}", {})[rel] = signature
+
+    tasks = []
+    for split in ["train", "val"]:
+        stems = list_samples(dataset_path, split, image_folders, label_folders)
+        n = min(resolve_workers(workers) * 4, len(stems))  # a few batches per worker
+        for i in range(n):
+            batch = stems[i * len(stems) // n:(i + 1) * len(stems) // n]
+            known = {rel: signature for stem in batch
+                     for rel, signature in known_by_sample.get(f"{split}/{stem}", {}).items()}
+            tasks.append((batch, dataset_path, split, image_folders, label_folders, known, len(class_names)))
+
+    index = {"files": {}, "samples": {}, "problems": []}
+    classes = np.zeros(len(class_names), dtype=np.int64)
+    box_sizes = np.zeros(len(BOX_SIZE_BINS), dtype=np.int64)
+
+    def merge(task, result):
+        nonlocal classes, box_sizes
+        index["files"].update(result["files"])
+        index["samples"].update(result["samples"])
+        index["problems"] += result["problems"]
+        classes += result["classes"]
+        box_sizes += result["box_sizes"]
+
+    errors = run_tasks(index_batch, tasks, workers, dataset_path, merge)
+    index["problems"] += [[f"{task[2]}/{task[0][0]}..{task[0][-1]}", error] for task, error in errors]
+    index["files"] = dict(sorted(index["files"].items()))
+    index["samples"] = dict(sorted(index["samples"].items()))
+    index["problems"].sort()
+    index["summary"] = {
+        "samples": len(index["samples"]),
+        "image_folders": image_folders,
+        "label_folders": label_folders,
+        "classes": dict(zip(class_names, classes.tolist())),
+        "box_sizes": dict(zip([str(edge) for edge in BOX_SIZE_BINS], box_sizes.tolist())),
+        "problems": len(index["problems"]),
+    }
+    write_if_changed(index_path, dumps(index, compact=True))
+
+    for path, problem in index["problems"]:
+        log(f"{path}: {problem}", 0)
+    summary = index["summary"]
+    log(f"{summary['samples']} samples, {summary['problems']} problems")
+    log(f"classes: {summary['classes']}")
+    log(f"box sizes (sqrt of the area fraction, upper bin edge): {summary['box_sizes']}")
+    return index
+
+
+class DatasetIndex:
+    """The files of an index written by build_index, for a generation run to reuse their hashes."""
+
+    def __init__(self, root, files):
+        self.root = os.path.abspath(root)
+        self.files = files
+
+    @classmethod
+    def load(cls, root, index_path=None):
+        """The index of root, None if there is none or it cannot be read."""
+        if index_path is None:
+            index_path = os.path.join(root, INDEX_NAME)
+        if not os.path.exists(index_path):
+            return None
+        try:
+            return cls(root, load_json(index_path)["files"])
+        except (ValueError, KeyError):
+            log(f"ignoring the unreadable index {index_path}", 0)
+            return None
+
+    def hash(self, file_path, st):
+        """sha1 of file_path from the index when its size and mtime, st being its os.stat, did not change."""
+        rel = os.path.relpath(os.path.abspath(file_path), self.root).replace(os.sep, "/")
+        known = self.files.get(rel)
+        if known is not None and known[0] == st.st_size and known[1] == st.st_mtime_ns:
+            return known[2]
+        return None
@@ -0,0 +1,171 @@
+import sys
+import json
+import time
+import functools
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+# 0: errors and warnings only, 1: progress and summaries, 2: every file
+VERBOSITY = 1
+
+
+def set_verbosity(level):
+    global VERBOSITY
+    VERBOSITY = level
+
+
+def log(message, level=1, **print_kwargs):
+    """print message when the verbosity is at least level."""
+    if level <= VERBOSITY:
+        print(message, **print_kwargs)
+
+
+class Stats:
+    """
+    Counters (files, boxes processed and skipped...) and accumulated time per stage.
+    Safe to update from the threads of utils.pipeline, the stage times of threads running together add up.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.seconds = defaultdict(float)
+        self.lock = threading.Lock()
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += int(n)
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.seconds[name] += elapsed
+
+    def snapshot(self):
+        return {"counters": dict(self.counters), "seconds": dict(self.seconds)}
+
+    def merge(self, snapshot):
+        for name, n in snapshot["counters"].items():
+            self.counters[name] += n
+        for name, seconds in snapshot["seconds"].items():
+            self.seconds[name] += seconds
+
+    def summary(self):
+        lines = [f"{name:<24}{seconds:>10.2f}s" for name, seconds in sorted(self.seconds.items())]
+        lines += [f"{name:<24}{n:>10}" for name, n in sorted(self.counters.items())]
+        return "\n".join(lines)
+
+
+STATS = Stats()
+
+
+def count(name, n=1):
+    STATS.count(name, n)
+
+
+def stage(name):
+    """with stage("encode"): ... adds the time spent in the block to that stage."""
+    return STATS.stage(name)
+
+
+@contextmanager
+def collect():
+    """Count into a fresh Stats inside the block, to send the stats of a task back from a worker process."""
+    global STATS
+    outer, STATS = STATS, Stats()
+    try:
+        yield STATS
+    finally:
+        STATS = outer
+
+
+def reported(func):
+    """Decorator of entry points, logs a summary of the stats of each call and traces it as a "stats" event."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with collect() as stats:
+            result = func(*args, **kwargs)
+        STATS.merge(stats.snapshot())
+        trace("stats", desc=func.__name__, **stats.snapshot())
+        log(f"{func.__name__}:\n{stats.summary()}")
+        return result
+    return wrapper
+
+
+class Progress:
+    """Progress line with rate and ETA, redrawn at most every min_interval seconds."""
+
+    def __init__(self, desc, total, min_interval=0.5):
+        self.desc = desc
+        self.total = total
+        self.done = 0
+        self.min_interval = min_interval
+        self.start = self.last = time.perf_counter()
+
+    def update(self, n=1):
+        self.done += n
+        now = time.perf_counter()
+        if self.done < self.total and now - self.last < self.min_interval:
+            return
+        self.last = now
+        elapsed = now - self.start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        line = f"\r{self.desc}: {self.done}/{self.total} {rate:.1f}/s ETA {eta:.0f}s"
+        log(line, 1, end="\n" if self.done >= self.total else "", flush=True)
+
+
+_trace_file = None
+
+
+def trace(event, **fields):
+    """Append one event to the JSON-lines trace, if one is open."""
+    if _trace_file is not None:
+        _trace_file.write(json.dumps({"event": event, "time": time.time(), **fields}) + "\n")
+
+
+@contextmanager
+def tracing(trace_path=None):
+    """Write a JSON-lines trace of the block to trace_path, with the stats of the block as the last event."""
+    global _trace_file
+    if trace_path is None:
+        yield
+        return
+    _trace_file = open(trace_path, 'w', encoding="utf-8")
+    before = STATS.snapshot()
+    try:
+        yield
+    finally:
+        after = STATS.snapshot()
+        trace("summary",
+              counters={k: v - before["counters"].get(k, 0) for k, v in after["counters"].items()},
+              seconds={k: v - before["seconds"].get(k, 0.0) for k, v in after["seconds"].items()})
+        _trace_file.close()
+        _trace_file = None
+
+
+@contextmanager
+def profile(profile_path=None, limit=25):
+    """
+    Run the block under cProfile, save the stats to profile_path and print the top functions by cumulative time.
+    Worker processes are not profiled, use workers = 1 to profile everything.
+    """
+    if profile_path is None:
+        yield
+        return
+    import cProfile  # only loaded when profiling, it is a large share of the startup of short commands
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
+        if VERBOSITY >= 1:
+            pstats.Stats(profiler, stream=sys.stdout).sort_stats("cumulative").print_stats(limit)
@@ -0,0 +1,48 @@
+import os
+import json
+
+try:
+    import orjson  # optional, several times faster on LabelMe files with embedded imageData
+except ImportError:
+    orjson = None
+
+
+def loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def load_json(json_file_path):
+    with open(json_file_path, 'rb') as f:
+        return loads(f.read())
+
+
+def dumps(data, compact=False):
+    """
+    Encode to bytes, indented by 2 like json.dump(data, f, indent=2), or on one line without spaces when compact.
+    With orjson a few floats are spelled differently (1e-05 as 0.00001) and non-ascii text is not escaped,
+    the values read back are the same.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, option=0 if compact else orjson.OPT_INDENT_2)
+    if compact:
+        return json.dumps(data, separators=(",", ":")).encode()
+    return json.dumps(data, indent=2).encode()
+
+
+def write_if_changed(output_file_path, content, old_content=None):
+    """
+    Write content unless the file already holds the same bytes, it is only read when the size matches.
+    old_content, the bytes of the file when the caller already read them, saves reading it again.
+    Returns True when the file was written.
+    """
+    if old_content is None and os.path.exists(output_file_path) \
+            and os.path.getsize(output_file_path) == len(content):
+        with open(output_file_path, 'rb') as f:
+            old_content = f.read()
+    if old_content is not None and old_content == content:
+        return False
+    with open(output_file_path, 'wb') as f:
+        f.write(content)
+    return True
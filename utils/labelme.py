@@ -0,0 +1,138 @@
+import os
+import cv2
+import numpy as np
+
+from utils.converter import CLASS_MAPPING, clip_boxes, calculate_rotation_theta
+from utils.labels import format_label
+from utils.parallel import run_tasks
+from utils.jsonio import load_json, dumps, write_if_changed
+from utils.instrument import count, stage, reported
+
+
+def obb_boxes(shapes, img_w, img_h, force_write=False):
+    """
+    The 4 corners of every shape as modify_json_file(target_shape="rotation") makes them:
+    shapes that are not rotations yet go through cv2.minAreaRect, then all boxes are clipped at once.
+    Returns the (N, 4, 2) boxes and a mask of the shapes that changed.
+    """
+    boxes = np.empty((len(shapes), 4, 2), dtype=np.float64)
+    modified = np.zeros(len(shapes), dtype=bool)
+    for i, shape in enumerate(shapes):
+        if not force_write and shape["shape_type"] == "rotation":
+            boxes[i] = shape["points"][:4]
+        else:
+            rect = cv2.minAreaRect(np.array(shape["points"], dtype=np.float32))
+            boxes[i] = cv2.boxPoints(rect)
+            modified[i] = True
+    rows = np.flatnonzero(modified)
+    boxes[rows], inside = clip_boxes(boxes[rows], img_w, img_h)
+    if not inside.all():
+        box = boxes[rows[~inside][0]].tolist()
+        raise ValueError(f"rectangle {box} cannot be clipped to the {img_w}x{img_h} canvas")
+    return boxes, modified
+
+
+def rect_boxes(shapes, img_w, img_h, force_write=False):
+    """
+    The (x1, y1, x2, y2) pixel corners of every shape as modify_json_file(target_shape="rectangle") makes them,
+    cv2.boundingRect of the points, computed for all shapes at once, clipped to the image.
+    """
+    corners = np.empty((len(shapes), 4), dtype=np.float64)
+    keep = np.array([not force_write and shape["shape_type"] == "rectangle" for shape in shapes], dtype=bool)
+    for i in np.flatnonzero(keep):
+        points = np.array(shapes[i]["points"], dtype=np.float64)
+        corners[i] = [*points.min(axis=0), *points.max(axis=0)]
+    rows = np.flatnonzero(~keep)
+    if len(rows):
+        point_lists = [shapes[i]["points"] for i in rows]
+        points = np.array([p for point_list in point_lists for p in point_list], dtype=np.float32)
+        offsets = np.cumsum([0] + [len(point_list) for point_list in point_lists[:-1]])
+        # cv2.boundingRect of float points: x = floor(min x), w = floor(max x) - x + 1
+        low = np.floor(np.minimum.reduceat(points, offsets, axis=0)).astype(np.float64)
+        high = np.floor(np.maximum.reduceat(points, offsets, axis=0)).astype(np.float64) + 1
+        corners[rows] = np.concatenate([low, high], axis=1)
+        corners[rows] = np.clip(corners[rows], 0.0, [img_w, img_h, img_w, img_h])
+    return corners
+
+
+def convert_json_file(json_file_path, obb_file_path=None, rect_file_path=None, normalized_json_path=None,
+                      force_write=False, class_mapping=None, compact=False):
+    """
+    Parse one LabelMe json and write, from that single parse,
+        obb_file_path: the OBB txt of x_json_to_yolo_obb after modify_json_file(target_shape="rotation")
+        rect_file_path: the xywh txt of x_json_to_yolo_rect after modify_json_file(target_shape="rectangle")
+        normalized_json_path: the json as modify_json_file(target_shape="rotation") rewrites it,
+                              only rewritten when its bytes change, on one line when compact
+    Any of them can be None.
+    """
+    if class_mapping is None:
+        class_mapping = CLASS_MAPPING
+    with stage("json_read"):
+        data = load_json(json_file_path)
+    shapes = data["shapes"]
+    img_w, img_h = float(data["imageWidth"]), float(data["imageHeight"])
+    class_list = [str(class_mapping[shape["label"]]) for shape in shapes]
+    count("json_files")
+    count("boxes", len(shapes))
+
+    with stage("json_normalize"):
+        if obb_file_path is not None or normalized_json_path is not None:
+            boxes, modified = obb_boxes(shapes, img_w, img_h, force_write)
+        if rect_file_path is not None:
+            corners = rect_boxes(shapes, img_w, img_h, force_write)
+
+    with stage("label_write"):
+        if obb_file_path is not None:
+            values = (boxes / [img_w, img_h]).reshape(-1, 8)
+            with open(obb_file_path, 'w', encoding="utf-8") as f:
+                f.write(format_label(class_list, values, [len(shapes)])[0])
+        if rect_file_path is not None:
+            x1, y1, x2, y2 = (corners / [img_w, img_h, img_w, img_h]).T
+            values = np.stack([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], axis=-1)
+            with open(rect_file_path, 'w', encoding="utf-8") as f:
+                f.write(format_label(class_list, values, [len(shapes)])[0])
+
+    if normalized_json_path is None:
+        return
+    in_place = os.path.abspath(normalized_json_path) == os.path.abspath(json_file_path)
+    if in_place and not modified.any():
+        count("json_files_unchanged")
+        return
+    for i in np.flatnonzero(modified):
+        shape, box = shapes[i], boxes[i].tolist()
+        shape["points"] = box
+        shape["direction"] = calculate_rotation_theta(box)
+        shape["shape_type"] = "rotation"
+    with stage("json_write"):
+        if write_if_changed(normalized_json_path, dumps(data, compact)):
+            count("json_files_modified")
+        else:
+            count("json_files_unchanged")
+
+
+@reported
+def convert_json_folder(src_json_folder_path, obb_folder_path=None, rect_folder_path=None, json_folder_path=None,
+                        workers=1, force_write=False, class_names=None, compact=False):
+    """
+    convert_json_file for every json of a folder across a process pool, each output folder is optional.
+    json_folder_path can be src_json_folder_path to normalize the files in place like modify_json_folder.
+    class_names, the class index -> name list, defaults to utility.CLASS_NAMES as used by gen_yaml.
+    Returns a list of (task, error message) for the files that failed.
+    """
+    class_mapping = None if class_names is None else {name: i for i, name in enumerate(class_names)}
+    for folder_path in [obb_folder_path, rect_folder_path, json_folder_path]:
+        if folder_path is not None and not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+
+    def output_path(folder_path, filename, suffix):
+        if folder_path is None:
+            return None
+        return os.path.join(folder_path, os.path.splitext(filename)[0] + suffix)
+
+    tasks = [(os.path.join(src_json_folder_path, filename),
+              output_path(obb_folder_path, filename, ".txt"),
+              output_path(rect_folder_path, filename, ".txt"),
+              output_path(json_folder_path, filename, ".json"),
+              force_write, class_mapping, compact)
+             for filename in sorted(os.listdir(src_json_folder_path)) if filename.endswith(".json")]
+    return run_tasks(convert_json_file, tasks, workers, src_json_folder_path)
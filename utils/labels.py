@@ -0,0 +1,511 @@
+import os
+import numpy as np
+from functools import lru_cache
+from math import sin, cos, pi
+
+from utils.converter import clip_boxes
+from utils.utility import gen_yaml, png_size
+from utils.parallel import run_tasks, resolve_workers
+from utils.manifest import forget_outputs
+from utils.instrument import log, count, stage, reported
+
+
+@lru_cache(maxsize=None)
+def rotation_matrix(img_width, img_height, angle, pixel_center=False):
+    """
+    Affine matrix (2x3) of a clockwise rotation by angle around the image center,
+    on a canvas expanded to hold the whole rotated image.
+    Returns the matrix and the (width, height) of the canvas, both computed once per image size and angle.
+    The matrix maps continuous coordinates (labels), with pixel_center it maps pixel indices (cv2.warpAffine).
+    """
+    radian = pi / 180.0 * angle
+    c, s = cos(radian), sin(radian)
+    new_width = int(np.ceil(round(abs(img_width * c) + abs(img_height * s), 6)))
+    new_height = int(np.ceil(round(abs(img_width * s) + abs(img_height * c), 6)))
+    rotation = np.array([[c, -s], [s, c]])
+    center = np.array([img_width / 2.0, img_height / 2.0])
+    new_center = np.array([new_width / 2.0, new_height / 2.0])
+    if pixel_center:
+        center, new_center = center - 0.5, new_center - 0.5
+    M = np.hstack([rotation, (new_center - rotation @ center)[:, None]])
+    M.flags.writeable = False
+    return M, (new_width, new_height)
+
+
+def rotate_point(point, angle, flip_before_rotate, img_width, img_height):
+    center_point = [img_width / 2.0, img_height / 2.0]
+    x1 = img_width - point[0] if flip_before_rotate else point[0]
+    y1 = img_height - point[1]
+    x2 = center_point[0]
+    y2 = img_height - center_point[1]
+    radian = - pi / 180.0 * angle
+    x = (x1 - x2) * cos(radian) - (y1 - y2) * sin(radian) + x2
+    y = (x1 - x2) * sin(radian) + (y1 - y2) * cos(radian) + y2
+    point[0] = x
+    point[1] = img_height - y
+
+
+def is_missing(point_list, img_width, img_height):
+    """Check whether the box falls outside the image."""
+    miss_cnt = 0
+    for point in point_list:
+        if point[0] <= 0 or point[0] >= img_width or point[1] <= 0 or point[1] >= img_height:
+            miss_cnt += 1
+    return miss_cnt == 4
+
+
+def transform_points(points, angle, flip_before_rotate=False, img_width=1.0, img_height=1.0):
+    """
+    Vectorized rotate_point for an (..., 2) array of points, returns a new array.
+    The operations run in the same order as in rotate_point, so the results are bit-identical.
+    """
+    center_point = [img_width / 2.0, img_height / 2.0]
+    x1 = img_width - points[..., 0] if flip_before_rotate else points[..., 0]
+    y1 = img_height - points[..., 1]
+    x2 = center_point[0]
+    y2 = img_height - center_point[1]
+    radian = - pi / 180.0 * angle
+    c, s = cos(radian), sin(radian)
+    x = (x1 - x2) * c - (y1 - y2) * s + x2
+    y = (x1 - x2) * s + (y1 - y2) * c + y2
+    return np.stack([x, img_height - y], axis=-1)
+
+
+def transform_points_on_canvas(points, angle, flip_before_rotate, img_sizes):
+    """
+    Rotate normalized (N, ..., 2) points by any angle onto the expanded canvas of rotate_image,
+    img_sizes holds the (width, height) of the image of every row. Returns points normalized to the new canvas.
+    """
+    rotated = np.empty_like(points)
+    for size in np.unique(img_sizes, axis=0):
+        rows = (img_sizes == size).all(axis=1)
+        img_width, img_height = size
+        M, (new_width, new_height) = rotation_matrix(int(img_width), int(img_height), angle)
+        p = points[rows] * size
+        if flip_before_rotate:
+            p[..., 0] = img_width - p[..., 0]
+        rotated[rows] = (p @ M[:, :2].T + M[:, 2]) / [new_width, new_height]
+    return rotated
+
+
+def transform_label_points(points, angle, flip_before_rotate=False, img_sizes=None):
+    if angle % 90 == 0:
+        return transform_points(points, angle, flip_before_rotate)
+    if img_sizes is None:
+        raise ValueError(f"image sizes are needed to rotate labels by {angle} degrees")
+    return transform_points_on_canvas(points, angle, flip_before_rotate, img_sizes)
+
+
+def missing_mask(boxes, img_width, img_height):
+    """Vectorized is_missing for an (N, 4, 2) array of boxes."""
+    x, y = boxes[..., 0], boxes[..., 1]
+    outside = (x <= 0) | (x >= img_width) | (y <= 0) | (y >= img_height)
+    return outside.all(axis=-1)
+
+
+def outside_canvas_mask(boxes, img_width, img_height):
+    """Boxes with at least one corner outside the canvas, these need adjust_rectangle_coordinates."""
+    x, y = boxes[..., 0], boxes[..., 1]
+    inside = (0 <= x) & (x <= img_width) & (0 <= y) & (y <= img_height)
+    return ~inside.all(axis=-1)
+
+
+def parse_label(label_file_path, num_values):
+    """
+    The class strings and (N, num_values) float array of one YOLO label file,
+    a malformed line raises a ValueError naming the file and the line.
+    """
+    rows = []
+    with open(label_file_path, 'r') as f:
+        for n, line in enumerate(f, 1):
+            row = line.split()
+            if not row:
+                continue
+            if len(row) < num_values + 1:
+                raise ValueError(f"{label_file_path}: line {n}: {len(row) - 1} values, expected {num_values}")
+            rows.append(row)
+    try:
+        values = np.array([row[1:num_values + 1] for row in rows], dtype=np.float64).reshape(-1, num_values)
+    except ValueError as e:
+        raise ValueError(f"{label_file_path}: {e}") from None
+    return [row[0] for row in rows], values
+
+
+def join_labels(labels, num_values):
+    """The (classes, values) of parse_label of many files as one class list, one array and the count of each file."""
+    class_list = [c for classes, _ in labels for c in classes]
+    values = np.concatenate([values for _, values in labels]) if labels else np.zeros((0, num_values))
+    return class_list, values, [len(classes) for classes, _ in labels]
+
+
+def load_label(label_file_paths, num_values):
+    """
+    Read YOLO label files into one list of class strings and one (N, num_values) float array,
+    the third value returned is the number of lines of each file.
+    """
+    return join_labels([parse_label(p, num_values) for p in label_file_paths], num_values)
+
+
+def load_label_batch(label_file_paths, num_values, src_image_folder_path=None):
+    """
+    load_label of a batch that skips the malformed files instead of failing on all of them,
+    returns the paths read, their classes, values and counts, the image sizes and the (path, error message)
+    of the skipped files.
+    With src_image_folder_path the image sizes are the (width, height) of every line, read from the png header of
+    the image of its file, and a file whose image cannot be read is skipped too. They are None without it.
+    """
+    paths, labels, sizes, failed = [], [], [], []
+    for label_file_path in label_file_paths:
+        try:
+            label = parse_label(label_file_path, num_values)
+            if src_image_folder_path is not None:
+                sizes.append(png_size(label_image_path(label_file_path, src_image_folder_path)))
+            labels.append(label)
+            paths.append(label_file_path)
+        except (OSError, ValueError) as e:
+            failed.append((label_file_path, f"{type(e).__name__}: {e}"))
+            log(f"\n{failed[-1][1]}", 0)
+    count("label_files_failed", len(failed))
+    class_list, values, counts = join_labels(labels, num_values)
+    img_sizes = None
+    if src_image_folder_path is not None:
+        img_sizes = np.repeat(np.array(sizes, dtype=np.float64).reshape(-1, 2), counts, axis=0)
+    return paths, class_list, values, counts, img_sizes, failed
+
+
+def format_label(class_list, values, counts):
+    """Format the lines of several YOLO label files in one pass, returns the text of each file."""
+    if len(class_list) == 0:
+        return ["" for _ in counts]
+    line_format = "%s" + " %.7f" * values.shape[1] + "\n"
+    rows = np.empty((len(class_list), values.shape[1] + 1), dtype=object)
+    rows[:, 0] = class_list
+    rows[:, 1:] = values
+    lines = ((line_format * len(class_list)) % tuple(rows.ravel())).splitlines(keepends=True)
+    offsets = np.cumsum([0] + list(counts)).tolist()
+    return ["".join(lines[offsets[i]:offsets[i + 1]]) for i in range(len(counts))]
+
+
+def label_texts(class_list, values, counts, keep=None):
+    """format_label of the lines in keep, a mask of all the lines of the files."""
+    if keep is not None:
+        file_index = np.repeat(np.arange(len(counts)), counts)
+        counts = np.bincount(file_index[keep], minlength=len(counts)).tolist()
+        class_list = [c for c, k in zip(class_list, keep) if k]
+        values = values[keep]
+    return format_label(class_list, values, counts)
+
+
+def write_label(output_file_paths, class_list, values, counts, keep=None):
+    """An output path None skips that file."""
+    for output_file_path, text in zip(output_file_paths, label_texts(class_list, values, counts, keep)):
+        if output_file_path is None:
+            continue
+        with open(output_file_path, 'w') as g:
+            g.write(text)
+
+
+def rotate_obb_boxes(boxes, angle, flip_before_rotate=False, img_sizes=None, box_filter=None):
+    """
+    Rotate an (N, 4, 2) array of normalized OBB boxes and clip them to the canvas.
+    img_sizes, the (N, 2) image sizes, is only needed when angle is not a multiple of 90.
+    box_filter, a geometry.BoxFilter, drops the boxes too small or too little visible before they are clipped.
+    Returns the rotated array and a mask of the boxes to keep, missing boxes are dropped.
+    """
+    rotated = transform_label_points(boxes, angle, flip_before_rotate, img_sizes)
+    keep = ~missing_mask(rotated, 1.0, 1.0)
+    count("boxes", len(boxes))
+    count("boxes_missing", len(boxes) - keep.sum())  # dropped by is_missing
+    if box_filter is not None:
+        passed = box_filter.keep_mask(rotated, keep)
+        count("boxes_filtered", keep.sum() - passed.sum())
+        keep = passed
+    rows = np.flatnonzero(keep & outside_canvas_mask(rotated, 1.0, 1.0))
+    rotated[rows], inside = clip_boxes(rotated[rows], 1.0, 1.0)
+    for i in rows[~inside]:
+        log(f"error processing {rotated[i].tolist()}", 0)
+        keep[i] = False
+    count("boxes_clipped", inside.sum())
+    count("boxes_clip_failed", (~inside).sum())
+    return rotated, keep
+
+
+def label_groups(class_list, counts):
+    """(N,) int id of the (file, class) pair of every box, for BoxFilter.duplicate_mask."""
+    classes = np.unique(np.asarray(class_list, dtype=str), return_inverse=True)[1].reshape(-1)
+    files = np.repeat(np.arange(len(counts)), counts)
+    return files * (classes.max(initial=0) + 1) + classes
+
+
+def rotate_rect_boxes(rects, angle, flip_before_rotate=False, img_sizes=None):
+    """
+    Rotate an (N, 4) array of normalized xywh boxes, returns the (N, 4) bounding boxes of the rotated ones.
+    img_sizes, the (N, 2) image sizes, is only needed when angle is not a multiple of 90.
+    """
+    x, y, w, h = rects.T
+    points = np.stack([
+        np.stack([x - w / 2, y - h / 2], axis=-1),
+        np.stack([x + w / 2, y - h / 2], axis=-1),
+        np.stack([x + w / 2, y + h / 2], axis=-1),
+        np.stack([x - w / 2, y + h / 2], axis=-1),
+    ], axis=1)
+    points = np.clip(transform_label_points(points, angle, flip_before_rotate, img_sizes), 0.0, 1.0)
+    x1, y1 = points.min(axis=1).T
+    x2, y2 = points.max(axis=1).T
+    return np.stack([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1], axis=-1)
+
+
+def rotate_obb_label(obb_file_path, output_file_path, angle, flip_before_rotate=False, img_size=None):
+    class_list, values, counts = load_label([obb_file_path], 8)
+    img_sizes = None if img_size is None else np.tile(np.array(img_size, dtype=np.float64), (len(values), 1))
+    rotated, keep = rotate_obb_boxes(values.reshape(-1, 4, 2), angle, flip_before_rotate, img_sizes)
+    write_label([output_file_path], class_list, rotated.reshape(-1, 8), counts, keep)
+
+
+def rotate_rect_label(rect_file_path, output_file_path, angle, flip_before_rotate=False, img_size=None):
+    class_list, values, counts = load_label([rect_file_path], 4)
+    img_sizes = None if img_size is None else np.tile(np.array(img_size, dtype=np.float64), (len(values), 1))
+    write_label([output_file_path], class_list, rotate_rect_boxes(values, angle, flip_before_rotate, img_sizes), counts)
+
+
+def label_image_path(label_file_path, src_image_folder_path):
+    return os.path.join(src_image_folder_path, os.path.basename(label_file_path)[:-4] + ".png")
+
+
+def label_image_sizes(label_file_paths, src_image_folder_path, counts):
+    """(width, height) of the image of every label line, read from the png headers."""
+    if src_image_folder_path is None:
+        raise ValueError("the image folder is needed to rotate labels by angles that are not multiples of 90")
+    sizes = [png_size(label_image_path(p, src_image_folder_path)) for p in label_file_paths]
+    return np.repeat(np.array(sizes, dtype=np.float64).reshape(-1, 2), counts, axis=0)
+
+
+def variant_names(filename, angle_list, output_suffix=None, variants=None):
+    """
+    Names of the flip/rotation variants of a file, in the order d4_transform yields them,
+    only of the (angle, flip) in variants when it is given (a sample of a utils.budget.VariantBudget plan).
+    """
+    stem, suffix = os.path.splitext(filename)
+    suffix = suffix if output_suffix is None else output_suffix
+    return [f"{stem[:-1]}_{int(f)}{a:03d}{suffix}" for a in angle_list for f in [False, True]
+            if variants is None or (a, f) in variants]
+
+
+def plan_variants(plan, filename):
+    """
+    The variants of a file in a VariantBudget plan, None (all of them) without a plan,
+    none for a file the plan does not list (e.g. a label without its image), which would skew the class balance.
+    """
+    return None if plan is None else plan.get(os.path.splitext(filename)[0], ())
+
+
+def list_jobs(src_folder_path, dst_folder_path, suffix, angle_list, manifest=None, extra_sources=None,
+              output_suffix=None, plan=None):
+    """
+    (source path, output paths) of every file of src_folder_path ending with suffix.
+    With a manifest only the stale ones are returned, extra_sources(path) lists other inputs of a source.
+    A file plan gives no variant is left out, Manifest.finish removes what it wrote before.
+    """
+    jobs = []
+    for filename in sorted(os.listdir(src_folder_path)):
+        if not filename.endswith(suffix):
+            continue
+        src_path = os.path.join(src_folder_path, filename)
+        output_paths = [os.path.join(dst_folder_path, name)
+                        for name in variant_names(filename, angle_list, output_suffix, plan_variants(plan, filename))]
+        if not output_paths:
+            continue
+        sources = [src_path] + (extra_sources(src_path) if extra_sources is not None else [])
+        if manifest is None or manifest.is_stale(os.path.join(dst_folder_path, filename), sources, output_paths):
+            jobs.append((src_path, output_paths, sources))
+        else:
+            count("files_unchanged")
+    return jobs
+
+
+def record_jobs(manifest, jobs, failed_paths):
+    if manifest is None:
+        return
+    for src_path, output_paths, sources in jobs:
+        if src_path not in failed_paths:
+            dst_folder_path = os.path.dirname(output_paths[0])
+            manifest.record(os.path.join(dst_folder_path, os.path.basename(src_path)), sources, output_paths)
+
+
+def octal_obb_label_batch(obb_file_paths, dst_obb_folder_path, angle_list, src_image_folder_path=None,
+                          box_filter=None, file_variants=None):
+    """
+    Rotate the labels of many files at once, every variant is one array operation over all their boxes.
+    Duplicates are looked for once, among the boxes of the same file and class, before the first variant.
+    file_variants lists the variants (None for all) written for every file.
+    Malformed files, and for angles that are not multiples of 90 the files without a readable image, are skipped,
+    the (path, error message) of each is returned.
+    """
+    with stage("label_read"):
+        # the image sizes are only read for the angles that are not multiples of 90
+        size_folder = src_image_folder_path if any(a % 90 for a in angle_list) else None
+        read_paths, class_list, values, counts, img_sizes, failed = load_label_batch(obb_file_paths, 8, size_folder)
+        if file_variants is not None:
+            skipped = {p for p, _ in failed}
+            file_variants = [v for p, v in zip(obb_file_paths, file_variants) if p not in skipped]
+        obb_file_paths = read_paths
+        boxes = values.reshape(-1, 4, 2)
+    count("label_files", len(obb_file_paths))
+    unique = None
+    if box_filter is not None:
+        with stage("label_dedup"):
+            unique = ~box_filter.duplicate_mask(boxes, label_groups(class_list, counts))
+        count("boxes_duplicate", len(boxes) - unique.sum())
+    save_names = [variant_names(os.path.basename(p), angle_list) for p in obb_file_paths]
+    for i, (a, f) in enumerate((a, f) for a in angle_list for f in [False, True]):
+        save_paths = variant_paths(dst_obb_folder_path, save_names, i, (a, f), file_variants)
+        with stage("label_rotate"):
+            rotated, keep = rotate_obb_boxes(boxes, a, f, img_sizes, box_filter)
+            if unique is not None:
+                keep &= unique
+        with stage("label_write"):
+            write_label(save_paths, class_list, rotated.reshape(-1, 8), counts, keep)
+    return failed
+
+
+def octal_obb_label(src_obb_folder_path, dst_obb_folder_path, angle_list=None, workers=1, src_image_folder_path=None,
+                    manifest=None, box_filter=None, plan=None):
+    """
+    src_image_folder_path provides the image sizes, it is only read for angles that are not multiples of 90.
+    """
+    if angle_list is None:
+        angle_list = [0, 90, 180, 270]
+    if not os.path.exists(dst_obb_folder_path):
+        os.makedirs(dst_obb_folder_path)
+    jobs = list_jobs(src_obb_folder_path, dst_obb_folder_path, ".txt", angle_list, manifest, plan=plan)
+    errors = rotate_label_files([src_path for src_path, _, _ in jobs], dst_obb_folder_path, angle_list, workers,
+                                src_image_folder_path, "obb", box_filter, plan)
+    record_jobs(manifest, jobs, {p for task, _ in errors for p in task[0]})
+    return errors
+
+
+def rotate_label_files(src_paths, dst_folder_path, angle_list, workers=1, src_image_folder_path=None, label_type="obb",
+                       box_filter=None, plan=None):
+    """
+    Rotate the given label files in label_batches, without looking at a manifest.
+    Returns the errors, a malformed file is skipped and reported as ([[path]], error).
+    """
+    if label_type == "obb":
+        func = octal_obb_label_batch
+        tasks = [(paths, dst_folder_path, angle_list, src_image_folder_path, box_filter, batch_variants(plan, paths))
+                 for paths in label_batches(src_paths, workers)]
+    else:
+        func = octal_rect_label_batch
+        tasks = [(paths, dst_folder_path, angle_list, src_image_folder_path, batch_variants(plan, paths))
+                 for paths in label_batches(src_paths, workers)]
+    skipped = []
+    errors = run_tasks(func, tasks, workers, dst_folder_path, lambda task, failed: skipped.extend(failed))
+    return errors + [([[path]], error) for path, error in skipped]
+
+
+def variant_paths(dst_folder_path, save_names, i, variant, file_variants=None):
+    """The output paths of variant i of every file of a batch, None for the files that do not get that variant."""
+    return [os.path.join(dst_folder_path, names[i])
+            if file_variants is None or file_variants[k] is None or variant in file_variants[k] else None
+            for k, names in enumerate(save_names)]
+
+
+def octal_rect_label_batch(rect_file_paths, dst_rect_folder_path, angle_list, src_image_folder_path=None,
+                           file_variants=None):
+    with stage("label_read"):
+        # the image sizes are only read for the angles that are not multiples of 90
+        size_folder = src_image_folder_path if any(a % 90 for a in angle_list) else None
+        read_paths, class_list, values, counts, img_sizes, failed = load_label_batch(rect_file_paths, 4, size_folder)
+        if file_variants is not None:
+            skipped = {p for p, _ in failed}
+            file_variants = [v for p, v in zip(rect_file_paths, file_variants) if p not in skipped]
+        rect_file_paths = read_paths
+    count("label_files", len(rect_file_paths))
+    save_names = [variant_names(os.path.basename(p), angle_list) for p in rect_file_paths]
+    for i, (a, f) in enumerate((a, f) for a in angle_list for f in [False, True]):
+        save_paths = variant_paths(dst_rect_folder_path, save_names, i, (a, f), file_variants)
+        with stage("label_rotate"):
+            rects = rotate_rect_boxes(values, a, f, img_sizes)
+        count("boxes", len(rects))
+        with stage("label_write"):
+            write_label(save_paths, class_list, rects, counts)
+    return failed
+
+
+def octal_rect_label(src_rect_folder_path, dst_rect_folder_path, angle_list=None, workers=1, src_image_folder_path=None,
+                     manifest=None, plan=None):
+    """octal_obb_label for rect (xywh) labels."""
+    if angle_list is None:
+        angle_list = [0, 90, 180, 270]
+    if not os.path.exists(dst_rect_folder_path):
+        os.makedirs(dst_rect_folder_path)
+    jobs = list_jobs(src_rect_folder_path, dst_rect_folder_path, ".txt", angle_list, manifest, plan=plan)
+    errors = rotate_label_files([src_path for src_path, _, _ in jobs], dst_rect_folder_path, angle_list, workers,
+                                src_image_folder_path, "rect", plan=plan)
+    record_jobs(manifest, jobs, {p for task, _ in errors for p in task[0]})
+    return errors
+
+
+def octal_labels(base_dataset_path, new_dataset_path, split, angle_list, label_type="obb", workers=1, manifest=None,
+                 label_folder="labels", box_filter=None, plan=None):
+    """The label variants of one split, <base_dataset_path>/<label_folder>/<split> -> <new_dataset_path>/labels."""
+    src = os.path.join(base_dataset_path, label_folder, split)
+    dst = os.path.join(new_dataset_path, "labels", split)
+    src_images = os.path.join(base_dataset_path, "images", split)
+    if label_type == "obb":
+        return octal_obb_label(src, dst, angle_list, workers, src_images, manifest, box_filter, plan)
+    return octal_rect_label(src, dst, angle_list, workers, src_images, manifest, plan)
+
+
+def batch_variants(plan, paths):
+    """file_variants of a label batch, None without a plan."""
+    return None if plan is None else [plan_variants(plan, os.path.basename(p)) for p in paths]
+
+
+def label_batches(paths, workers=1):
+    """Split label files into one batch per worker, a whole split is one batch when serial."""
+    n = min(resolve_workers(workers), len(paths))
+    return [paths[i * len(paths) // n:(i + 1) * len(paths) // n] for i in range(n)]
+
+
+def budget_plans(budget, base_dataset_path, label_folder, angle_list):
+    """
+    {split: plan} of a utils.budget.VariantBudget for the samples of images/<split>, {split: None} without one.
+    A plan, {file name without suffix: [(angle, flip), ...]}, is the plan argument of list_jobs and the octal_*
+    functions: only those variants of every file are written, None writes them all.
+    """
+    plans = {}
+    for split in ["train", "val"]:
+        plans[split] = None
+        if budget is None:
+            continue
+        image_folder_path = os.path.join(base_dataset_path, "images", split)
+        names = [f[:-4] for f in sorted(os.listdir(image_folder_path)) if f.endswith("png")]
+        plans[split] = budget.plan(os.path.join(base_dataset_path, label_folder, split), names, angle_list)
+        planned = sum(len(variants) for variants in plans[split].values())
+        count("variants_skipped", 2 * len(angle_list) * len(names) - planned)
+        log(f"{split}: {planned} variants of {len(names)} samples")
+    return plans
+
+
+@reported
+def creat_labels_x(rotate_angle_step, base_dataset_path, output_dir, new_dataset_name, label_type="obb", workers=1,
+                   label_folder="labels", box_filter=None, budget=None):
+    """
+    Only the labels/ of creat_single_x / creat_dual_x, no image is read or written
+    (angles that are not multiples of 90 read the image sizes from the png headers).
+    The labels are all rewritten and their manifest entries dropped, the next incremental run rebuilds them.
+    budget must be the one the images were generated with.
+    Returns the errors like creat_single_x.
+    """
+    angle_list = list(range(0, 360, rotate_angle_step))
+    new_dataset_path = os.path.join(output_dir, new_dataset_name)
+    log(f"Generating x{len(angle_list) * 2} labels...")
+    forget_outputs(new_dataset_path, "labels/")
+    plans = budget_plans(budget, base_dataset_path, label_folder, angle_list)
+    errors = []
+    for split in ["train", "val"]:
+        errors += octal_labels(base_dataset_path, new_dataset_path, split, angle_list, label_type, workers, None,
+                               label_folder, box_filter, plans[split])
+    gen_yaml(new_dataset_path, new_dataset_name)
+    return errors
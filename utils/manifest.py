@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+
+from utils.instrument import log
+
+MANIFEST_NAME = ".manifest.json"
+
+
+def file_hash(file_path):
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def forget_outputs(root, prefix):
+    """
+    Drop the entries of the manifest of root with an output under prefix (e.g. "labels/"), without deleting files,
+    after those outputs were rewritten outside the manifest, so the next incremental run rebuilds them.
+    Returns the number of entries dropped.
+    """
+    path = os.path.join(root, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return 0
+    with open(path, 'r', encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("entries", {})
+    forgotten = [key for key, entry in entries.items() if any(o.startswith(prefix) for o in entry["outputs"])]
+    for key in forgotten:
+        del entries[key]
+    if forgotten:
+        with open(path, 'w', encoding="utf-8") as f:
+            json.dump(data, f)
+    return len(forgotten)
+
+
+class Manifest:
+    """
+    Build manifest of a generated folder, stored in <root>/.manifest.json.
+    It records the generation parameters and, for every source file, the size, mtime and hash of its inputs
+    and the outputs generated from it, so a rerun only rebuilds what is stale.
+    Changed parameters invalidate every entry, and finish() deletes the outputs of sources that are gone.
+    index, the utils.index.DatasetIndex of the sources, provides the hashes of the files it has seen unchanged.
+    """
+
+    def __init__(self, root, params, index=None):
+        self.root = root
+        self.index = index
+        self.path = os.path.join(root, MANIFEST_NAME)
+        self.params = json.loads(json.dumps(params))  # compare as it is stored
+        self.entries = {}
+        self.seen = set()
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+            self.entries = data.get("entries", {})
+            if data.get("params") != self.params:
+                log(f"generation parameters changed, rebuilding {root}")
+                for key in list(self.entries):
+                    self.remove(key)
+
+    def key(self, path):
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def signature(self, source_paths, old=None):
+        """Inputs are only hashed again when their size or mtime changed since the manifest or the index saw them."""
+        old = old if old is not None and len(old) == len(source_paths) else [None] * len(source_paths)
+        signature = []
+        for source_path, prev in zip(source_paths, old):
+            st = os.stat(source_path)
+            if prev is not None and prev["size"] == st.st_size and prev["mtime"] == st.st_mtime_ns:
+                digest = prev["hash"]
+            else:
+                digest = self.index.hash(source_path, st) if self.index is not None else None
+                if digest is None:
+                    digest = file_hash(source_path)
+            signature.append({"size": st.st_size, "mtime": st.st_mtime_ns, "hash": digest})
+        return signature
+
+    def is_stale(self, output_key_path, source_paths, output_paths):
+        key = self.key(output_key_path)
+        self.seen.add(key)
+        entry = self.entries.get(key)
+        if entry is None:
+            return True
+        if [self.key(p) for p in output_paths] != entry["outputs"]:
+            # e.g. a VariantBudget gives the source other variants, the ones it lost would be left behind
+            self.remove(key)
+            return True
+        if not all(os.path.exists(p) for p in source_paths):
+            # e.g. the backward image of a pair was deleted, the task runs and reports it like a full build
+            return True
+        signature =self.signature(source_paths, entry["sources"])
+        if [s["hash"] for s in signature] != [s["hash"] for s in entry["sources"]]:
+            return True
+        if not all(os.path.exists(p) for p in output_paths):
+            return True
+        entry["sources"] = signature
+        return False
+
+    def record(self, output_key_path, source_paths, output_paths):
+        key = self.key(output_key_path)
+        self.seen.add(key)
+        self.entries[key] = {
+            "sources": self.signature(source_paths),
+            "outputs": [self.key(p) for p in output_paths],
+        }
+
+    def remove(self, key):
+        for output in self.entries.pop(key)["outputs"]:
+            output_path = os.path.join(self.root, output)
+            if os.path.exists(output_path):
+                os.remove(output_path)
+
+    def finish(self):
+        """Delete the outputs of the sources not seen in this run and save the manifest."""
+        removed = [key for key in self.entries if key not in self.seen]
+        for key in removed:
+            self.remove(key)
+        if removed:
+            log(f"removed the outputs of {len(removed)} deleted sources from {self.root}")
+        if not os.path.exists(self.root):
+            os.makedirs(self.root)
+        with open(self.path, 'w', encoding="utf-8") as f:
+            json.dump({"params": self.params, "entries": self.entries}, f)
@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from utils import instrument
+from utils.instrument import log, trace, collect, Progress
+
+
+def resolve_workers(workers):
+    """0 or None means one worker per cpu core."""
+    if not workers or workers < 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+def call_task(func, task):
+    """Returns the error message or None, the time taken, the stats counted by the task and its result."""
+    start = time.perf_counter()
+    result = None
+    with collect() as stats:
+        try:
+            result = func(*task)
+            error = None
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return error, time.perf_counter() - start, stats.snapshot(), result
+
+
+def run_tasks(func, tasks, workers=1, desc="tasks", on_result=None):
+    """
+    Run func(*task) for every task, serially or in a process pool.
+    Progress and per-task errors are reported in the parent process,
+    a failed task does not stop the others. The stats counted by the tasks are merged into instrument.STATS,
+    and every task is a "task" event of the trace with its time.
+    on_result(task, result) is called in the parent process with what func returned, for the tasks that succeed.
+    Returns a list of (task, error message) for the failed tasks.
+    """
+    workers = min(resolve_workers(workers), max(len(tasks), 1))
+    total = len(tasks)
+    errors = []
+    progress = Progress(desc, total)
+
+    def report(task, result):
+        error, seconds, snapshot, value = result
+        instrument.STATS.merge(snapshot)
+        trace("task", desc=desc, task=str(task[0]), seconds=seconds, error=error)
+        if error is not None:
+            errors.append((task, error))
+            log(f"\nerror processing {task[0]}: {error}", 0)
+        elif on_result is not None:
+            on_result(task, value)
+        progress.update()
+
+    if workers == 1:
+        for task in tasks:
+            report(task, call_task(func, task))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=instrument.set_verbosity,
+                                 initargs=(instrument.VERBOSITY,)) as executor:
+            futures = {executor.submit(call_task, func, task): task for task in tasks}
+            for future in as_completed(futures):
+                report(futures[future], future.result())
+
+    if errors:
+        log(f"{desc}: {len(errors)} of {total} failed", 0)
+    return errors
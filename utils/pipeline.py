@@ -0,0 +1,167 @@
+import os
+import time
+import queue
+import threading
+import cv2
+import numpy as np
+
+from utils.instrument import log, count, stage, trace, Progress
+
+
+def read_file(path):
+    """The bytes of a file as a uint8 array, None when it does not exist."""
+    if not os.path.exists(path):
+        return None
+    return np.fromfile(path, dtype=np.uint8)
+
+
+def decode_image(data, path, flags=cv2.IMREAD_COLOR):
+    """cv2.imread of bytes read ahead by read_file, the path is only for the error message."""
+    img = None if data is None else cv2.imdecode(data, flags)
+    if img is None:
+        raise ValueError(f"cannot decode {path}")
+    return img
+
+
+def write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def output_bytes(outputs):
+    return sum(len(data) for _, data in outputs)
+
+
+class MemoryBudget:
+    """Bytes held between the stages of a Pipeline, only the reader waits for room so the other stages never block."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.used = 0
+        self.condition = threading.Condition()
+
+    def wait_for_room(self):
+        with self.condition:
+            # a single task larger than the limit still goes through when nothing else is held
+            while self.limit is not None and 0 < self.used and self.used >= self.limit:
+                self.condition.wait()
+
+    def add(self, n):
+        with self.condition:
+            self.used += n
+
+    def release(self, n):
+        with self.condition:
+            self.used -= n
+            self.condition.notify_all()
+
+
+class Pipeline:
+    """
+    Threaded read-ahead, compute and write-behind for the image loops, in one process.
+    An alternative to the process pool of utils.parallel.run_tasks when the disk (e.g. network storage) and not the
+    cpu is the bottleneck: a reader thread prefetches the source files of the next tasks, compute threads decode,
+    transform and encode them (cv2 releases the GIL there), and the calling thread writes the encoded outputs while
+    the next tasks are computed.
+        threads: compute threads, 0 or None for one per cpu core
+        depth: tasks queued between two stages, it bounds the read-ahead and the pending writes
+        memory_mb: the reader waits while the sources read and the outputs not written yet hold this many MB,
+                   None for no cap other than depth
+    The files written are the same as with run_tasks.
+    """
+
+    def __init__(self, threads=0, depth=8, memory_mb=None):
+        assert depth >= 1
+        self.threads = threads
+        self.depth = depth
+        self.memory_mb = memory_mb
+
+    def __repr__(self):
+        return f"Pipeline({self.threads!r}, {self.depth!r}, {self.memory_mb!r})"
+
+    def num_threads(self):
+        return self.threads if self.threads and self.threads > 0 else (os.cpu_count() or 1)
+
+    def run(self, tasks, sources, compute, desc="tasks"):
+        """
+        sources(task) lists the files of a task to read ahead, compute(task, data) gets their bytes (None for a
+        missing file) and returns the (output path, bytes) to write.
+        Like run_tasks a failed task does not stop the others, every task is a "task" event of the trace,
+        and the list of (task, error message) of the failed tasks is returned.
+        """
+        num_threads = min(self.num_threads(), max(len(tasks), 1))
+        budget = MemoryBudget(None if self.memory_mb is None else int(self.memory_mb * 2 ** 20))
+        read_queue = queue.Queue(self.depth)
+        write_queue = queue.Queue(self.depth)
+        errors = []
+        progress = Progress(desc, len(tasks))
+
+        def reader():
+            for task in tasks:
+                budget.wait_for_room()
+                start = time.perf_counter()
+                try:
+                    with stage("read"):
+                        data = [read_file(path) for path in sources(task)]
+                    error = None
+                except Exception as e:
+                    data, error = [], f"{type(e).__name__}: {e}"
+                held = sum(d.nbytes for d in data if d is not None)
+                budget.add(held)
+                read_queue.put((task, data, held, error, time.perf_counter() - start))
+            for _ in range(num_threads):
+                read_queue.put(None)
+
+        def worker():
+            while True:
+                item = read_queue.get()
+                if item is None:
+                    write_queue.put(None)
+                    return
+                task, data, held, error, seconds = item
+                start = time.perf_counter()
+                outputs = []
+                if error is None:
+                    try:
+                        outputs = compute(task, data)
+                    except Exception as e:
+                        error = f"{type(e).__name__}: {e}"
+                budget.add(output_bytes(outputs))
+                del data
+                budget.release(held)
+                write_queue.put((task, outputs, error, seconds + time.perf_counter() - start))
+
+        threads = [threading.Thread(target=reader, daemon=True)]
+        threads += [threading.Thread(target=worker, daemon=True) for _ in range(num_threads)]
+        for thread in threads:
+            thread.start()
+
+        finished = 0
+        while finished < num_threads:
+            item = write_queue.get()
+            if item is None:
+                finished += 1
+                continue
+            task, outputs, error, seconds = item
+            start = time.perf_counter()
+            if error is None:
+                try:
+                    with stage("write"):
+                        for path, data in outputs:
+                            write_file(path, data)
+                    count("files_written", len(outputs))
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+            budget.release(output_bytes(outputs))
+            seconds += time.perf_counter() - start
+            trace("task", desc=desc, task=str(task[0]), seconds=seconds, error=error)
+            if error is not None:
+                errors.append((task, error))
+                log(f"\nerror processing {task[0]}: {error}", 0)
+            progress.update()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            log(f"{desc}: {len(errors)} of {len(tasks)} failed", 0)
+        return errors
@@ -1,222 +1,526 @@
 import os
 import cv2
-import json
 import numpy as np
-from math import sin, cos, pi
 
-from utils.converter import calculate_rotation_theta, adjust_rectangle_coordinates
+from utils.converter import calculate_rotation_theta, adjust_rectangle_coordinates, clip_boxes
 from utils.utility import gen_yaml
+from utils.parallel import run_tasks
+from utils.manifest import Manifest
+from utils.index import DatasetIndex
+from utils.encoding import ImageEncoder
+from utils.instrument import log, count, stage, reported
+from utils.jsonio import load_json, dumps, write_if_changed
+from utils.pipeline import decode_image
+from utils.labels import rotation_matrix, rotate_point, transform_points, load_label, label_texts, rotate_obb_boxes, \
+    label_groups, rotate_rect_boxes, variant_names, plan_variants, list_jobs, record_jobs, octal_labels, budget_plans, \
+    rotate_label_files
+# the label functions that utils.labels took over, for the code importing them from here
+from utils.labels import is_missing, rotate_obb_label, rotate_rect_label, octal_obb_label, octal_rect_label
+
+
+ROTATE_CODES = {
+    90: cv2.ROTATE_90_CLOCKWISE,
+    180: cv2.ROTATE_180,
+    270: cv2.ROTATE_90_COUNTERCLOCKWISE,
+}
+
+
+BORDER_VALUE = (0, 114, 114)  # fill color of the expanded canvas
 
 
 def rotate_image(raw_img, angle, make_flip=False):
-    img = cv2.flip(raw_img, 1) if make_flip else raw_img.copy()
+    """The result is raw_img itself for angle 0 without flip, copy it before writing in place."""
+    img = cv2.flip(raw_img, 1) if make_flip else raw_img
     if angle == 0:
         return img
-    elif angle == 90:
-        return cv2.rotate(img, cv2.ROTATE_90_CLOCKWISE)
-    elif angle == 180:
-        return cv2.rotate(img, cv2.ROTATE_180)
-    elif angle == 270:
-        return cv2.rotate(img, cv2.ROTATE_90_COUNTERCLOCKWISE)
+    elif angle in ROTATE_CODES:
+        return cv2.rotate(img, ROTATE_CODES[angle])
     else:
         height, width = img.shape[:2]  # (H,W,C)
-        center = (width / 2, height / 2)
-        scale = 1.0
-        borderValue = (0, 114, 114)  # fill color
-        M = cv2.getRotationMatrix2D(center, -angle, scale)
-        rotated_img = cv2.warpAffine(src=img, M=M, dsize=(height, width), borderValue=borderValue)
-        return rotated_img
-
-
-def rotate_point(point, angle, flip_before_rotate, img_width, img_height):
-    center_point = [img_width / 2.0, img_height / 2.0]
-    x1 = img_width - point[0] if flip_before_rotate else point[0]
-    y1 = img_height - point[1]
-    x2 = center_point[0]
-    y2 = img_height - center_point[1]
-    radian = - pi / 180.0 * angle
-    x = (x1 - x2) * cos(radian) - (y1 - y2) * sin(radian) + x2
-    y = (x1 - x2) * sin(radian) + (y1 - y2) * cos(radian) + y2
-    point[0] = x
-    point[1] = img_height - y
-
-
-def is_missing(point_list, img_width, img_height):
-    """Check whether the box falls outside the image."""
-    miss_cnt = 0
-    for point in point_list:
-        if point[0] <= 0 or point[0] >= img_width or point[1] <= 0 or point[1] >= img_height:
-            miss_cnt += 1
-    return miss_cnt == 4
-
-
-def rotate_json_label(json_file_path, output_file_path, angle, flip_before_rotate=False, new_img_name=None):
-    with open(json_file_path, 'r', encoding="utf-8") as f:
-        data = json.load(f)
-        shapes = data['shapes']
-        w, h = data["imageWidth"], data["imageHeight"]
+        M, dsize = rotation_matrix(width, height, angle, pixel_center=True)
+        return cv2.warpAffine(src=img, M=M, dsize=dsize, borderValue=BORDER_VALUE)
+
+
+def d4_transform(raw_img, angle_list, buffers=None, variants=None):
+    """
+    Yield (angle, flip, image) for every flip/rotation variant in angle_list,
+    in the order octal_image writes them, or only for the (angle, flip) in variants.
+    raw_img is flipped at most once, angle 0 yields raw_img and its flip as they are,
+    and the other multiples of 90 are rotated into buffers reused between variants
+    (and between images when the same buffers dict is passed again).
+    A yielded image is only valid until the next one is requested.
+    """
+    if buffers is None:
+        buffers = {}
+    flipped_img = None
+    for a in angle_list:
+        for f in [False, True]:
+            if variants is not None and (a, f) not in variants:
+                continue
+            if f and flipped_img is None:
+                flipped_img = cv2.flip(raw_img, 1, dst=buffers.get(("flip", raw_img.shape)))
+                buffers[("flip", raw_img.shape)] = flipped_img
+            src = flipped_img if f else raw_img
+            if a in ROTATE_CODES:
+                h, w = src.shape[:2]
+                shape = (w, h) + src.shape[2:] if a != 180 else src.shape
+                img = cv2.rotate(src, ROTATE_CODES[a], dst=buffers.get(("rotate", shape)))
+                buffers[("rotate", shape)] = img
+                yield a, f, img
+            else:
+                yield a, f, rotate_image(src, a)
+
+
+def rotate_json_data(data, angle, flip_before_rotate=False, new_img_name=None):
+    """
+    rotate_json_label on a parsed json, the source is left untouched so it can give every variant.
+    The result shares all but the shapes with data, a large imageData is not copied.
+    """
+    w, h = data["imageWidth"], data["imageHeight"]
+    shapes = [dict(shape) for shape in data["shapes"]]
+    if shapes and all(len(shape["points"]) == 4 for shape in shapes):
+        points = np.array([shape["points"] for shape in shapes], dtype=np.float64)
+        boxes, inside = clip_boxes(transform_points(points, angle, flip_before_rotate, w, h), w, h)
+        if not inside.all():
+            raise ValueError(f"rectangle {boxes[~inside][0].tolist()} cannot be clipped to the {w}x{h} canvas")
+        for shape, box in zip(shapes, boxes.tolist()):
+            shape["points"] = box
+            shape['direction'] = calculate_rotation_theta(box)
+    else:
         for shape in shapes:
-            points = shape["points"]
+            points = [list(point) for point in shape["points"]]
             for point in points:
                 rotate_point(point, angle, flip_before_rotate, w, h)
             adjust_rectangle_coordinates(points, w, h)
+            shape["points"] = points
             shape['direction'] = calculate_rotation_theta(points)
-        if new_img_name is not None:
-            data["imagePath"] = new_img_name
-
-    with open(output_file_path, 'w', encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
-
-
-def rotate_obb_label(obb_file_path, output_file_path, angle, flip_before_rotate=False):
-    with open(obb_file_path, 'r') as f, open(output_file_path, 'w') as g:
-        lines = f.readlines()
-        for line in lines:
-            parts = line.strip().split()
-            class_idx = parts[0]
-            coords = [float(p) for p in parts[1:]]  # n * 8
-            rotated_point_list = []  # [x, y] * 4
-            for i in range(4):
-                point = [coords[i * 2], coords[i * 2 + 1]]
-                rotate_point(point, angle, flip_before_rotate, 1.0, 1.0)
-                rotated_point_list.append(point)
-
-            if is_missing(rotated_point_list, 1.0, 1.0):
-                # print(f"skip missing {rotated_point_list}")
-                continue
-
-            try:
-                adjust_rectangle_coordinates(rotated_point_list, 1.0, 1.0)
-                flat = sum(rotated_point_list, [])  # n * 8
-                formatted_coords = ["{:.7f}".format(coord) for coord in flat]
-                g.write(f"{class_idx} {' '.join(formatted_coords)}\n")
-            except Exception as e:
-                print(f"error processing {rotated_point_list}")
-                print(e)
-                print(output_file_path)
-
-
-def rotate_rect_label(rect_file_path, output_file_path, angle, flip_before_rotate=False):
-    assert angle in [0, 90, 180, 270]  # any angle is not allowed
-    with open(rect_file_path, 'r') as f, open(output_file_path, 'w') as g:
-        lines = f.readlines()
-        for line in lines:
-            parts = line.strip().split()
-            class_idx = parts[0]
-            x, y, w, h = [float(p) for p in parts[1:]]
-            points = [[x - w / 2, y - h / 2], [x + w / 2, y - h / 2], [x + w / 2, y + h / 2], [x - w / 2, y + h / 2]]
-            for point in points:
-                rotate_point(point, angle, flip_before_rotate, 1.0, 1.0)
-                point[0] = max(0.0, min(point[0], 1.0))
-                point[1] = max(0.0, min(point[1], 1.0))
-
-            np_points = np.array(points)
-            x1, y1 = np.min(np_points, axis=0)
-            x2, y2 = np.max(np_points, axis=0)
-            x, y, w, h = (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1
-            formatted_coords = ["{:.7f}".format(coord) for coord in [x, y, w, h]]
-            g.write(f"{class_idx} {' '.join(formatted_coords)}\n")
+    count("boxes", len(shapes))
+    rotated = dict(data)
+    rotated["shapes"] = shapes
+    if new_img_name is not None:
+        rotated["imagePath"] = new_img_name
+    return rotated
+
+
+def write_json(output_file_path, data, compact=False):
+    """Write data as json unless the file already holds the same bytes."""
+    if not write_if_changed(output_file_path, dumps(data, compact)):
+        count("json_files_unchanged")
+
+
+def rotate_json_label(json_file_path, output_file_path, angle, flip_before_rotate=False, new_img_name=None,
+                      compact=False):
+    data = load_json(json_file_path)
+    write_json(output_file_path, rotate_json_data(data, angle, flip_before_rotate, new_img_name), compact)
+
+
+def image_variants(raw_img, filename, dst_image_folder_path, angle_list, encoder, variants=None):
+    """
+    Yield (output path, image) of every variant, or of the (angle, flip) in variants,
+    an image is only valid until the next one is requested.
+    """
+    transformed = d4_transform(raw_img, angle_list, variants=variants)
+    for save_name in variant_names(filename, angle_list, encoder.suffix, variants):
+        with stage("transform"):
+            a, f, img = next(transformed)
+        yield os.path.join(dst_image_folder_path, save_name), img
+
+
+def write_variants(raw_img, filename, dst_image_folder_path, angle_list, encoder=None, variants=None):
+    if encoder is None:
+        encoder = ImageEncoder()
+    write_outputs(image_variants(raw_img, filename, dst_image_folder_path, angle_list, encoder, variants), encoder)
+
+
+def write_outputs(outputs, encoder):
+    """Write the (output path, image or label text) of a variants generator as they come."""
+    images = 0
+    for path, output in outputs:
+        if isinstance(output, str):
+            with stage("label_write"):
+                with open(path, 'w') as g:
+                    g.write(output)
+        else:
+            with stage("encode"):
+                encoder.write(path, output)
+            images += 1
+    count("images_written", images)
+
+
+def encode_outputs(outputs, encoder):
+    """write_outputs for a utils.pipeline.Pipeline, returns the (output path, bytes) for its writer."""
+    encoded = []
+    for path, output in outputs:
+        if isinstance(output, str):
+            encoded.append((path, output.encode()))
+        else:
+            with stage("encode"):
+                encoded.append((path, encoder.encode(output)))
+            count("images_written")
+    return encoded
+
+
+def octal_image_file(src_image_path, dst_image_folder_path, angle_list, encoder=None, variants=None):
+    with stage("decode"):
+        raw_img = cv2.imread(src_image_path)
+    count("images_read")
+    write_variants(raw_img, os.path.basename(src_image_path), dst_image_folder_path, angle_list, encoder, variants)
+
+
+def octal_image_outputs(task, data):
+    """octal_image_file in a Pipeline, data holds the bytes of the source image."""
+    src_image_path, dst_image_folder_path, angle_list, encoder, variants = task
+    with stage("decode"):
+        raw_img = decode_image(data[0], src_image_path)
+    count("images_read")
+    filename = os.path.basename(src_image_path)
+    return encode_outputs(image_variants(raw_img, filename, dst_image_folder_path, angle_list, encoder, variants),
+                          encoder)
+
+
+def octal_fused_image_file(src_image1_path, src_image2_path, dst_image_folder_path, angle_list, fusion, encoder=None,
+                           variants=None):
+    """Fuse a forward/backward pair in memory and write its variants, without an intermediate fused png."""
+    with stage("decode"):
+        img1 = cv2.imread(src_image1_path, cv2.IMREAD_GRAYSCALE)
+        img2 = cv2.imread(src_image2_path, cv2.IMREAD_GRAYSCALE)
+    for img, path in [(img1, src_image1_path), (img2, src_image2_path)]:
+        if img is None:
+            raise ValueError(f"cannot fuse {os.path.basename(src_image1_path)}: missing image {path}")
+    count("images_read", 2)
+    with stage("fuse"):
+        fused = fusion(img1, img2)
+    write_variants(fused, os.path.basename(src_image1_path), dst_image_folder_path, angle_list, encoder, variants)
+
+
+def octal_fused_image_outputs(task, data):
+    """octal_fused_image_file in a Pipeline, data holds the bytes of the two source images."""
+    src_image1_path, src_image2_path, dst_image_folder_path, angle_list, fusion, encoder, variants = task
+    with stage("decode"):
+        img1 = decode_image(data[0], src_image1_path, cv2.IMREAD_GRAYSCALE)
+        img2 = decode_image(data[1], src_image2_path, cv2.IMREAD_GRAYSCALE)
+    count("images_read", 2)
+    with stage("fuse"):
+        fused = fusion(img1, img2)
+    filename = os.path.basename(src_image1_path)
+    return encode_outputs(image_variants(fused, filename, dst_image_folder_path, angle_list, encoder, variants),
+                          encoder)
+
+
+def octal_image(src_image_folder_path, dst_image_folder_path, angle_list=None, workers=1, manifest=None,
+                encoder=None, pipeline=None, plan=None):
+    """
+    encoder, an ImageEncoder, sets the output format, png with the default settings of cv2.imwrite if None.
+    pipeline, a utils.pipeline.Pipeline, runs the files on its threads instead of on workers processes.
+    """
+    if angle_list is None:
+        angle_list = [0, 90, 180, 270]
+    if encoder is None:
+        encoder = ImageEncoder()
+    if not os.path.exists(dst_image_folder_path):
+        os.makedirs(dst_image_folder_path)
+    jobs = list_jobs(src_image_folder_path, dst_image_folder_path, "png", angle_list, manifest,
+                     output_suffix=encoder.suffix, plan=plan)
+    tasks = [(src_path, dst_image_folder_path, angle_list, encoder, plan_variants(plan, os.path.basename(src_path)))
+             for src_path, _, _ in jobs]
+    if pipeline is not None:
+        errors = pipeline.run(tasks, lambda task: task[:1], octal_image_outputs, dst_image_folder_path)
+    else:
+        errors = run_tasks(octal_image_file, tasks, workers, dst_image_folder_path)
+    record_jobs(manifest, jobs, {task[0] for task, _ in errors})
+    return errors
 
 
-def octal_image(src_image_folder_path, dst_image_folder_path, angle_list=None):
+def octal_fused_image(src_image1_folder_path, src_image2_folder_path, dst_image_folder_path, fusion, angle_list=None,
+                      workers=1, manifest=None, encoder=None, pipeline=None, plan=None):
+    """octal_image of fusion(image1, image2) for the pairs with the same file name in the two folders."""
     if angle_list is None:
         angle_list = [0, 90, 180, 270]
+    if encoder is None:
+        encoder = ImageEncoder()
     if not os.path.exists(dst_image_folder_path):
         os.makedirs(dst_image_folder_path)
-    for filename in os.listdir(src_image_folder_path):
-        if filename.endswith("png"):
-            raw_img = cv2.imread(os.path.join(src_image_folder_path, filename))
-            for a in angle_list:
-                for f in [False, True]:
-                    save_name = f"{filename[:-5]}_{int(f)}{a:03d}.png"
-                    save_path = os.path.join(dst_image_folder_path, save_name)
-                    img = rotate_image(raw_img, a, f)
-                    cv2.imwrite(save_path, img)
-
-
-def octal_json_label(src_json_folder_path, dst_json_folder_path, angle_list=None):
+
+    def partner(src_path):
+        return [os.path.join(src_image2_folder_path, os.path.basename(src_path))]
+
+    jobs = list_jobs(src_image1_folder_path, dst_image_folder_path, "png", angle_list, manifest, partner,
+                     encoder.suffix, plan)
+    tasks = [(sources[0], sources[1], dst_image_folder_path, angle_list, fusion, encoder,
+              plan_variants(plan, os.path.basename(sources[0]))) for _, _, sources in jobs]
+    if pipeline is not None:
+        errors = pipeline.run(tasks, lambda task: task[:2], octal_fused_image_outputs, dst_image_folder_path)
+    else:
+        errors = run_tasks(octal_fused_image_file, tasks, workers, dst_image_folder_path)
+    record_jobs(manifest, jobs, {task[0] for task, _ in errors})
+    return errors
+
+
+def pair_variants(sources, src_label_path, dst_image_folder_paths, dst_label_folder_path, angle_list,
+                  label_type="obb", encoder=None, box_filter=None, variants=None):
+    """
+    Yield (output path, image or label text) of every variant of a decoded forward/backward pair and its labels,
+    or of the (angle, flip) in variants. The two images and the label of a variant come together,
+    before the next variant is made.
+    The image size of the labels comes from the decoded image, no png header is read.
+    A missing label file gives no label, like octal_obb_label / octal_rect_label.
+    """
+    num_values = 8 if label_type == "obb" else 4
+    filename = os.path.basename(src_label_path)[:-4] + ".png"
+    if any(img.shape != sources[0].shape for img in sources):
+        raise ValueError(f"cannot pair {filename}: size mismatch")
+
+    has_label = os.path.exists(src_label_path)
+    if has_label:
+        with stage("label_read"):
+            class_list, values, counts = load_label([src_label_path], num_values)
+        count("label_files")
+        img_height, img_width = sources[0].shape[:2]
+        img_sizes = np.tile([float(img_width), float(img_height)], (len(values), 1))
+        unique = None
+        if box_filter is not None and label_type == "obb":
+            with stage("label_dedup"):
+                unique = ~box_filter.duplicate_mask(values.reshape(-1, 4, 2), label_groups(class_list, counts))
+            count("boxes_duplicate", len(values) - unique.sum())
+
+    image_names = variant_names(filename, angle_list, encoder.suffix, variants)
+    label_names = variant_names(filename, angle_list, ".txt", variants)
+    # the variants of the two images are made in lockstep, the rotation matrices are cached per size and angle
+    transformed = zip(*[d4_transform(img, angle_list, variants=variants) for img in sources])
+    for i in range(len(image_names)):
+        with stage("transform"):
+            images = next(transformed)
+        a, f = images[0][:2]
+        for dst_image_folder_path, (_, _, img) in zip(dst_image_folder_paths, images):
+            yield os.path.join(dst_image_folder_path, image_names[i]), img
+        if not has_label:
+            continue
+        with stage("label_rotate"):
+            if label_type == "obb":
+                rotated, keep = rotate_obb_boxes(values.reshape(-1, 4, 2), a, f, img_sizes, box_filter)
+                rotated = rotated.reshape(-1, 8)
+                if unique is not None:
+                    keep &= unique
+            else:
+                rotated, keep = rotate_rect_boxes(values, a, f, img_sizes), None
+                count("boxes", len(rotated))
+            text = label_texts(class_list, rotated, counts, keep)[0]
+        yield os.path.join(dst_label_folder_path, label_names[i]), text
+
+
+def octal_pair_file(src_image_paths, src_label_path, dst_image_folder_paths, dst_label_folder_path, angle_list,
+                    label_type="obb", encoder=None, box_filter=None, variants=None):
+    """
+    One sample of a dual dataset in a single pass: the forward and backward images and the label file are read
+    together, and every flip/rotation variant of the three is written before the next one is made.
+    """
+    if encoder is None:
+        encoder = ImageEncoder()
+    with stage("decode"):
+        sources = [cv2.imread(p) for p in src_image_paths]
+    if any(img is None for img in sources):
+        raise ValueError(f"cannot pair {os.path.basename(src_image_paths[0])}: missing image")
+    count("images_read", len(sources))
+    write_outputs(pair_variants(sources, src_label_path, dst_image_folder_paths, dst_label_folder_path, angle_list,
+                                label_type, encoder, box_filter, variants), encoder)
+
+
+def octal_pair_outputs(task, data):
+    """octal_pair_file in a Pipeline, data holds the bytes of the two source images."""
+    src_image_paths, src_label_path, dst_image_folder_paths, dst_label_folder_path, angle_list, label_type, \
+        encoder, box_filter, variants = task
+    with stage("decode"):
+        sources = [decode_image(d, p) for d, p in zip(data, src_image_paths)]
+    count("images_read", len(sources))
+    return encode_outputs(pair_variants(sources, src_label_path, dst_image_folder_paths, dst_label_folder_path,
+                                        angle_list, label_type, encoder, box_filter, variants), encoder)
+
+
+def octal_pairs(base_dataset_path, new_dataset_path, split, angle_list, label_type="obb", workers=1, manifest=None,
+                label_folder="labels", encoder=None, box_filter=None, pipeline=None, plan=None):
+    """
+    octal_pair_file for every sample of a split, listed once from <base_dataset_path>/images/<split>.
+    The two images and the label of a sample are separate manifest entries, keyed like the unpaired ones,
+    a sample whose label alone changed only has its label rotated again, by rotate_label_files.
+    """
+    if encoder is None:
+        encoder = ImageEncoder()
+    src_folders = [os.path.join(base_dataset_path, folder, split) for folder in ["images", "image"]]
+    src_labels = os.path.join(base_dataset_path, label_folder, split)
+    dst_folders = [os.path.join(new_dataset_path, folder, split) for folder in ["images", "image"]]
+    dst_labels = os.path.join(new_dataset_path, "labels", split)
+    for folder_path in dst_folders + [dst_labels]:
+        if not os.path.exists(folder_path):
+            os.makedirs(folder_path)
+
+    jobs, label_jobs = [], []
+    for filename in sorted(f for f in os.listdir(src_folders[0]) if f.endswith("png")):
+        src_paths = [os.path.join(folder, filename) for folder in src_folders]
+        variants = plan_variants(plan, filename)
+        output_paths = [os.path.join(folder, name) for folder in dst_folders
+                        for name in variant_names(filename, angle_list, encoder.suffix, variants)]
+        key_path = os.path.join(dst_folders[0], filename)
+        stale = manifest is None or manifest.is_stale(key_path, src_paths, output_paths)
+        label_path = os.path.join(src_labels, filename[:-4] + ".txt")
+        if os.path.exists(label_path):
+            label_outputs = [os.path.join(dst_labels, name)
+                             for name in variant_names(filename, angle_list, ".txt", variants)]
+            label_key = os.path.join(dst_labels, filename[:-4] + ".txt")
+            # asked even when the images are stale, so a failed pair task does not lose the entry
+            if manifest is None or manifest.is_stale(label_key, [label_path], label_outputs) or stale:
+                label_jobs.append((label_key, [label_path], label_outputs, src_paths[0] if stale else label_path))
+            else:
+                count("files_unchanged")
+        if stale:
+            jobs.append((key_path, src_paths, output_paths))
+        else:
+            count("files_unchanged")
+
+    tasks = [(src_paths, os.path.join(src_labels, os.path.basename(key_path)[:-4] + ".txt"), dst_folders,
+              dst_labels, angle_list, label_type, encoder, box_filter, plan_variants(plan, os.path.basename(key_path)))
+             for key_path, src_paths, _ in jobs]
+    if pipeline is not None:
+        errors = pipeline.run(tasks, lambda task: task[0], octal_pair_outputs, dst_folders[0])
+    else:
+        errors = run_tasks(octal_pair_file, tasks, workers, dst_folders[0])
+    label_paths = [label_path for _, (label_path,), _, task_path in label_jobs if task_path == label_path]
+    label_errors = rotate_label_files(label_paths, dst_labels, angle_list, workers, src_folders[0], label_type,
+                                      box_filter, plan)
+    if manifest is not None:
+        failed_paths = {task[0][0] for task, _ in errors} | {p for task, _ in label_errors for p in task[0]}
+        for key_path, src_paths, output_paths in jobs:
+            if src_paths[0] not in failed_paths:
+                manifest.record(key_path, src_paths, output_paths)
+        for key_path, sources, output_paths, task_path in label_jobs:
+            if task_path not in failed_paths:
+                manifest.record(key_path, sources, output_paths)
+    return errors + label_errors
+
+
+def octal_json_label_file(json_file_path, dst_json_folder_path, angle_list, compact=False):
+    """The source is parsed once, every variant is made from it in memory."""
+    filename = os.path.basename(json_file_path)
+    with stage("json_read"):
+        data = load_json(json_file_path)
+    variants = [(a, f) for a in angle_list for f in [False, True]]
+    for (a, f), save_name in zip(variants, variant_names(filename, angle_list)):
+        with stage("label_rotate"):
+            rotated = rotate_json_data(data, a, f, save_name.replace(".json", ".png"))
+        with stage("json_write"):
+            write_json(os.path.join(dst_json_folder_path, save_name), rotated, compact)
+
+
+def octal_json_label(src_json_folder_path, dst_json_folder_path, angle_list=None, workers=1, manifest=None,
+                     compact=False):
     if angle_list is None:
         angle_list = [0, 90, 180, 270]
     if not os.path.exists(dst_json_folder_path):
         os.makedirs(dst_json_folder_path)
-    for filename in os.listdir(src_json_folder_path):
-        if filename.endswith(".json"):
-            json_file_path = os.path.join(src_json_folder_path, filename)
-            for a in angle_list:
-                for f in [False, True]:
-                    save_name = f"{filename[:-6]}_{int(f)}{a:03d}.json"
-                    save_path = os.path.join(dst_json_folder_path, save_name)
-                    new_img_name = save_name.replace(".json", ".png")
-                    rotate_json_label(json_file_path, save_path, a, f, new_img_name)
-
-
-def octal_obb_label(src_obb_folder_path, dst_obb_folder_path, angle_list=None):
-    if angle_list is None:
-        angle_list = [0, 90, 180, 270]
-    if not os.path.exists(dst_obb_folder_path):
-        os.makedirs(dst_obb_folder_path)
-    for filename in os.listdir(src_obb_folder_path):
-        if filename.endswith(".txt"):
-            obb_file_path = os.path.join(src_obb_folder_path, filename)
-            for a in angle_list:
-                for f in [False, True]:
-                    save_name = f"{filename[:-5]}_{int(f)}{a:03d}.txt"
-                    save_path = os.path.join(dst_obb_folder_path, save_name)
-                    rotate_obb_label(obb_file_path, save_path, a, f)
-
-
-def octal_rect_label(src_rect_folder_path, dst_rect_folder_path, angle_list=None):
-    if angle_list is None:
-        angle_list = [0, 90, 180, 270]
-    if not os.path.exists(dst_rect_folder_path):
-        os.makedirs(dst_rect_folder_path)
-    for filename in os.listdir(src_rect_folder_path):
-        if filename.endswith(".txt"):
-            rect_file_path = os.path.join(src_rect_folder_path, filename)
-            for a in angle_list:
-                for f in [False, True]:
-                    save_name = f"{filename[:-5]}_{int(f)}{a:03d}.txt"
-                    save_path = os.path.join(dst_rect_folder_path, save_name)
-                    rotate_rect_label(rect_file_path, save_path, a, f)
-
-
-def creat_single_x(rotate_angle_step, base_dataset_path, output_dir, new_dataset_name, label_type="obb"):
+    jobs = list_jobs(src_json_folder_path, dst_json_folder_path, ".json", angle_list, manifest)
+    tasks = [(src_path, dst_json_folder_path, angle_list, compact) for src_path, _, _ in jobs]
+    errors = run_tasks(octal_json_label_file, tasks, workers, dst_json_folder_path)
+    record_jobs(manifest, jobs, {task[0] for task, _ in errors})
+    return errors
+
+
+@reported
+def creat_single_x(rotate_angle_step, base_dataset_path, output_dir, new_dataset_name, label_type="obb", workers=1,
+                   incremental=False, fusion=None, label_folder="labels", encoder=None, box_filter=None,
+                   pipeline=None, budget=None):
+    """
+    With fusion, base_dataset_path is a dual dataset (images/, image/) such as data/,
+    and every pair is fused in memory by fusion(image1, image2) right before it is transformed.
+    box_filter, a geometry.BoxFilter, filters the OBB boxes of every variant.
+    pipeline, a utils.pipeline.Pipeline, runs the images on threads overlapping reads, compute and writes,
+    the labels still run on workers processes.
+    budget, a utils.budget.VariantBudget, writes only the variants it gives each sample from its classes,
+    all of them for the samples of the rare classes.
+    Returns a list of (task, error message) for the files that failed, the others are all written.
+    """
     angle_list = list(range(0, 360, rotate_angle_step))
     expand_rate = len(angle_list) * 2
     new_dataset_path = os.path.join(output_dir, new_dataset_name)
-    print(f"Generating x{expand_rate} dataset...")
-
+    log(f"Generating x{expand_rate} dataset...")
+    if encoder is None:
+        encoder = ImageEncoder()
+    manifest = None
+    if incremental:
+        fusion_name = None if fusion is None else getattr(fusion, "__name__", repr(fusion))
+        params = {"angle_list": angle_list, "label_type": label_type, "fusion": fusion_name,
+                  "encoder": encoder.describe(), "box_filter": repr(box_filter)}
+        if budget is not None:
+            params["budget"] = repr(budget)
+        manifest = Manifest(new_dataset_path, params, DatasetIndex.load(base_dataset_path))
+    plans = budget_plans(budget, base_dataset_path, label_folder, angle_list)
+
+    errors = []
     for l1 in ["images", "labels"]:
         for l2 in ["train", "val"]:
             src = os.path.join(base_dataset_path, l1, l2)
             dst = os.path.join(new_dataset_path, l1, l2)
             if l1 == "labels":
-                if label_type == "obb":
-                    octal_obb_label(src, dst, angle_list)
-                else:
-                    octal_rect_label(src, dst, angle_list)
+                errors += octal_labels(base_dataset_path, new_dataset_path, l2, angle_list, label_type, workers,
+                                       manifest, label_folder, box_filter, plans[l2])
+            elif fusion is not None:
+                src2 = os.path.join(base_dataset_path, "image", l2)
+                errors += octal_fused_image(src, src2, dst, fusion, angle_list, workers, manifest, encoder, pipeline,
+                                            plans[l2])
             else:
-                octal_image(src, dst, angle_list)
+                errors += octal_image(src, dst, angle_list, workers, manifest, encoder, pipeline, plans[l2])
 
+    if manifest is not None:
+        manifest.finish()
     gen_yaml(new_dataset_path, new_dataset_name)
-
-
-def creat_dual_x(rotate_angle_step, base_dataset_path, output_dir, new_dataset_name, label_type="obb"):
+    return errors
+
+
+@reported
+def creat_dual_x(rotate_angle_step, base_dataset_path, output_dir, new_dataset_name, label_type="obb", workers=1,
+                 incremental=False, label_folder="labels", encoder=None, box_filter=None, paired=False,
+                 pipeline=None, budget=None):
+    """
+    box_filter and budget as in creat_single_x.
+    With paired every (forward image, backward image, label) triple is one task (octal_pairs) instead of
+    the three folders being processed one after the other, the files written are the same.
+    pipeline, a utils.pipeline.Pipeline, runs the images (the samples when paired) on threads overlapping reads,
+    compute and writes instead of on workers processes.
+    Returns the errors like creat_single_x.
+    """
     angle_list = list(range(0, 360, rotate_angle_step))
     expand_rate = len(angle_list) * 2
     new_dataset_path = os.path.join(output_dir, new_dataset_name)
-    print(f"Generating x{expand_rate} dataset...")
-
-    for l1 in ["images", "image", "labels"]:
-        for l2 in ["train", "val"]:
-            src = os.path.join(base_dataset_path, l1, l2)
-            dst = os.path.join(new_dataset_path, l1, l2)
-            if l1 == "labels":
-                if label_type == "obb":
-                    octal_obb_label(src, dst, angle_list)
+    log(f"Generating x{expand_rate} dataset...")
+    if encoder is None:
+        encoder = ImageEncoder()
+    manifest = None
+    if incremental:
+        params = {"angle_list": angle_list, "label_type": label_type, "encoder": encoder.describe(),
+                  "box_filter": repr(box_filter)}
+        if paired:
+            # the entries are per sample when paired and per file otherwise, switching rebuilds everything
+            params["paired"] = True
+        if budget is not None:
+            params["budget"] = repr(budget)
+        manifest = Manifest(new_dataset_path, params, DatasetIndex.load(base_dataset_path))
+    plans = budget_plans(budget, base_dataset_path, label_folder, angle_list)
+
+    errors = []
+    if paired:
+        for split in ["train", "val"]:
+            errors += octal_pairs(base_dataset_path, new_dataset_path, split, angle_list, label_type, workers,
+                                  manifest, label_folder, encoder, box_filter, pipeline, plans[split])
+    else:
+        for l1 in ["images", "image", "labels"]:
+            for l2 in ["train", "val"]:
+                src = os.path.join(base_dataset_path, l1, l2)
+                dst = os.path.join(new_dataset_path, l1, l2)
+                if l1 == "labels":
+                    errors += octal_labels(base_dataset_path, new_dataset_path, l2, angle_list, label_type, workers,
+                                           manifest, label_folder, box_filter, plans[l2])
                 else:
-                    octal_rect_label(src, dst, angle_list)
-            else:
-                octal_image(src, dst, angle_list)
+                    errors += octal_image(src, dst, angle_list, workers, manifest, encoder, pipeline, plans[l2])
 
+    if manifest is not None:
+        manifest.finish()
     gen_yaml(new_dataset_path, new_dataset_name)
+    return errors
@@ -0,0 +1,99 @@
+import os
+import json
+import numpy as np
+
+from utils.dataset import AugmentedDataset
+from utils.instrument import log, reported
+
+SHARD_ALIGNMENT = 64  # every array starts on a multiple of this many bytes
+
+
+class ShardWriter:
+    """
+    Packs samples into one binary shard <path>.bin with a small json index <path>.json.
+    A sample is stored as its images (uint8), then its classes (int64) and labels (float64), back to back,
+    so reading it back from a memory map is a single seek.
+    """
+
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        self.f = open(shard_path + ".bin", 'wb')
+        self.samples = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write_array(self, array):
+        padding = -self.f.tell() % SHARD_ALIGNMENT
+        self.f.write(b"\0" * padding)
+        offset = self.f.tell()
+        self.f.write(np.ascontiguousarray(array).tobytes())
+        return {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+
+    def add(self, name, images, classes, labels):
+        self.samples.append({
+            "name": name,
+            "images": [self.write_array(np.asarray(img, dtype=np.uint8)) for img in images],
+            "classes": self.write_array(np.asarray(classes, dtype=np.int64)),
+            "labels": self.write_array(np.asarray(labels, dtype=np.float64)),
+        })
+
+    def close(self):
+        if self.f.closed:
+            return
+        self.f.close()
+        with open(self.shard_path + ".json", 'w', encoding="utf-8") as f:
+            json.dump({"alignment": SHARD_ALIGNMENT, "samples": self.samples}, f)
+
+
+class ShardReader:
+    """Random access to a shard written by ShardWriter, samples are views of one np.memmap."""
+
+    def __init__(self, shard_path):
+        with open(shard_path + ".json", 'r', encoding="utf-8") as f:
+            self.samples = json.load(f)["samples"]
+        self.data = np.memmap(shard_path + ".bin", dtype=np.uint8, mode='r')
+        self.names = [sample["name"] for sample in self.samples]
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def read_array(self, entry):
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"]))
+        return self.data[entry["offset"]:entry["offset"] + count * dtype.itemsize].view(dtype).reshape(entry["shape"])
+
+    def __getitem__(self, index):
+        """Same dict as AugmentedDataset, the arrays are read-only views of the shard."""
+        sample = self.samples[index]
+        return {
+            "name": sample["name"],
+            "images": [self.read_array(entry) for entry in sample["images"]],
+            "classes": self.read_array(sample["classes"]),
+            "labels": self.read_array(sample["labels"]),
+        }
+
+
+@reported
+def creat_dual_shard(rotate_angle_step, base_dataset_path, output_dir, new_dataset_name, label_type="obb",
+                     label_folder="labels", box_filter=None):
+    """creat_dual_x into one shard per split, <output_dir>/<new_dataset_name>/<split>.bin and .json"""
+    angle_list = list(range(0, 360, rotate_angle_step))
+    new_dataset_path = os.path.join(output_dir, new_dataset_name)
+    if not os.path.exists(new_dataset_path):
+        os.makedirs(new_dataset_path)
+    log(f"Generating x{len(angle_list) * 2} dataset shards...")
+
+    for split in ["train", "val"]:
+        dataset = AugmentedDataset(base_dataset_path, split, angle_list, label_type, label_folder=label_folder,
+                                   box_filter=box_filter)
+        with ShardWriter(os.path.join(new_dataset_path, split)) as writer:
+            for sample in dataset:
+                writer.add(sample["name"], sample["images"], sample["classes"], sample["labels"])
@@ -0,0 +1,56 @@
+import os
+
+from utils.budget import VariantBudget
+from utils.labels import plan_variants, list_jobs, variant_names
+
+ANGLES = [0, 90, 180, 270]
+
+
+def make_labels(folder, classes):
+    """A label file of the given classes for every sample name, None for no file."""
+    os.makedirs(folder, exist_ok=True)
+    for name, sample_classes in classes.items():
+        if sample_classes is None:
+            continue
+        with open(os.path.join(folder, name + ".txt"), 'w') as f:
+            f.writelines(f"{c} 0.1 0.1 0.2 0.1 0.2 0.2 0.1 0.2\n" for c in sample_classes)
+
+
+def sample_plan(tmp_path, budget):
+    # 5 boxes of class 0 and 1 of class 1, 13353150000 has no label file
+    classes = {"13353110000": ["0"], "13353120000": ["0", "0"], "13353130000": ["0", "1"],
+               "13353140000": ["0"], "13353150000": None}
+    folder = str(tmp_path / "labels")
+    make_labels(folder, classes)
+    return budget.plan(folder, sorted(classes), ANGLES)
+
+
+def test_plan_size(tmp_path):
+    plan = sample_plan(tmp_path, VariantBudget(2, seed=0))
+    sizes = {name: len(variants) for name, variants in plan.items()}
+    # the sample of the rarest class gets every variant, the others 8 * 1/5 rounded up, the unlabeled one min_variants
+    assert sizes == {"13353110000": 2, "13353120000": 2, "13353130000": 8, "13353140000": 2, "13353150000": 2}
+    all_variants = [(a, f) for a in ANGLES for f in [False, True]]
+    for variants in plan.values():
+        # in the order d4_transform makes them, without repeats
+        assert variants == [v for v in all_variants if v in variants]
+
+
+def test_plan_is_deterministic(tmp_path):
+    plan = sample_plan(tmp_path, VariantBudget(2, seed=0))
+    assert sample_plan(tmp_path, VariantBudget(2, seed=0)) == plan
+    assert sample_plan(tmp_path, VariantBudget(2, seed=1)) != plan
+
+
+def test_files_missing_from_the_plan_get_no_variant(tmp_path):
+    plan = sample_plan(tmp_path, VariantBudget(2, seed=0))
+    assert plan_variants(None, "13353190000.txt") is None
+    assert plan_variants(plan, "13353190000.txt") == ()
+    assert variant_names("13353190000.txt", ANGLES, variants=plan_variants(plan, "13353190000.txt")) == []
+
+    # a label without its image is not in the plan and is left out of the jobs
+    make_labels(str(tmp_path / "labels"), {"13353190000": ["1"]})
+    jobs = list_jobs(str(tmp_path / "labels"), str(tmp_path / "out"), ".txt", ANGLES, plan=plan)
+    assert [os.path.basename(src_path) for src_path, _, _ in jobs] == \
+        ["13353110000.txt", "13353120000.txt", "13353130000.txt", "13353140000.txt"]
+    assert sum(len(output_paths) for _, output_paths, _ in jobs) == 2 + 2 + 8 + 2
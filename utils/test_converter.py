@@ -0,0 +1,108 @@
+import math
+import numpy as np
+import pytest
+
+from utils.converter import cal_k, clip_boxes
+
+linprog = pytest.importorskip("scipy.optimize").linprog
+
+
+def linprog_adjust_rectangle_coordinates(point_list, width, height, max_iter=8):
+    """
+    adjust_rectangle_coordinates as it was before the closed form, solving every k with scipy's linprog.
+    It looped until the box was inside, here it gives up like clip_boxes when k is infeasible or after max_iter passes.
+    Returns True when the box ended inside the canvas.
+    """
+    def cal_k(a1, a2, a3, a4, a5, a6):
+        _c = [1]
+        _A = [[-a3], [a3], [-a4], [a4]]
+        _b = [a1, a5 - a1, a2, a6 - a2]
+        _bounds = [(0, None)]
+        result = linprog(_c, A_ub=_A, b_ub=_b, bounds=_bounds, method='highs')
+        return None if result.x is None else result.x[0]
+
+    def is_inside_canvas(point):
+        return 0 <= point[0] <= width and 0 <= point[1] <= height
+
+    def distance(p1, p2):
+        return math.sqrt((p1[0] - p2[0]) ** 2 + (p1[1] - p2[1]) ** 2)
+
+    def translate_point(point, vector, _k):
+        point[0] += vector[0] * _k
+        point[1] += vector[1] * _k
+        # fix accuracy error
+        tolerance = 8.0e-5
+        if math.fabs(point[0]) < tolerance:
+            point[0] = 0.0
+        elif math.fabs(point[0] - width) < tolerance:
+            point[0] = float(width)
+        if math.fabs(point[1]) < tolerance:
+            point[1] = 0.0
+        elif math.fabs(point[1] - height) < tolerance:
+            point[1] = float(height)
+
+    for _ in range(max_iter):
+        if all(is_inside_canvas(p) for p in point_list):
+            return True
+        for i in range(4):
+            if is_inside_canvas(point_list[i]):
+                continue
+
+            a = point_list[i]
+            pre_idx = i - 1
+            next_idx = (i + 1) % 4
+
+            if distance(a, point_list[pre_idx]) > distance(a, point_list[next_idx]):
+                b, c = point_list[pre_idx], point_list[next_idx]
+            else:
+                c, b = point_list[pre_idx], point_list[next_idx]
+
+            vector_ab = [b[0] - a[0], b[1] - a[1]]
+            k = cal_k(a[0], a[1], vector_ab[0], vector_ab[1], width, height)
+            if k is None:
+                return False
+            translate_point(a, vector_ab, k)
+            translate_point(c, vector_ab, k)
+    return all(is_inside_canvas(p) for p in point_list)
+
+
+def random_rectangles(rng, n, width, height):
+    """Rotated rectangles around the canvas, most of them crossing its border as rotated labels do."""
+    center = rng.uniform(-0.2, 1.2, (n, 2)) * [width, height]
+    size = rng.uniform(0.01, 0.5, (n, 2)) * min(width, height)
+    theta = rng.uniform(0, math.pi, n)
+    u = np.stack([np.cos(theta), np.sin(theta)], axis=-1) * size[:, :1] / 2
+    v = np.stack([-np.sin(theta), np.cos(theta)], axis=-1) * size[:, 1:] / 2
+    return np.stack([center - u - v, center + u - v, center + u + v, center - u + v], axis=1)
+
+
+def test_cal_k_matches_linprog():
+    rng = np.random.default_rng(0)
+    width, height = 640.0, 480.0
+    a = rng.uniform(-0.3, 1.3, (2000, 2)) * [width, height]
+    vector_ab = rng.normal(0, 200, (2000, 2))
+    vector_ab[::7, 0] = 0  # moving along one axis only
+    vector_ab[::11, 1] = 0
+    k, feasible = cal_k(a, vector_ab, width, height)
+    for i in range(len(a)):
+        result = linprog([1], A_ub=[[-vector_ab[i, 0]], [vector_ab[i, 0]], [-vector_ab[i, 1]], [vector_ab[i, 1]]],
+                         b_ub=[a[i, 0], width - a[i, 0], a[i, 1], height - a[i, 1]], bounds=[(0, None)], method='highs')
+        assert feasible[i] == (result.x is not None)
+        if feasible[i]:
+            assert k[i] == pytest.approx(result.x[0], rel=1e-9, abs=1e-9)
+
+
+@pytest.mark.parametrize("width, height", [(1.0, 1.0), (640.0, 480.0)])
+def test_clip_boxes_matches_linprog(width, height):
+    boxes = random_rectangles(np.random.default_rng(0), 1500, width, height)
+    expected_inside = np.zeros(len(boxes), dtype=bool)
+    expected = boxes.tolist()
+    for i, point_list in enumerate(expected):
+        expected_inside[i] = linprog_adjust_rectangle_coordinates(point_list, width, height)
+
+    clipped, inside = clip_boxes(boxes.copy(), width, height)
+
+    # both outcomes are covered
+    assert 0 < expected_inside.sum() < len(boxes)
+    np.testing.assert_array_equal(inside, expected_inside)
+    np.testing.assert_allclose(clipped[inside], np.array(expected)[inside], rtol=0, atol=1e-6 * max(width, height))
@@ -0,0 +1,52 @@
+import os
+import cv2
+import numpy as np
+import pytest
+
+from utils.dataset import AugmentedDataset
+from utils.labels import variant_names
+from utils.rotation import creat_dual_x
+
+NAMES = ["13353123230", "13353126430"]
+LABEL_LINE = "1 0.2000000 0.2000000 0.6000000 0.2000000 0.6000000 0.4000000 0.2000000 0.4000000\n"
+
+
+def make_dataset(root):
+    for split in ["train", "val"]:
+        for folder in ["images", "image", "labels"]:
+            os.makedirs(os.path.join(root, folder, split))
+        for i, name in enumerate(NAMES):
+            img = np.zeros((40, 60, 3), dtype=np.uint8)
+            img[:10, :20] = 50 * i + 10  # not symmetric, so every variant is a different image
+            cv2.imwrite(os.path.join(root, "images", split, name + ".png"), img)
+            cv2.imwrite(os.path.join(root, "image", split, name + ".png"), 255 - img)
+            with open(os.path.join(root, "labels", split, name + ".txt"), 'w') as f:
+                f.write(LABEL_LINE)
+
+
+@pytest.mark.parametrize("step", [90, 30])
+def test_samples_match_the_generated_files(tmp_path, step):
+    angle_list = list(range(0, 360, step))
+    src = str(tmp_path / "data")
+    make_dataset(src)
+    dataset = AugmentedDataset(src, "train", angle_list)
+    expected = [n[:-4] for name in NAMES for n in variant_names(name + ".png", angle_list)]
+    assert [sample["name"] for sample in dataset] == expected
+
+    # the images are the files creat_dual_x writes under the same names
+    creat_dual_x(step, src, str(tmp_path), "ag_dual_obb")
+    for sample in dataset:
+        for folder, img in zip(["images", "image"], sample["images"]):
+            written = cv2.imread(os.path.join(str(tmp_path), "ag_dual_obb", folder, "train", sample["name"] + ".png"))
+            np.testing.assert_array_equal(img, written)
+        assert sample["classes"].tolist() == [1]
+
+
+def test_missing_image_names_the_file(tmp_path):
+    src = str(tmp_path / "data")
+    make_dataset(src)
+    os.remove(os.path.join(src, "image", "train", NAMES[1] + ".png"))
+    dataset = AugmentedDataset(src, "train")
+    assert dataset[0]["name"] == variant_names(NAMES[0] + ".png", [0], "")[0]
+    with pytest.raises(FileNotFoundError, match=os.path.join("image", "train", NAMES[1] + ".png")):
+        dataset[len(dataset) - 1]
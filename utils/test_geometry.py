@@ -0,0 +1,84 @@
+import math
+import cv2
+import numpy as np
+
+from utils.geometry import clip_polygons, intersection_area, rotated_iou, visible_area, polygon_area
+
+
+def random_boxes(rng, n, spread=1.0):
+    """Rotated rectangles around the unit square, a third of them clockwise."""
+    center = rng.uniform(0.5 - spread / 2, 0.5 + spread / 2, (n, 2))
+    size = rng.uniform(0.05, 0.6, (n, 2))
+    theta = rng.uniform(0, math.pi, n)
+    u = np.stack([np.cos(theta), np.sin(theta)], axis=-1) * size[:, :1] / 2
+    v = np.stack([-np.sin(theta), np.cos(theta)], axis=-1) * size[:, 1:] / 2
+    boxes = np.stack([center - u - v, center + u - v, center + u + v, center - u + v], axis=1)
+    boxes[::3] = boxes[::3, ::-1]
+    return boxes
+
+
+def cv2_intersection_area(box1, box2):
+    area, _ = cv2.intersectConvexConvex(box1.astype(np.float32), box2.astype(np.float32))
+    return max(area, 0.0)
+
+
+def sutherland_hodgman(subject, clip):
+    """Textbook clipping of one polygon by one convex polygon of the same orientation, vertex by vertex."""
+    orientation = math.copysign(1.0, sum(p[0] * q[1] - q[0] * p[1] for p, q in zip(clip, np.roll(clip, -1, axis=0))))
+    points = [tuple(p) for p in subject]
+    for p, q in zip(clip, np.roll(clip, -1, axis=0)):
+        def side(a):
+            return orientation * ((q[0] - p[0]) * (a[1] - p[1]) - (q[1] - p[1]) * (a[0] - p[0]))
+
+        result = []
+        for i, cur in enumerate(points):
+            nxt = points[(i + 1) % len(points)]
+            if side(cur) >= 0:
+                result.append(cur)
+            if (side(cur) >= 0) != (side(nxt) >= 0):
+                t = side(cur) / (side(cur) - side(nxt))
+                result.append((cur[0] + t * (nxt[0] - cur[0]), cur[1] + t * (nxt[1] - cur[1])))
+        points = result
+        if not points:
+            break
+    return np.array(points).reshape(-1, 2)
+
+
+def test_clip_polygons_matches_sutherland_hodgman():
+    rng = np.random.default_rng(0)
+    subject = random_boxes(rng, 500)
+    clip = random_boxes(rng, 500)
+    points, count = clip_polygons(subject, clip)
+    for i in range(len(subject)):
+        expected = sutherland_hodgman(subject[i], clip[i])
+        assert count[i] == len(expected)
+        np.testing.assert_allclose(points[i, :count[i]], expected, rtol=0, atol=1e-12)
+        np.testing.assert_array_equal(points[i, count[i]:], np.broadcast_to(points[i, :1], points[i, count[i]:].shape))
+
+
+def test_intersection_area_matches_opencv():
+    rng = np.random.default_rng(1)
+    boxes1, boxes2 = random_boxes(rng, 2000), random_boxes(rng, 2000)
+    expected = np.array([cv2_intersection_area(b1, b2) for b1, b2 in zip(boxes1, boxes2)])
+    # both disjoint and overlapping pairs are covered
+    assert 0 < (expected > 0).sum() < len(expected)
+    np.testing.assert_allclose(intersection_area(boxes1, boxes2), expected, rtol=0, atol=1e-5)
+
+
+def test_visible_area_matches_opencv():
+    boxes = random_boxes(np.random.default_rng(2), 1000, spread=1.6) * [640, 480]
+    canvas = np.array([[0, 0], [640, 0], [640, 480], [0, 480]], dtype=np.float64)
+    expected = np.array([cv2_intersection_area(box, canvas) for box in boxes])
+    np.testing.assert_allclose(visible_area(boxes, 640, 480), expected, rtol=1e-5, atol=1e-2)
+
+
+def test_rotated_iou():
+    rng = np.random.default_rng(3)
+    boxes1, boxes2 = random_boxes(rng, 1000), random_boxes(rng, 1000)
+    inter = np.array([cv2_intersection_area(b1, b2) for b1, b2 in zip(boxes1, boxes2)])
+    expected = inter / (polygon_area(boxes1) + polygon_area(boxes2) - inter)
+    np.testing.assert_allclose(rotated_iou(boxes1, boxes2), expected, rtol=0, atol=1e-5)
+    # the same box, in either orientation, and a box far away
+    np.testing.assert_allclose(rotated_iou(boxes1, boxes1), 1.0)
+    np.testing.assert_allclose(rotated_iou(boxes1, boxes1[:, ::-1]), 1.0)
+    assert (rotated_iou(boxes1, boxes1 + 10) == 0).all()
@@ -0,0 +1,81 @@
+import os
+import shutil
+
+from utils.converter import modify_json_file, x_json_to_yolo_obb, x_json_to_yolo_rect
+from utils.labelme import convert_json_file, convert_json_folder
+from utils.jsonio import dumps, load_json
+
+SAMPLE = {
+    "version": "5.4.1",
+    "flags": {},
+    "shapes": [
+        {"label": "scratches", "points": [[120.5, 40.0], [310.0, 95.25], [290.0, 160.0], [101.0, 99.0], [98.0, 60.0]],
+         "group_id": None, "description": "", "shape_type": "polygon", "flags": {}},
+        {"label": "spot", "points": [[400.0, 300.0], [455.5, 351.0]],
+         "group_id": None, "description": "", "shape_type": "rectangle", "flags": {}},
+        # crosses the right and bottom edges, the box is clipped to the image
+        {"label": "crack", "points": [[600.0, 420.0], [660.0, 440.0], [650.0, 500.0], [590.0, 470.0]],
+         "group_id": None, "description": "", "shape_type": "polygon", "flags": {}},
+        {"label": "contusion", "points": [[10.0, 10.0], [50.0, 10.0], [50.0, 30.0], [10.0, 30.0]],
+         "group_id": None, "description": "", "shape_type": "rotation", "direction": 0.0, "flags": {}},
+    ],
+    "imagePath": "13353123230.png",
+    "imageData": None,
+    "imageHeight": 480,
+    "imageWidth": 640,
+}
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def old_conversion(json_path, tmp_path):
+    """The two passes convert_json_file replaces: modify_json_file then x_json_to_yolo_* on a copy of the json each."""
+    outputs = {}
+    for target_shape, convert, name in [("rotation", x_json_to_yolo_obb, "obb"),
+                                        ("rectangle", x_json_to_yolo_rect, "rect")]:
+        copy_path = os.path.join(tmp_path, f"old_{name}.json")
+        shutil.copyfile(json_path, copy_path)
+        modify_json_file(copy_path, target_shape)
+        convert(copy_path, os.path.join(tmp_path, f"old_{name}.txt"))
+        outputs[name] = read(os.path.join(tmp_path, f"old_{name}.txt"))
+        outputs[f"{name}_json"] = read(copy_path)
+    return outputs
+
+
+def test_convert_json_file_matches_the_old_conversion(tmp_path):
+    tmp_path = str(tmp_path)
+    json_path = os.path.join(tmp_path, "13353123230.json")
+    with open(json_path, 'wb') as f:
+        f.write(dumps(SAMPLE))
+    expected = old_conversion(json_path, tmp_path)
+
+    obb_path, rect_path = os.path.join(tmp_path, "obb.txt"), os.path.join(tmp_path, "rect.txt")
+    normalized_path = os.path.join(tmp_path, "normalized.json")
+    convert_json_file(json_path, obb_path, rect_path, normalized_path)
+
+    assert read(obb_path) == expected["obb"]
+    assert read(rect_path) == expected["rect"]
+    assert read(normalized_path) == expected["obb_json"]
+    assert len(read(obb_path).splitlines()) == len(SAMPLE["shapes"])
+
+
+def test_convert_json_folder_in_place(tmp_path):
+    src = str(tmp_path / "json")
+    os.makedirs(src)
+    json_path = os.path.join(src, "13353123230.json")
+    with open(json_path, 'wb') as f:
+        f.write(dumps(SAMPLE))
+    expected = old_conversion(json_path, str(tmp_path))
+
+    errors = convert_json_folder(src, str(tmp_path / "obb"), None, src)
+    assert errors == []
+    assert read(str(tmp_path / "obb" / "13353123230.txt")) == expected["obb"]
+    assert read(json_path) == expected["obb_json"]
+    # a second run finds every shape converted and leaves the file as it is
+    mtime = os.stat(json_path).st_mtime_ns
+    assert convert_json_folder(src, None, None, src) == []
+    assert os.stat(json_path).st_mtime_ns == mtime
+    assert load_json(json_path)["shapes"][0]["shape_type"] == "rotation"
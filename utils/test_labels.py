@@ -0,0 +1,41 @@
+import os
+import cv2
+import numpy as np
+import pytest
+
+from utils.labels import octal_obb_label, octal_rect_label, variant_names
+
+OBB_LINE = "0 0.2000000 0.2000000 0.6000000 0.2000000 0.6000000 0.4000000 0.2000000 0.4000000\n"
+RECT_LINE = "0 0.4000000 0.3000000 0.4000000 0.2000000\n"
+
+
+def make_split(root, names, line):
+    """An image folder with a png of every name and a label folder with a label of every name plus an orphan."""
+    image_folder, label_folder = os.path.join(root, "images"), os.path.join(root, "labels")
+    os.makedirs(image_folder)
+    os.makedirs(label_folder)
+    for name in names:
+        cv2.imwrite(os.path.join(image_folder, name + ".png"), np.zeros((40, 60, 3), dtype=np.uint8))
+    for name in names + ["13353199990"]:
+        with open(os.path.join(label_folder, name + ".txt"), 'w') as f:
+            f.write(line)
+    return image_folder, label_folder
+
+
+@pytest.mark.parametrize("octal_label, line", [(octal_obb_label, OBB_LINE), (octal_rect_label, RECT_LINE)],
+                         ids=["obb", "rect"])
+def test_orphan_label_is_skipped(tmp_path, octal_label, line):
+    names = ["13353123230", "13353126430"]
+    image_folder, label_folder = make_split(str(tmp_path), names, line)
+    dst = str(tmp_path / "out")
+    angle_list = [0, 30]
+
+    errors = octal_label(label_folder, dst, angle_list, 1, image_folder)
+
+    assert [task[0] for task, _ in errors] == [[os.path.join(label_folder, "13353199990.txt")]]
+    assert "FileNotFoundError" in errors[0][1]
+    expected = sorted(n for name in names for n in variant_names(name + ".txt", angle_list))
+    assert sorted(os.listdir(dst)) == expected
+    for filename in expected:
+        with open(os.path.join(dst, filename)) as f:
+            assert len(f.read().splitlines()) == 1
@@ -0,0 +1,94 @@
+import os
+import cv2
+import numpy as np
+
+from utils.instrument import collect
+from utils.rotation import creat_dual_x
+from utils.labels import variant_names
+
+NAMES = ["13353123230", "13353126430", "13353130330"]
+LABEL_LINE = "0 0.2000000 0.2000000 0.6000000 0.2000000 0.6000000 0.4000000 0.2000000 0.4000000\n"
+
+
+def write_image(path, value):
+    cv2.imwrite(path, np.full((40, 60, 3), value, dtype=np.uint8))
+
+
+def make_dataset(root):
+    """A dual dataset of NAMES in train and one sample in val, with forward, backward and label files."""
+    for split, names in [("train", NAMES), ("val", NAMES[:1])]:
+        for folder in ["images", "image", "labels"]:
+            os.makedirs(os.path.join(root, folder, split))
+        for i, name in enumerate(names):
+            write_image(os.path.join(root, "images", split, name + ".png"), 10 * i)
+            write_image(os.path.join(root, "image", split, name + ".png"), 10 * i + 5)
+            with open(os.path.join(root, "labels", split, name + ".txt"), 'w') as f:
+                f.write(LABEL_LINE)
+
+
+def generate(src, output_dir):
+    """An incremental paired creat_dual_x, returns its errors and counters."""
+    with collect() as stats:
+        errors = creat_dual_x(90, src, output_dir, "ag_dual_obb", workers=1, incremental=True, paired=True)
+    return errors, stats.snapshot()["counters"]
+
+
+def test_unchanged_sources_are_skipped(tmp_path):
+    src = str(tmp_path / "data")
+    make_dataset(src)
+    errors, counters = generate(src, str(tmp_path))
+    assert errors == []
+    assert counters["images_written"] == 2 * 8 * (len(NAMES) + 1)
+
+    errors, counters = generate(src, str(tmp_path))
+    assert errors == []
+    assert counters.get("images_written", 0) == 0
+    assert counters.get("label_files", 0) == 0
+    # the images and the label of every sample are separate entries
+    assert counters["files_unchanged"] == 2 * (len(NAMES) + 1)
+
+
+def test_edited_source_is_rebuilt(tmp_path):
+    src = str(tmp_path / "data")
+    make_dataset(src)
+    generate(src, str(tmp_path))
+    output = os.path.join(str(tmp_path), "ag_dual_obb", "image", "train", variant_names(NAMES[1] + ".png", [0])[0])
+    before = cv2.imread(output)
+
+    write_image(os.path.join(src, "image", "train", NAMES[1] + ".png"), 200)
+    errors, counters = generate(src, str(tmp_path))
+    assert errors == []
+    # both images of the edited pair, and its label with them
+    assert counters["images_written"] == 2 * 8
+    assert counters["label_files"] == 1
+    assert (cv2.imread(output) == 200).all() and not (before == 200).all()
+
+
+def test_deleted_image_of_a_pair_fails_that_sample(tmp_path):
+    src = str(tmp_path / "data")
+    make_dataset(src)
+    generate(src, str(tmp_path))
+    missing = os.path.join(src, "image", "train", NAMES[1] + ".png")
+    os.remove(missing)
+
+    errors, counters = generate(src, str(tmp_path))
+    assert [task[0] for task, _ in errors] == [[os.path.join(src, "images", "train", NAMES[1] + ".png"), missing]]
+    assert "missing image" in errors[0][1]
+    assert counters.get("images_written", 0) == 0
+    assert counters["files_unchanged"] == 2 * len(NAMES)
+
+
+def test_outputs_of_a_deleted_pair_are_removed(tmp_path):
+    src = str(tmp_path / "data")
+    make_dataset(src)
+    generate(src, str(tmp_path))
+    for folder, suffix in [("images", ".png"), ("image", ".png"), ("labels", ".txt")]:
+        os.remove(os.path.join(src, folder, "train", NAMES[2] + suffix))
+
+    errors, counters = generate(src, str(tmp_path))
+    assert errors == []
+    assert counters.get("images_written", 0) == 0
+    dataset = os.path.join(str(tmp_path), "ag_dual_obb")
+    for folder, suffix in [("images", ".png"), ("image", ".png"), ("labels", ".txt")]:
+        kept = sorted(n for name in NAMES[:2] for n in variant_names(name + suffix, [0, 90, 180, 270]))
+        assert sorted(os.listdir(os.path.join(dataset, folder, "train"))) == kept
@@ -0,0 +1,98 @@
+import os
+import threading
+
+from utils import pipeline as pipeline_module
+from utils.pipeline import Pipeline
+
+
+def make_sources(folder, n):
+    paths = []
+    for i in range(n):
+        paths.append(os.path.join(folder, f"{i:03d}.bin"))
+        with open(paths[-1], 'wb') as f:
+            f.write(bytes([i]) * (i + 1))
+    return paths
+
+
+def copy_twice(dst_folder):
+    """compute of a Pipeline writing the bytes of a task twice, as <name>.a and <name>.b in this order."""
+    def compute(task, data):
+        name = os.path.basename(task[0])
+        return [(os.path.join(dst_folder, name + suffix), data[0].tobytes()) for suffix in [".a", ".b"]]
+    return compute
+
+
+def recorded_writes(monkeypatch):
+    written = []
+    write_file = pipeline_module.write_file
+
+    def record(path, data):
+        written.append(os.path.basename(path))
+        write_file(path, data)
+
+    monkeypatch.setattr(pipeline_module, "write_file", record)
+    return written
+
+
+def test_single_thread_keeps_the_task_order(tmp_path, monkeypatch):
+    paths = make_sources(str(tmp_path), 20)
+    written = recorded_writes(monkeypatch)
+    errors = Pipeline(1, depth=2).run([(p,) for p in paths], lambda task: task[:1], copy_twice(str(tmp_path)))
+    assert errors == []
+    assert written == [os.path.basename(p) + suffix for p in paths for suffix in [".a", ".b"]]
+
+
+def test_threads_write_every_output_once(tmp_path, monkeypatch):
+    paths = make_sources(str(tmp_path), 50)
+    written = recorded_writes(monkeypatch)
+    errors = Pipeline(4, depth=3, memory_mb=0.0001).run([(p,) for p in paths], lambda task: task[:1],
+                                                        copy_twice(str(tmp_path)))
+    assert errors == []
+    assert sorted(written) == sorted(os.path.basename(p) + suffix for p in paths for suffix in [".a", ".b"])
+    # the outputs of a task are written in the order compute returned them
+    for p in paths:
+        name = os.path.basename(p)
+        assert written.index(name + ".a") < written.index(name + ".b")
+    for i, p in enumerate(paths):
+        with open(p + ".b", 'rb') as f:
+            assert f.read() == bytes([i]) * (i + 1)
+
+
+def test_errors_of_every_stage_are_returned(tmp_path):
+    paths = make_sources(str(tmp_path), 10)
+    tasks = [(p,) for p in paths]
+    copy = copy_twice(str(tmp_path))
+
+    def sources(task):
+        if task[0] == paths[1]:
+            raise OSError("cannot list")
+        return task[:1]
+
+    def compute(task, data):
+        if task[0] == paths[2]:
+            raise ValueError("cannot decode")
+        if task[0] == paths[3]:
+            return [(os.path.join(str(tmp_path), "missing", "out.a"), b"")]
+        return copy(task, data)
+
+    errors = Pipeline(3, depth=2).run(tasks, sources, compute)
+    messages = {task[0]: error for task, error in errors}
+    assert sorted(messages) == paths[1:4]
+    assert messages[paths[1]] == "OSError: cannot list"
+    assert messages[paths[2]] == "ValueError: cannot decode"
+    assert messages[paths[3]].startswith("FileNotFoundError")
+    # a failed task does not stop the others
+    for p in paths[:1] + paths[4:]:
+        assert os.path.exists(p + ".a") and os.path.exists(p + ".b")
+
+
+def test_threads_stop_when_every_task_fails(tmp_path):
+    paths = make_sources(str(tmp_path), 30)
+    before = set(threading.enumerate())
+
+    def compute(task, data):
+        raise RuntimeError("stage failed")
+
+    errors = Pipeline(4, depth=1).run([(p,) for p in paths], lambda task: task[:1], compute)
+    assert len(errors) == len(paths)
+    assert set(threading.enumerate()) == before
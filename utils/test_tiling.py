@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from utils.tiling import tile_windows, crop_obb_boxes, crop_rect_boxes, tile_labels, budget_workers
+from utils.utility import SettingsError
+
+
+def pixel_box(x0, y0, x1, y1, img_width, img_height):
+    """Normalized corners of an axis-aligned box given in pixels, clockwise from the top left."""
+    return np.array([[x0, y0], [x1, y0], [x1, y1], [x0, y1]], dtype=np.float64) / [img_width, img_height]
+
+
+def test_tile_windows_cover_the_image():
+    windows = tile_windows(250, 100, 100, 0.2)
+    assert windows == ((0, 0, 100, 100), (80, 0, 180, 100), (150, 0, 250, 100))
+
+
+def test_crop_obb_box_crossing_the_tile_edge():
+    # 200x100 image cut into two 100x100 tiles, a 40x20 box across the edge at x = 100
+    boxes = np.stack([pixel_box(80, 40, 120, 60, 200, 100), pixel_box(150, 10, 190, 30, 200, 100)])
+    left, keep = crop_obb_boxes(boxes.copy(), 200, 100, (0, 0, 100, 100))
+    np.testing.assert_array_equal(keep, [True, False])
+    np.testing.assert_allclose(left[0], pixel_box(80, 40, 100, 60, 100, 100), atol=1e-9)
+
+    right, keep = crop_obb_boxes(boxes.copy(), 200, 100, (100, 0, 200, 100))
+    np.testing.assert_array_equal(keep, [True, True])
+    np.testing.assert_allclose(right[0], pixel_box(0, 40, 20, 60, 100, 100), atol=1e-9)
+    np.testing.assert_allclose(right[1], pixel_box(50, 10, 90, 30, 100, 100), atol=1e-9)
+
+
+def test_crop_rotated_obb_box_stays_in_the_tile():
+    # a box rotated by 45 degrees centered on the tile corner at (100, 100) of a 200x200 image
+    center, half = np.array([100.0, 100.0]), 30.0
+    corners = center + half * np.array([[0, -1], [1, 0], [0, 1], [-1, 0]])
+    boxes = (corners / 200.0)[None]
+    for window in tile_windows(200, 200, 100, 0.0):
+        cropped, keep = crop_obb_boxes(boxes.copy(), 200, 200, window)
+        assert keep.all()
+        assert (cropped >= 0).all() and (cropped <= 1).all()
+
+
+def test_crop_rect_box_crossing_the_tile_edge():
+    rects = np.array([[100 / 200, 50 / 100, 40 / 200, 20 / 100]])
+    cropped, keep = crop_rect_boxes(rects, 200, 100, (0, 0, 100, 100))
+    assert keep.all()
+    np.testing.assert_allclose(cropped, [[0.9, 0.5, 0.2, 0.2]])
+    cropped, keep = crop_rect_boxes(rects, 200, 100, (150, 0, 250, 100))
+    assert not keep.any()
+
+
+def test_tile_labels_keeps_the_classes_of_the_boxes_kept():
+    boxes = np.stack([pixel_box(80, 40, 120, 60, 200, 100), pixel_box(150, 10, 190, 30, 200, 100)])
+    classes, values = tile_labels(["1", "3"], boxes.reshape(-1, 8), "obb", 200, 100, (0, 0, 100, 100))
+    assert classes == ["1"]
+    np.testing.assert_allclose(values, pixel_box(80, 40, 100, 60, 100, 100).reshape(1, 8), atol=1e-9)
+
+
+def test_budget_workers():
+    assert budget_workers(8, 2 ** 20, 3.5) == 3
+    assert budget_workers(2, 2 ** 20, 100) == 2
+    with pytest.raises(SettingsError, match="one sample needs 2 MB"):
+        budget_workers(8, 2 ** 21, 1)
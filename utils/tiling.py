@@ -0,0 +1,256 @@
+import os
+import cv2
+import hashlib
+import numpy as np
+from functools import lru_cache
+
+from utils.converter import clip_boxes, CLIP_TOLERANCE
+from utils.geometry import intersection_polygons, canvas_boxes, polygon_area
+from utils.rotation import write_variants
+from utils.labels import load_label, write_label, transform_label_points, variant_names, outside_canvas_mask, \
+    rotate_rect_boxes
+from utils.utility import gen_yaml, png_size, SettingsError
+from utils.parallel import run_tasks, resolve_workers
+from utils.encoding import ImageEncoder
+from utils.instrument import log, count, stage, reported
+
+
+@lru_cache(maxsize=None)
+def tile_windows(img_width, img_height, tile_size, overlap=0.2):
+    """
+    (x0, y0, x1, y1) pixel windows of tile_size covering an image, neighbours overlap by the overlap fraction.
+    The last column and row are moved back to end on the border, so every tile is full size,
+    a side shorter than tile_size is one window. Computed once per image size.
+    """
+    stride = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        return list(range(0, length - tile_size, stride)) + [length - tile_size]
+
+    return tuple((x, y, min(x + tile_size, img_width), min(y + tile_size, img_height))
+                 for y in starts(img_height) for x in starts(img_width))
+
+
+def tile_filename(filename, index):
+    """
+    Name of tile index of a source file, variant_names of it gives <stem>_<index>_<flip><angle>,
+    e.g. 13353123230.png -> 1335312323_004_0090.png
+    """
+    stem, suffix = os.path.splitext(filename)
+    return f"{stem[:-1]}_{index:03d}{stem[-1]}{suffix}"
+
+
+def crop_obb_boxes(boxes, img_width, img_height, window, box_filter=None):
+    """
+    Normalized (N, 4, 2) OBB boxes of an image -> normalized to the pixel window (x0, y0, x1, y1), clipped to it.
+    Returns the boxes and a mask of the ones with a part inside the window that box_filter, if any, keeps.
+    Boxes are clipped by clip_boxes like the rotated labels. The ones it cannot clip, such as boxes covering the
+    window or running along its border, become the minimum area rectangle of their part inside the window,
+    or its bounding box when that rectangle does not fit in the window.
+    """
+    x0, y0, x1, y1 = window
+    cropped = (boxes * [img_width, img_height] - [x0, y0]) / [x1 - x0, y1 - y0]
+    keep = np.ones(len(boxes), dtype=bool)
+    rows = np.flatnonzero(outside_canvas_mask(cropped, 1.0, 1.0))
+    polygons, num_points = intersection_polygons(cropped[rows], canvas_boxes(len(rows)))
+    visible = polygon_area(polygons, num_points) > 0
+    keep[rows[~visible]] = False
+    if box_filter is not None:
+        keep = box_filter.keep_mask(cropped, keep)
+    visible &= keep[rows]
+    rows, polygons, num_points = rows[visible], polygons[visible], num_points[visible]
+
+    cropped[rows], inside = clip_boxes(cropped[rows], 1.0, 1.0)
+    for i in np.flatnonzero(~inside):
+        polygon = polygons[i, :num_points[i]].astype(np.float32)
+        box = cv2.boxPoints(cv2.minAreaRect(polygon)).astype(np.float64)
+        if box.min() < -CLIP_TOLERANCE or box.max() > 1 + CLIP_TOLERANCE:
+            (bx0, by0), (bx1, by1) = polygon.min(axis=0), polygon.max(axis=0)
+            box = np.array([[bx0, by0], [bx1, by0], [bx1, by1], [bx0, by1]], dtype=np.float64)
+        cropped[rows[i]] = np.clip(box, 0.0, 1.0)
+    count("boxes_cropped", len(rows))
+    count("boxes_cropped_by_polygon", (~inside).sum())
+    return cropped, keep
+
+
+def crop_rect_boxes(rects, img_width, img_height, window):
+    """
+    Normalized (N, 4) xywh boxes of an image -> normalized to the pixel window (x0, y0, x1, y1), clipped to it.
+    Returns the boxes and a mask of the ones with a part inside the window.
+    """
+    x0, y0, x1, y1 = window
+    x, y, w, h = (rects * [img_width, img_height, img_width, img_height]).T
+    left = np.clip(x - w / 2, x0, x1)
+    right = np.clip(x + w / 2, x0, x1)
+    top = np.clip(y - h / 2, y0, y1)
+    bottom = np.clip(y + h / 2, y0, y1)
+    keep = (right > left) & (bottom > top)
+    cropped = np.stack([(left + right) / 2 - x0, (top + bottom) / 2 - y0, right - left, bottom - top], axis=-1)
+    return cropped / [x1 - x0, y1 - y0, x1 - x0, y1 - y0], keep
+
+
+def tile_labels(class_list, values, label_type, img_width, img_height, window, box_filter=None):
+    """The classes and values of the labels of an image that fall in a window, normalized to it."""
+    with stage("label_crop"):
+        if label_type == "obb":
+            cropped, keep = crop_obb_boxes(values.reshape(-1, 4, 2), img_width, img_height, window, box_filter)
+            cropped = cropped.reshape(-1, 8)
+        else:
+            cropped, keep = crop_rect_boxes(values, img_width, img_height, window)
+    return [c for c, k in zip(class_list, keep) if k], cropped[keep]
+
+
+def write_tile_labels(save_paths, class_list, values, label_type, angle_list, tile_width, tile_height):
+    """The labels of every variant of a tile."""
+    tile_sizes = np.tile([float(tile_width), float(tile_height)], (len(values), 1))
+    for save_path, (a, f) in zip(save_paths, ((a, f) for a in angle_list for f in [False, True])):
+        with stage("label_rotate"):
+            if label_type == "obb":
+                # the boxes are inside the tile and every variant holds the whole tile,
+                # anything outside [0, 1] is rounding and is not worth clip_boxes
+                points = transform_label_points(values.reshape(-1, 4, 2), a, f, tile_sizes)
+                rotated = np.clip(points, 0.0, 1.0).reshape(-1, 8)
+            else:
+                rotated = rotate_rect_boxes(values, a, f, tile_sizes)
+        with stage("label_write"):
+            write_label([save_path], class_list, rotated, [len(values)])
+        count("boxes", len(values))
+
+
+def sample_tile(name, ratio, seed=0):
+    """Whether a tile is kept when ratio of them are, the same name, ratio and seed always give the same answer."""
+    if ratio >= 1:
+        return True
+    if ratio <= 0:
+        return False
+    digest = hashlib.sha1(f"{seed}:{name}".encode()).digest()
+    return int.from_bytes(digest[:8], "big") / 2 ** 64 < ratio
+
+
+def tile_working_set(img_width, img_height, tile_size, angle_list, source_bytes=2):
+    """
+    Bytes held at once by one octal_tiles_file: the sources, source_bytes per pixel (2 gray planes to fuse,
+    6 for two BGR images), and per tile the tile, its flip, a rotated variant (up to twice the tile on the
+    expanded canvas of other angles) and the encoded file.
+    """
+    tile = min(tile_size, img_width) * min(tile_size, img_height) * 3
+    rotated = 2 if any(a % 90 for a in angle_list) else 1
+    return source_bytes * img_width * img_height + tile * (3 + rotated)
+
+
+def budget_workers(workers, task_bytes, memory_mb=None):
+    """
+    The number of workers whose tasks of task_bytes fit in memory_mb together,
+    raises a SettingsError when a single task does not fit.
+    """
+    workers = resolve_workers(workers)
+    if memory_mb is None:
+        return workers
+    budget = memory_mb * 2 ** 20
+    if task_bytes > budget:
+        raise SettingsError(f"one sample needs {task_bytes / 2 ** 20:.0f} MB, more than memory_mb = {memory_mb}")
+    return min(workers, int(budget // task_bytes))
+
+
+def octal_tiles_file(src_image_paths, src_label_path, dst_image_folder_paths, dst_label_folder_path, angle_list,
+                     img_size, windows, fusion=None, label_type="obb", empty_tile_ratio=1.0, seed=0, encoder=None,
+                     box_filter=None):
+    """
+    Cut a sample into windows and write the variants of every tile with its labels.
+    The source images are decoded whole (tile_working_set), with fusion the two src_image_paths are a
+    forward/backward pair decoded as gray planes and fused tile by tile into dst_image_folder_paths[0],
+    without it every source image is cut into the folder at the same position.
+    The labels are cropped first, so the empty tiles that are not sampled are never fused nor encoded.
+    """
+    img_width, img_height = img_size
+    num_values = 8 if label_type == "obb" else 4
+    with stage("label_read"):
+        if os.path.exists(src_label_path):
+            class_list, values, _ = load_label([src_label_path], num_values)
+        else:
+            class_list, values = [], np.zeros((0, num_values))
+
+    filename = os.path.basename(src_image_paths[0])
+    tiles = []
+    for index, window in enumerate(windows):
+        name = tile_filename(filename, index)
+        tile_classes, tile_values = tile_labels(class_list, values, label_type, img_width, img_height, window,
+                                                box_filter)
+        if len(tile_classes) == 0 and not sample_tile(name, empty_tile_ratio, seed):
+            count("tiles_empty_dropped")
+            continue
+        tiles.append((name, window, tile_classes, tile_values))
+    if not tiles:
+        return
+
+    with stage("decode"):
+        flags = cv2.IMREAD_GRAYSCALE if fusion is not None else cv2.IMREAD_COLOR
+        sources = [cv2.imread(p, flags) for p in src_image_paths]
+    if any(img is None or img.shape[:2] != (img_height, img_width) for img in sources):
+        raise ValueError(f"cannot tile {filename}: missing image or size mismatch")
+    count("images_read", len(sources))
+
+    for name, (x0, y0, x1, y1), tile_classes, tile_values in tiles:
+        if fusion is not None:
+            with stage("fuse"):
+                images = [fusion(sources[0][y0:y1, x0:x1], sources[1][y0:y1, x0:x1])]
+        else:
+            images = [img[y0:y1, x0:x1] for img in sources]
+        for img, dst_image_folder_path in zip(images, dst_image_folder_paths):
+            write_variants(img, name, dst_image_folder_path, angle_list, encoder)
+        del images
+        save_paths = [os.path.join(dst_label_folder_path, save_name)
+                      for save_name in variant_names(name, angle_list, ".txt")]
+        write_tile_labels(save_paths, tile_classes, tile_values, label_type, angle_list, x1 - x0, y1 - y0)
+    count("tiles", len(tiles))
+
+
+@reported
+def creat_tiled_x(rotate_angle_step, base_dataset_path, output_dir, new_dataset_name, fusion=None, tile_size=1024,
+                  overlap=0.2, workers=1, memory_mb=None, label_type="obb", label_folder="labels", encoder=None,
+                  box_filter=None, empty_tile_ratio=1.0, seed=0):
+    """
+    creat_single_x / creat_dual_x on tiles: every sample of base_dataset_path (a dual dataset such as data/)
+    is cut into tile_size windows overlapping by the overlap fraction, with its labels cropped and normalized to
+    every tile. Small defects get more pixels per training image and large frames are never fused nor encoded whole.
+    With fusion the pairs are fused tile by tile into images/, without it images/ and image/ are both tiled.
+    empty_tile_ratio is the fraction of the tiles without labels that are kept, picked from seed.
+    memory_mb caps the working set (tile_working_set) of all the workers together: fewer workers run when the
+    largest sample needs it, and a sample that does not fit alone is an error before anything is written.
+    The windows are computed once per image size from the png headers.
+    Returns the errors like creat_single_x.
+    """
+    angle_list = list(range(0, 360, rotate_angle_step))
+    new_dataset_path = os.path.join(output_dir, new_dataset_name)
+    log(f"Generating x{len(angle_list) * 2} tiled dataset...")
+    if encoder is None:
+        encoder = ImageEncoder()
+    image_folders = ["images"] if fusion is not None else ["images", "image"]
+
+    errors = []
+    for split in ["train", "val"]:
+        src_folders = [os.path.join(base_dataset_path, folder, split) for folder in ["images", "image"]]
+        dst_folders = [os.path.join(new_dataset_path, folder, split) for folder in image_folders]
+        dst_labels = os.path.join(new_dataset_path, "labels", split)
+        for folder_path in dst_folders + [dst_labels]:
+            if not os.path.exists(folder_path):
+                os.makedirs(folder_path)
+
+        filenames = sorted(f for f in os.listdir(src_folders[0]) if f.endswith("png"))
+        # the png headers give the windows and the working set of every sample without decoding it
+        sizes = [png_size(os.path.join(src_folders[0], f)) for f in filenames]
+        windows = {size: tile_windows(*size, tile_size, overlap) for size in set(sizes)}
+        source_bytes = 2 if fusion is not None else 6
+        task_bytes = max((tile_working_set(w, h, tile_size, angle_list, source_bytes) for w, h in windows),
+                         default=1)
+        tasks = [([os.path.join(folder, f) for folder in src_folders],
+                  os.path.join(base_dataset_path, label_folder, split, f[:-4] + ".txt"),
+                  dst_folders, dst_labels, angle_list, size, windows[size], fusion, label_type, empty_tile_ratio,
+                  seed, encoder, box_filter)
+                 for f, size in zip(filenames, sizes)]
+        errors += run_tasks(octal_tiles_file, tasks, budget_workers(workers, task_bytes, memory_mb), dst_folders[0])
+
+    gen_yaml(new_dataset_path, new_dataset_name)
+    return errors
@@ -1,5 +1,11 @@
 import os
 import shutil
+import struct
+
+from utils.instrument import log, count
+
+# class index -> name, shared by gen_yaml and the label converters
+CLASS_NAMES = ["contusion", "scratches", "crack", "spot"]
 
 
 def makedir(_dir, delete_if_exist=False):
@@ -11,27 +17,102 @@ def makedir(_dir, delete_if_exist=False):
         os.makedirs(_dir)
 
 
+class SettingsError(ValueError):
+    """Generation settings that cannot work together, raised before the files they concern are processed."""
+
+
+def reject_options(mode, options):
+    """Raise a SettingsError naming the options mode does not support that are set, options is {name: is set}."""
+    names = [name for name, is_set in options.items() if is_set]
+    if names:
+        raise SettingsError(f"{mode} does not support {', '.join(names)}")
+
+
 def copy_file(_src, _dst, log_level=2):
     if os.path.exists(_src):
         shutil.copyfile(_src, _dst)
         if log_level > 1:
-            print(f"copy: {_src} -> {_dst}")
+            log(f"copy: {_src} -> {_dst}", 2)
     else:
         if log_level > 0:
-            print(f"source file not found: {_src}")
+            log(f"source file not found: {_src}", 0)
 
 
-def copy_folder(_src, _dst, log_level=2):
-    if os.path.exists(_src):
+def copy_folder(_src, _dst, log_level=2, pipeline=None):
+    """
+    With pipeline, a utils.pipeline.Pipeline, the files are read ahead and written behind on its threads
+    instead of one after the other by shutil.copytree. The copies then do not keep the mtime of their source.
+    Like shutil.copytree, it raises when files could not be copied, after copying all the others.
+    """
+    if os.path.exists(_src) and pipeline is not None:
+        tasks = []
+        for root, dirs, files in os.walk(_src):
+            dst_root = os.path.join(_dst, os.path.relpath(root, _src))
+            makedir(dst_root)
+            tasks += [(os.path.join(root, name), os.path.join(dst_root, name)) for name in sorted(files)]
+        errors = pipeline.run(tasks, lambda task: task[:1], lambda task, data: [(task[1], data[0])], _dst)
+        if errors:
+            raise OSError(f"cannot copy {len(errors)} files of {_src}")
+        if log_level > 1:
+            log(f"copy: {_src} -> {_dst}")
+    elif os.path.exists(_src):
         shutil.copytree(_src, _dst)
         if log_level > 1:
-            print(f"copy: {_src} -> {_dst}")
+            log(f"copy: {_src} -> {_dst}")
     else:
         if log_level > 0:
-            print(f"source file not found: {_src}")
+            log(f"source file not found: {_src}", 0)
+
+
+def sync_folder(_src, _dst, log_level=2):
+    """
+    Make _dst a copy of _src like copy_folder, but only copy the files whose size or mtime changed
+    and delete the ones that are not in _src any more. Copies keep the mtime of their source.
+    """
+    if not os.path.exists(_src):
+        if log_level > 0:
+            log(f"source file not found: {_src}", 0)
+        return
+    copied, removed = 0, 0
+    for root, dirs, files in os.walk(_src):
+        dst_root = os.path.join(_dst, os.path.relpath(root, _src))
+        makedir(dst_root)
+        for name in files:
+            src_path, dst_path = os.path.join(root, name), os.path.join(dst_root, name)
+            src_stat = os.stat(src_path)
+            if os.path.exists(dst_path):
+                dst_stat = os.stat(dst_path)
+                if dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime_ns == src_stat.st_mtime_ns:
+                    continue
+            shutil.copy2(src_path, dst_path)
+            copied += 1
+    for root, dirs, files in os.walk(_dst, topdown=False):
+        src_root = os.path.join(_src, os.path.relpath(root, _dst))
+        for name in files:
+            if not os.path.exists(os.path.join(src_root, name)):
+                os.remove(os.path.join(root, name))
+                removed += 1
+        if not os.path.exists(src_root):
+            os.rmdir(root)
+    count("files_copied", copied)
+    count("files_removed", removed)
+    if log_level > 1:
+        log(f"sync: {_src} -> {_dst} ({copied} copied, {removed} removed)")
+
+
+def png_size(png_path):
+    """Read (width, height) from the PNG header without decoding the image."""
+    with open(png_path, 'rb') as f:
+        header = f.read(24)
+    if header[:8] != b'\x89PNG\r\n\x1a\n' or header[12:16] != b'IHDR':
+        raise ValueError(f"not a png file: {png_path}")
+    return struct.unpack('>II', header[16:24])
 
 
-def gen_yaml(output_folder_path, dataset_name):
+def gen_yaml(output_folder_path, dataset_name, class_names=None):
+    if class_names is None:
+        class_names = CLASS_NAMES
+    names = "".join(f"  {i}: {name}\n" for i, name in enumerate(class_names))
     s = f"""\
 # parent
 # ├── ultralytics
@@ -46,10 +127,6 @@ val: images/val # val images (relative to 'path')
 
 # Classes
 names:
-  0: contusion
-  1: scratches
-  2: crack
-  3: spot
-"""
+{names}"""
     with open(os.path.join(output_folder_path, dataset_name + ".yaml"), "w", encoding='utf-8') as f:
         f.write(s)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+from utils.index import build_index
+from utils.instrument import set_verbosity, tracing, profile
+
+
+def validate_dataset(dataset_path, workers=0, index_path=None):
+    """Check a dataset and write its index, returns the exit status."""
+    if not os.path.exists(dataset_path):
+        print(f"Error: The dataset folder does not exist at {dataset_path}")
+        return 1
+    index = build_index(dataset_path, workers, index_path=index_path)
+    # a non-zero exit status lets a job stop before generating from a broken dataset
+    return 1 if index["problems"] else 0
+
+
+if __name__ == "__main__":
+    dataset_name = "data"  # data/ or a generated dataset such as "ag_dual_obb"
+    workers = 0  # worker processes, 0 for one per cpu core, 1 for serial
+    verbosity = 1  # 0 problems only, 1 progress and summaries, 2 every file
+    trace_path = None  # write a JSON-lines trace of the tasks and stage times, e.g. "trace.jsonl"
+    profile_path = None  # run under cProfile and save the stats, e.g. "validate.prof"
+
+    set_verbosity(verbosity)
+    dataset_path = os.path.join(os.getcwd(), dataset_name)
+
+    with tracing(trace_path), profile(profile_path):
+        status = validate_dataset(dataset_path, workers)
+    sys.exit(status)